@@ -0,0 +1,104 @@
+import os
+import sys
+from collections import OrderedDict
+
+# Inference backends applied when the registry loads a model. A backend
+# name is a precision, optionally followed by '+compiled':
+#   fp32  - weights as stored, eager mode
+#   bf16  - weights loaded as bfloat16 (needs AVX512-BF16/AMX on x86 CPUs)
+#   int8  - dynamic int8 quantization of all Linear layers (CPU only)
+#   +compiled - static KV cache and a torch.compile'd forward, so every
+#               decode step runs the same compiled graph
+
+PRECISIONS = OrderedDict([
+    ('fp32', "FP32"),
+    ('bf16', "BF16"),
+    ('int8', "INT8 (dynamic quantization)"),
+])
+DEFAULT_BACKEND = 'fp32'
+COMPILED_SUFFIX = '+compiled'
+
+
+def backend_name(precision, compiled=False):
+    return precision + (COMPILED_SUFFIX if compiled else '')
+
+
+def parse_backend(backend):
+    backend = backend or DEFAULT_BACKEND
+    compiled = backend.endswith(COMPILED_SUFFIX)
+    precision = backend[:-len(COMPILED_SUFFIX)] if compiled else backend
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown inference backend: {backend}")
+    return precision, compiled
+
+
+def cpu_supports_bf16():
+    if sys.platform == 'darwin':
+        return os.uname().machine == 'arm64'
+    try:
+        with open('/proc/cpuinfo', 'r') as file:
+            flags = file.read()
+    except OSError:
+        return False
+    return 'avx512_bf16' in flags or 'amx_bf16' in flags
+
+
+def supports_precision(precision, device):
+    if precision == 'int8':
+        return device == 'cpu'
+    if precision == 'bf16':
+        if device == 'cpu':
+            return cpu_supports_bf16()
+        if device.startswith('cuda'):
+            import torch
+
+            return torch.cuda.is_bf16_supported()
+        return True
+    return True
+
+
+def configure_threads(intra_op_threads=0, inter_op_threads=0):
+    # 0 keeps torch's default. Threads are process-wide; inter-op threads can
+    # only be set before torch starts its first parallel region.
+    import torch
+
+    if intra_op_threads > 0:
+        torch.set_num_threads(intra_op_threads)
+    if inter_op_threads > 0:
+        try:
+            torch.set_num_interop_threads(inter_op_threads)
+        except RuntimeError:
+            pass
+
+
+def load_kwargs(backend):
+    import torch
+
+    precision, _ = parse_backend(backend)
+    if precision == 'bf16':
+        return {'dtype': torch.bfloat16}
+    return {}
+
+
+def prepare(model, backend, device):
+    precision, compiled = parse_backend(backend)
+    if not supports_precision(precision, device):
+        raise ValueError(f"The {PRECISIONS[precision]} backend is not supported on {device}")
+
+    import torch
+
+    if precision == 'int8':
+        from torch.ao.quantization import quantize_dynamic
+
+        model = quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+    if compiled:
+        model.generation_config.cache_implementation = 'static'
+        # Compiled explicitly below; keep generate from compiling on top.
+        model.generation_config.disable_compile = True
+        model.forward = torch.compile(model.forward, dynamic=False, fullgraph=False)
+    return model
+
+
+def is_compiled(model):
+    return getattr(model.generation_config, 'cache_implementation', None) == 'static'
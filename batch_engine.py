@@ -0,0 +1,115 @@
+import os
+
+from generation import build_prompt, generate_batch
+from stopping import Cancelled
+
+
+class BatchEngine:
+    # Converts many HTML documents with padded, batched generate calls.
+    # Documents are tokenized up front, sorted into length buckets of
+    # bucket_width prompt tokens, and each bucket is split into batches of at
+    # most batch_size documents whose padded size (prompt + max_new_tokens)
+    # stays within token_budget. Rows that stop early (see stopping.py) are
+    # recorded in stops by key. cancelled, if given, is polled every decode
+    # step and aborts the run with stopping.Cancelled.
+
+    def __init__(self, tokenizer, model, device, params, batch_size=8, token_budget=32768, bucket_width=256,
+                 cancelled=None):
+        self.tokenizer = tokenizer
+        self.model = model
+        self.device = device
+        self.params = params
+        self.batch_size = max(1, batch_size)
+        self.token_budget = token_budget
+        self.bucket_width = max(1, bucket_width)
+        self.cancelled = cancelled
+        self.documents = {}
+        self.stops = {}
+
+    def tokenize(self, html_content):
+        return self.tokenizer.encode(build_prompt(html_content))
+
+    def planBatches(self, items):
+        # items are (key, prompt_ids) pairs; returns lists of them, shortest
+        # prompts first.
+        max_new_tokens = self.params['max_new_tokens']
+        buckets = {}
+        for item in items:
+            buckets.setdefault(len(item[1]) // self.bucket_width, []).append(item)
+
+        batches = []
+        for bucket_id in sorted(buckets):
+            batch = []
+            width = 0
+            for item in sorted(buckets[bucket_id], key=lambda entry: len(entry[1])):
+                new_width = max(width, len(item[1]))
+                padded_tokens = (len(batch) + 1) * (new_width + max_new_tokens)
+                if batch and (len(batch) >= self.batch_size or padded_tokens > self.token_budget):
+                    batches.append(batch)
+                    batch = []
+                    new_width = len(item[1])
+                batch.append(item)
+                width = new_width
+            if batch:
+                batches.append(batch)
+        return batches
+
+    def convertBatch(self, batch):
+        stops = []
+        results = generate_batch(self.tokenizer, self.model, [ids for _, ids in batch], self.device, self.params,
+                                 documents=[self.documents.get(key) for key, _ in batch], stops=stops,
+                                 cancelled=self.cancelled)
+        for (key, _), result in zip(batch, stops):
+            if result is not None and result['reason']:
+                self.stops[key] = result
+        return results
+
+    def run(self, items, on_result, on_error=None, should_stop=None):
+        # items are (key, html_content) pairs. on_result(key, markdown) is
+        # called as soon as the batch containing key finishes.
+        tokenized = []
+        for key, html_content in items:
+            try:
+                tokenized.append((key, self.tokenize(html_content)))
+                self.documents[key] = html_content
+            except Exception as e:
+                if on_error is None:
+                    raise
+                on_error(key, e)
+
+        for batch in self.planBatches(tokenized):
+            if should_stop is not None and should_stop():
+                break
+            try:
+                results = self.convertBatch(batch)
+            except Cancelled:
+                raise
+            except Exception as e:
+                if on_error is None:
+                    raise
+                for key, _ in batch:
+                    on_error(key, e)
+                continue
+            for (key, _), markdown_output in zip(batch, results):
+                on_result(key, markdown_output)
+
+
+def list_html_files(directory):
+    return sorted(
+        os.path.join(directory, filename)
+        for filename in os.listdir(directory)
+        if filename.endswith(".html")
+    )
+
+
+def read_html_files(paths):
+    for path in paths:
+        with open(path, 'r', encoding='utf-8') as file:
+            yield path, file.read()
+
+
+def write_markdown_next_to(path, markdown_content):
+    output_path = os.path.splitext(path)[0] + '.md'
+    with open(output_path, 'w', encoding='utf-8') as file:
+        file.write(markdown_content)
+    return output_path
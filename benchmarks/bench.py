@@ -0,0 +1,251 @@
+import argparse
+import glob
+import json
+import os
+import platform
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backends import DEFAULT_BACKEND  # noqa: E402
+from converter import DEFAULT_PARAMS, MODELS  # noqa: E402
+from generation import MarkdownStreamer, generate_markdown  # noqa: E402
+from html_reduction import reduce_html  # noqa: E402
+from instrumentation import peak_rss_mb  # noqa: E402
+from model_registry import registry  # noqa: E402
+from tiny_model import FIXTURES_DIR, build_tiny_model  # noqa: E402
+
+STAGES = ('clean', 'tokenize', 'prefill', 'decode', 'postprocess', 'total')
+TINY_MODEL = 'tiny'
+
+MATRICES = {
+    'quick': [
+        {'max_new_tokens': 64, 'do_sample': False},
+    ],
+    'default': [
+        {'max_new_tokens': 256, 'do_sample': False},
+        {'max_new_tokens': 256, 'do_sample': True, 'temperature': 0.7, 'top_p': 0.95, 'repetition_penalty': 1.1},
+        {'max_new_tokens': 256, 'do_sample': False, 'draft_tokens': 10, 'ngram_size': 3},
+    ],
+    'full': [
+        {'max_new_tokens': max_new_tokens, 'do_sample': do_sample, 'draft_tokens': draft_tokens}
+        for max_new_tokens in (128, 512, 1024)
+        for do_sample in (False, True)
+        for draft_tokens in (0, 10)
+        if not (do_sample and draft_tokens)
+    ],
+}
+
+
+def percentile(values, fraction):
+    # Nearest-rank percentile; good enough for a handful of repetitions.
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(fraction * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def summarize(values):
+    return {'p50': percentile(values, 0.50), 'p95': percentile(values, 0.95), 'runs': len(values)}
+
+
+def load_fixtures(names=None):
+    fixtures = {}
+    for path in sorted(glob.glob(os.path.join(FIXTURES_DIR, '*.html'))):
+        name = os.path.splitext(os.path.basename(path))[0]
+        if names and name not in names:
+            continue
+        with open(path, 'r', encoding='utf-8') as file:
+            fixtures[name] = file.read()
+    return fixtures
+
+
+def measure_load(model_path, device, backend):
+    # The first load may download weights, so it is done once untimed and
+    # then repeated from the local cache.
+    registry.get(model_path, device, backend=backend)
+    registry.unload(model_path, device, backend=backend)
+    start = time.perf_counter()
+    registry.get(model_path, device, backend=backend)
+    return time.perf_counter() - start
+
+
+def run_once(tokenizer, model, html_content, device, params):
+    # One conversion through generation.generate_markdown, the converter's
+    # own generate path (early stopping and drafting included). The stages
+    # inside it are split at the streamer's timestamps: 'tokenize' runs up
+    # to the prompt reaching the model, 'postprocess' from the last token
+    # to the returned Markdown.
+    timings = {}
+    start = time.perf_counter()
+
+    html_content, _ = reduce_html(html_content)
+    timings['clean'] = time.perf_counter() - start
+
+    mark = time.perf_counter()
+    streamer = MarkdownStreamer(tokenizer, params['max_new_tokens'])
+    stats = {}
+    generate_markdown(tokenizer, model, html_content, device, params, streamer=streamer, stats=stats)
+    end = time.perf_counter()
+    if streamer.decode_start is not None:
+        prefill_start = streamer.decode_start - streamer.prefill_seconds
+        timings['tokenize'] = prefill_start - mark
+        timings['prefill'] = streamer.prefill_seconds
+        timings['decode'] = streamer.decode_end - streamer.decode_start
+        timings['postprocess'] = end - streamer.decode_end
+    else:
+        timings.update(tokenize=end - mark, prefill=0.0, decode=0.0, postprocess=0.0)
+    timings['total'] = end - start
+    return timings, stats['prompt_tokens'], stats['generated_tokens']
+
+
+def benchmark(models, fixtures, matrix, device, backend, repeat, warmup, log):
+    results = []
+    for model_name in models:
+        model_path = build_tiny_model() if model_name == TINY_MODEL else MODELS.get(model_name, model_name)
+        load_seconds = measure_load(model_path, device, backend)
+        tokenizer, model = registry.get(model_path, device, backend=backend)
+        log(f"{model_name}: loaded in {load_seconds:.2f}s")
+
+        for overrides in matrix:
+            params = dict(DEFAULT_PARAMS, **overrides)
+            for fixture_name, html_content in fixtures.items():
+                for _ in range(warmup):
+                    run_once(tokenizer, model, html_content, device, params)
+
+                samples = {stage: [] for stage in STAGES}
+                decode_rates = []
+                for _ in range(repeat):
+                    timings, prompt_tokens, generated = run_once(tokenizer, model, html_content, device, params)
+                    for stage in STAGES:
+                        samples[stage].append(timings[stage])
+                    if timings['decode'] > 0:
+                        decode_rates.append(max(0, generated - 1) / timings['decode'])
+
+                result = {
+                    'model': model_name,
+                    'backend': backend,
+                    'device': device,
+                    'fixture': fixture_name,
+                    'params': overrides,
+                    'prompt_tokens': prompt_tokens,
+                    'generated_tokens': generated,
+                    'stages': {stage: summarize(values) for stage, values in samples.items()},
+                    'decode_tokens_per_second': summarize(decode_rates) if decode_rates else None,
+                    'load_seconds': load_seconds,
+                }
+                results.append(result)
+                log(f"  {fixture_name:<8} {json.dumps(overrides, sort_keys=True):<70} "
+                    f"total p50 {result['stages']['total']['p50']:.3f}s")
+        registry.unload(model_path)
+    return results
+
+
+def result_key(result):
+    return (result['model'], result['backend'], result['device'], result['fixture'],
+            json.dumps(result['params'], sort_keys=True))
+
+
+def compare(results, baseline, threshold):
+    # Returns (rows, regressions): p50 latencies that grew, or decode rates
+    # that dropped, by more than threshold (a fraction) against baseline.
+    previous = {result_key(result): result for result in baseline['results']}
+    rows = []
+    regressions = []
+    for result in results:
+        old = previous.get(result_key(result))
+        if old is None:
+            continue
+        metrics = [(f"{stage} p50", result['stages'][stage]['p50'], old['stages'][stage]['p50'], False)
+                   for stage in STAGES]
+        metrics.append(("load", result['load_seconds'], old['load_seconds'], False))
+        if result['decode_tokens_per_second'] and old.get('decode_tokens_per_second'):
+            metrics.append(("decode tok/s p50", result['decode_tokens_per_second']['p50'],
+                            old['decode_tokens_per_second']['p50'], True))
+        for name, new_value, old_value, higher_is_better in metrics:
+            if not old_value:
+                continue
+            change = (new_value - old_value) / old_value
+            regressed = -change > threshold if higher_is_better else change > threshold
+            row = {'key': list(result_key(result)), 'metric': name, 'baseline': old_value, 'current': new_value,
+                   'change': change, 'regressed': regressed}
+            rows.append(row)
+            if regressed:
+                regressions.append(row)
+    return rows, regressions
+
+
+def environment():
+    info = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+    }
+    try:
+        import torch
+        import transformers
+
+        info['torch'] = torch.__version__
+        info['transformers'] = transformers.__version__
+        info['torch_threads'] = torch.get_num_threads()
+    except ImportError:
+        pass
+    return info
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Benchmark the HTML to Markdown conversion pipeline.")
+    parser.add_argument('--models', default=','.join(MODELS),
+                        help=f"comma-separated model names or paths (default: {','.join(MODELS)})")
+    parser.add_argument('--tiny', action='store_true',
+                        help="benchmark a tiny randomly initialised model instead (works offline)")
+    parser.add_argument('--fixtures', help="comma-separated fixture names (default: all)")
+    parser.add_argument('--matrix', choices=list(MATRICES), default='default', help="generation parameter matrix")
+    parser.add_argument('--device', default='cpu')
+    parser.add_argument('--backend', default=DEFAULT_BACKEND, help="inference backend, e.g. fp32, int8, bf16+compiled")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--warmup', type=int, default=1)
+    parser.add_argument('-o', '--output', help="write the JSON report here instead of stdout")
+    parser.add_argument('--baseline', help="compare against a previously saved JSON report")
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help="relative change counted as a regression (default: 0.10)")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    models = [TINY_MODEL] if args.tiny else args.models.split(',')
+    fixtures = load_fixtures(args.fixtures.split(',') if args.fixtures else None)
+    if not fixtures:
+        print("No fixtures selected.", file=sys.stderr)
+        return 2
+
+    log = lambda message: print(message, file=sys.stderr)
+    results = benchmark(models, fixtures, MATRICES[args.matrix], args.device, args.backend,
+                        args.repeat, args.warmup, log)
+    # ru_maxrss only grows, so the peak is reported once for the whole run.
+    report = {'environment': environment(), 'matrix': args.matrix, 'peak_rss_mb': peak_rss_mb(), 'results': results}
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as file:
+            rows, regressions = compare(results, json.load(file), args.threshold)
+        report['comparison'] = {'baseline': args.baseline, 'threshold': args.threshold, 'rows': rows,
+                                'regressions': len(regressions)}
+        for row in regressions:
+            log(f"REGRESSION {' / '.join(row['key'][:4])} {row['metric']}: "
+                f"{row['baseline']:.4f} -> {row['current']:.4f} ({100 * row['change']:+.1f}%)")
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            file.write(output)
+    else:
+        print(output)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,51 @@
+import glob
+import os
+import tempfile
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+TINY_MODEL_DIR = os.path.join(tempfile.gettempdir(), 'html-to-md-tiny-model')
+
+
+def build_tiny_model(path=TINY_MODEL_DIR, vocab_size=2048, seed=0):
+    # A randomly initialised Qwen2 model (the Reader-LM architecture) with a
+    # byte-level BPE tokenizer trained on the fixtures, so the benchmark can
+    # exercise every stage without downloading weights. Its output is noise;
+    # only timings are meaningful.
+    if os.path.exists(os.path.join(path, 'config.json')):
+        return path
+
+    import torch
+    from tokenizers import Tokenizer, decoders, models, pre_tokenizers, trainers
+    from transformers import PreTrainedTokenizerFast, Qwen2Config, Qwen2ForCausalLM
+
+    corpus = []
+    for fixture in sorted(glob.glob(os.path.join(FIXTURES_DIR, '*.html'))):
+        with open(fixture, 'r', encoding='utf-8') as file:
+            corpus.append(file.read())
+
+    tokenizer = Tokenizer(models.BPE())
+    tokenizer.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    tokenizer.decoder = decoders.ByteLevel()
+    trainer = trainers.BpeTrainer(vocab_size=vocab_size, special_tokens=["<|endoftext|>"],
+                                  initial_alphabet=pre_tokenizers.ByteLevel.alphabet())
+    tokenizer.train_from_iterator(corpus, trainer)
+    tokenizer = PreTrainedTokenizerFast(tokenizer_object=tokenizer, eos_token="<|endoftext|>")
+
+    torch.manual_seed(seed)
+    config = Qwen2Config(
+        vocab_size=len(tokenizer),
+        hidden_size=128,
+        intermediate_size=384,
+        num_hidden_layers=4,
+        num_attention_heads=4,
+        num_key_value_heads=2,
+        max_position_embeddings=32768,
+        eos_token_id=tokenizer.eos_token_id,
+        bos_token_id=tokenizer.eos_token_id,
+    )
+    model = Qwen2ForCausalLM(config)
+
+    os.makedirs(path, exist_ok=True)
+    tokenizer.save_pretrained(path)
+    model.save_pretrained(path)
+    return path
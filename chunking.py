@@ -0,0 +1,299 @@
+import copy
+import html
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+import lxml.html
+from lxml import etree
+
+from batch_engine import BatchEngine
+from fast_path import table_rows
+from generation import build_prompt
+from stopping import merge_results
+
+HEADING_TAGS = ('h1', 'h2', 'h3', 'h4', 'h5', 'h6')
+CONTAINER_TAGS = ('html', 'body', 'div', 'section', 'article', 'main', 'header', 'span', 'center', 'font', 'form')
+LIST_TAGS = ('ul', 'ol')
+
+MARKDOWN_HEADING = re.compile(r'^(#{1,6})(\s+\S.*)$', re.M)
+ORDERED_ITEM = re.compile(r'^(\d+)([.)]\s)')
+CODE_FENCE = re.compile(r'^ {0,3}(`{3,}|~{3,})')
+
+
+class Chunk:
+    # One model-sized piece of a document. headings lists the source heading
+    # levels in order, list_start is set when the chunk opens with the
+    # continuation of an ordered list split across chunks.
+
+    def __init__(self, blocks, tokens):
+        self.blocks = blocks
+        self.tokens = tokens
+        self.list_start = None
+
+    @property
+    def html(self):
+        return "\n".join(block_html for block_html, _ in self.blocks)
+
+    @property
+    def headings(self):
+        levels = []
+        for _, element in self.blocks:
+            if element is None:
+                continue
+            if isinstance(element.tag, str) and element.tag in HEADING_TAGS:
+                levels.append(int(element.tag[1]))
+            levels.extend(int(heading.tag[1]) for heading in element.iterdescendants(*HEADING_TAGS))
+        return levels
+
+
+def _outer_html(element):
+    return lxml.html.tostring(element, encoding='unicode', with_tail=False)
+
+
+def _split_list(element, budget, count_tokens):
+    # Splits an oversized <ul>/<ol> into several lists of whole items. Parts
+    # after the first carry start= so numbering continues.
+    parts = []
+    start = int(element.get('start', '1') or 1) if element.tag == 'ol' else None
+    current = []
+    current_tokens = 0
+    index = 0
+
+    def flush():
+        part = etree.Element(element.tag)
+        offset = index - len(current)
+        if start is not None and (offset or start != 1):
+            part.set('start', str(start + offset))
+        for item in current:
+            part.append(copy.deepcopy(item))
+        parts.append(part)
+
+    for item in element:
+        item_tokens = count_tokens(_outer_html(item))
+        if current and current_tokens + item_tokens > budget:
+            flush()
+            current = []
+            current_tokens = 0
+        current.append(item)
+        current_tokens += item_tokens
+        index += 1
+    if current:
+        flush()
+    return parts
+
+
+def _split_table(element, budget, count_tokens):
+    # Splits an oversized table by rows, repeating the header row in every part.
+    rows = table_rows(element)
+    if len(rows) < 2:
+        return [element]
+    header = rows[0] if rows[0].find('th') is not None else None
+    body_rows = rows[1:] if header is not None else rows
+    header_tokens = count_tokens(_outer_html(header)) if header is not None else 0
+
+    parts = []
+    current = []
+    current_tokens = header_tokens
+
+    def flush():
+        part = etree.Element('table')
+        if header is not None:
+            part.append(copy.deepcopy(header))
+        for row in current:
+            part.append(copy.deepcopy(row))
+        parts.append(part)
+
+    for row in body_rows:
+        row_tokens = count_tokens(_outer_html(row))
+        if current and current_tokens + row_tokens > budget:
+            flush()
+            current = []
+            current_tokens = header_tokens
+        current.append(row)
+        current_tokens += row_tokens
+    if current:
+        flush()
+    return parts
+
+
+class DocumentChunker:
+    # Splits HTML at block boundaries into chunks of at most token_budget
+    # tokens. Containers (div, section, article, ...) are descended into
+    # until their blocks fit; oversized lists and tables are split by items
+    # and rows. New chunks preferably start at headings.
+
+    def __init__(self, count_tokens, token_budget=1024):
+        self.count_tokens = count_tokens
+        self.token_budget = token_budget
+
+    def blocks(self, html_content):
+        try:
+            root = lxml.html.document_fromstring(html_content)
+        except etree.ParserError:
+            return []
+        body = root.find('body')
+        return list(self._walk(body if body is not None else root))
+
+    def _walk(self, element):
+        if element.text and element.text.strip():
+            yield self._text(element.text)
+        for child in element:
+            if isinstance(child.tag, str):
+                yield from self._block(child)
+            if child.tail and child.tail.strip():
+                yield self._text(child.tail)
+
+    def _text(self, text):
+        text = html.escape(text.strip(), quote=False)
+        return text, None, self.count_tokens(text)
+
+    def _block(self, element):
+        outer_html = _outer_html(element)
+        tokens = self.count_tokens(outer_html)
+        if tokens <= self.token_budget:
+            yield outer_html, element, tokens
+        elif element.tag in CONTAINER_TAGS and len(element):
+            yield from self._walk(element)
+        elif element.tag in LIST_TAGS and len(element) > 1:
+            for part in _split_list(element, self.token_budget, self.count_tokens):
+                part_html = _outer_html(part)
+                yield part_html, part, self.count_tokens(part_html)
+        elif element.tag == 'table':
+            for part in _split_table(element, self.token_budget, self.count_tokens):
+                part_html = _outer_html(part)
+                yield part_html, part, self.count_tokens(part_html)
+        else:
+            # Indivisible block (e.g. one huge paragraph or <pre>): it gets a
+            # chunk of its own and relies on max_new_tokens.
+            yield outer_html, element, tokens
+
+    def split(self, html_content):
+        chunks = []
+        current = []
+        current_tokens = 0
+        for block_html, element, tokens in self.blocks(html_content):
+            is_heading = element is not None and element.tag in HEADING_TAGS
+            over_budget = current_tokens + tokens > self.token_budget
+            # Break early at a heading once the chunk is reasonably full, so
+            # sections stay together.
+            heading_break = is_heading and current_tokens > self.token_budget // 2
+            if current and (over_budget or heading_break):
+                chunks.append(Chunk(current, current_tokens))
+                current = []
+                current_tokens = 0
+            current.append((block_html, element))
+            current_tokens += tokens
+        if current:
+            chunks.append(Chunk(current, current_tokens))
+
+        for chunk in chunks:
+            first = chunk.blocks[0][1]
+            if first is not None and first.tag == 'ol' and first.get('start'):
+                chunk.list_start = int(first.get('start'))
+        return chunks
+
+
+def _fenced_lines(lines):
+    # Per line, whether it opens, closes or lies inside a fenced code block.
+    fence = None
+    flags = []
+    for line in lines:
+        match = CODE_FENCE.match(line)
+        if fence is None:
+            fence = match.group(1) if match else None
+            flags.append(fence is not None)
+        else:
+            flags.append(True)
+            if match and match.group(1)[0] == fence[0] and len(match.group(1)) >= len(fence) \
+                    and not line[match.end():].strip():
+                fence = None
+    return flags
+
+
+def fix_heading_levels(markdown_content, levels):
+    # The model only sees part of the document, so it may renumber headings
+    # relative to the chunk; restore the levels of the source tags in order.
+    # Lines in fenced code blocks (e.g. shell comments) are not headings.
+    if not levels:
+        return markdown_content
+    remaining = iter(levels)
+    lines = markdown_content.split("\n")
+    for index, fenced in enumerate(_fenced_lines(lines)):
+        match = None if fenced else MARKDOWN_HEADING.match(lines[index])
+        if match:
+            level = next(remaining, None)
+            if level is None:
+                break
+            lines[index] = '#' * level + match.group(2)
+    return "\n".join(lines)
+
+
+def fix_list_start(markdown_content, start):
+    # Renumbers the ordered list that opens a chunk from start onwards.
+    lines = markdown_content.split("\n")
+    number = start
+    for index, fenced in enumerate(_fenced_lines(lines)):
+        line = lines[index]
+        match = None if fenced else ORDERED_ITEM.match(line)
+        if match:
+            lines[index] = f"{number}{match.group(2)}{line[match.end():]}"
+            number += 1
+        elif line.strip() and not line.startswith((' ', '\t')):
+            if number != start:
+                break
+    return "\n".join(lines)
+
+
+def stitch(chunks, markdown_parts):
+    fixed = []
+    for chunk, markdown_content in zip(chunks, markdown_parts):
+        markdown_content = fix_heading_levels(markdown_content, chunk.headings)
+        if chunk.list_start is not None:
+            markdown_content = fix_list_start(markdown_content, chunk.list_start)
+        fixed.append(markdown_content.strip())
+    return "\n\n".join(part for part in fixed if part)
+
+
+def convert_chunked(tokenizer, model, device, params, html_content, token_budget=1024, batch_size=8,
+                    workers=1, on_chunk=None, stats=None, cancelled=None):
+    # Converts html_content chunk by chunk and returns the stitched Markdown.
+    # Chunks are batched through BatchEngine; with workers > 1 the batches
+    # run concurrently on a thread pool (torch releases the GIL while
+    # computing). on_chunk(done, total) reports progress; stats, if given,
+    # receives the chunks' merged 'early_stop' result. cancelled is passed
+    # on to BatchEngine.
+    count_tokens = lambda text: len(tokenizer.encode(text))
+    chunks = DocumentChunker(count_tokens, token_budget).split(html_content)
+    if not chunks:
+        return ""
+
+    params = dict(params, num_return_sequences=1)
+    engine = BatchEngine(tokenizer, model, device, params, batch_size=batch_size,
+                         token_budget=batch_size * (token_budget + params['max_new_tokens'] + 64),
+                         cancelled=cancelled)
+    engine.documents = {index: chunk.html for index, chunk in enumerate(chunks)}
+    items = [(index, tokenizer.encode(build_prompt(chunk.html))) for index, chunk in enumerate(chunks)]
+    batches = engine.planBatches(items)
+
+    results = [""] * len(chunks)
+    done = 0
+
+    def record(batch, markdown_parts):
+        nonlocal done
+        for (index, _), markdown_content in zip(batch, markdown_parts):
+            results[index] = markdown_content
+        done += len(batch)
+        if on_chunk is not None:
+            on_chunk(done, len(chunks))
+
+    if workers > 1 and len(batches) > 1:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for batch, markdown_parts in zip(batches, executor.map(engine.convertBatch, batches)):
+                record(batch, markdown_parts)
+    else:
+        for batch in batches:
+            record(batch, engine.convertBatch(batch))
+
+    if stats is not None:
+        stats['early_stop'] = merge_results(engine.stops.values())
+    return stitch(chunks, results)
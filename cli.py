@@ -0,0 +1,397 @@
+import argparse
+import glob
+import os
+import queue
+import sys
+import time
+
+from backends import DEFAULT_BACKEND, PRECISIONS, backend_name, configure_threads
+from converter import DEFAULT_MODEL, DEFAULT_PARAMS, MODELS, Converter
+from fast_path import DEFAULT_ROUTING, DEFAULT_THRESHOLD, ROUTING_MODES
+from fetcher import (DEFAULT_HTTP_CACHE_PATH, DEFAULT_WORKERS, Fetcher, HTTPCache, is_url, read_url_list,
+                     url_filename)
+from html_reduction import PASSES, format_report, reduce_html
+from instrumentation import JsonLinesCollector, PrometheusTextCollector, format_record, instrumentation
+from result_cache import DEFAULT_CACHE_PATH, ResultCache
+from sinks import DEFAULT_SHARD_BYTES, SINKS, Records, SinkWriter, default_sink_path, open_sink
+from speculative import DEFAULT_NGRAM_SIZE
+from stopping import format_result, format_summary, is_degenerate, summarize
+from watcher import DEFAULT_POLL_INTERVAL, DEFAULT_SETTLE_SECONDS, DirectoryWatcher
+
+STDIN = '-'
+
+
+def expand_inputs(inputs):
+    # Files, directories (their .html files), glob patterns, URLs and '-'
+    # for stdin; returns them in the given order without duplicates.
+    expanded = []
+    for value in inputs or [STDIN]:
+        if value == STDIN or is_url(value):
+            expanded.append(value)
+        elif os.path.isdir(value):
+            expanded.extend(
+                os.path.join(value, filename) for filename in sorted(os.listdir(value))
+                if filename.endswith('.html')
+            )
+        elif glob.has_magic(value):
+            expanded.extend(sorted(glob.glob(value, recursive=True)))
+        else:
+            expanded.append(value)
+    seen = set()
+    return [value for value in expanded if not (value in seen or seen.add(value))]
+
+
+def read_input(source):
+    if source == STDIN:
+        return sys.stdin.read()
+    with open(source, 'r', encoding='utf-8') as file:
+        return file.read()
+
+
+def read_url_lists(paths):
+    urls = []
+    for path in paths or []:
+        urls.extend(read_url_list(read_input(path)))
+    return urls
+
+
+def iter_inputs(sources, fetcher, on_error):
+    # (source, html) pairs: local inputs first, then URLs in the order their
+    # downloads complete.
+    urls = []
+    for source in sources:
+        if is_url(source):
+            urls.append(source)
+            continue
+        try:
+            yield source, read_input(source)
+        except Exception as e:
+            on_error(source, e)
+    if urls:
+        yield from fetcher.iterPages(urls, on_error)
+
+
+def output_path(source, output_dir, extension='.md'):
+    if source == STDIN:
+        name = 'stdin'
+    elif is_url(source):
+        return os.path.join(output_dir or '.', url_filename(source, extension))
+    else:
+        name = os.path.splitext(os.path.basename(source))[0]
+        if output_dir is None:
+            return os.path.splitext(source)[0] + extension
+    return os.path.join(output_dir or '.', name + extension)
+
+
+def write_output(text, source, args, extension='.md'):
+    if args.stdout:
+        sys.stdout.write(text)
+        if not text.endswith("\n"):
+            sys.stdout.write("\n")
+        return
+    path = output_path(source, args.output_dir, extension)
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write(text)
+    if args.verbose:
+        print(f"{source} -> {path}", file=sys.stderr)
+
+
+def add_converter_arguments(parser):
+    # Model, backend, generation and pipeline options shared with server.py;
+    # returns the pipeline group for command-specific additions.
+    parser.add_argument('-m', '--model', default=DEFAULT_MODEL,
+                        help=f"model name ({', '.join(MODELS)}) or a local/Hub model path")
+    parser.add_argument('--device', default='cpu', help="torch device, e.g. cpu, cuda or mps")
+
+    backend = parser.add_argument_group("inference backend")
+    backend.add_argument('--precision', choices=list(PRECISIONS), default=DEFAULT_BACKEND,
+                         help="fp32, bf16 (CPUs with AVX512-BF16/AMX) or int8 dynamic quantization (CPU only)")
+    backend.add_argument('--compile', action='store_true',
+                         help="compile the decode step around a static KV cache (slow first run)")
+    backend.add_argument('--threads', type=int, default=0, help="intra-op threads (0 = torch default)")
+    backend.add_argument('--interop-threads', type=int, default=0, help="inter-op threads (0 = torch default)")
+
+    generation = parser.add_argument_group("generation")
+    generation.add_argument('--max-new-tokens', type=int, default=DEFAULT_PARAMS['max_new_tokens'])
+    generation.add_argument('--temperature', type=float, default=DEFAULT_PARAMS['temperature'])
+    generation.add_argument('--do-sample', action=argparse.BooleanOptionalAction, default=False,
+                            help="sample instead of greedy decoding (default: greedy, which is cacheable)")
+    generation.add_argument('--top-p', type=float, default=DEFAULT_PARAMS['top_p'])
+    generation.add_argument('--repetition-penalty', type=float, default=DEFAULT_PARAMS['repetition_penalty'])
+    generation.add_argument('--draft-tokens', type=int, default=0,
+                            help="prompt-lookup speculative decoding: tokens drafted per forward pass "
+                                 "(0 disables; greedy decoding and single-document batches only, "
+                                 "see --batch-size 1)")
+    generation.add_argument('--ngram-size', type=int, default=DEFAULT_NGRAM_SIZE,
+                            help="n-gram length matched against the input when drafting")
+    generation.add_argument('--no-early-stop', dest='stop_degenerate', action='store_false',
+                            help="generate up to --max-new-tokens even when the output loops or runs away")
+
+    pipeline = parser.add_argument_group("pipeline")
+    pipeline.add_argument('--engine', choices=list(ROUTING_MODES), default=DEFAULT_ROUTING,
+                          help="auto: rule-based converter for simple documents, the model for complex ones; "
+                               "blocks: route each block; rules/model: force one engine (default: auto)")
+    pipeline.add_argument('--route-threshold', type=float, default=DEFAULT_THRESHOLD,
+                          help="complexity score from which the model is used (default: %(default)s)")
+    pipeline.add_argument('--no-reduce', dest='reduce', action='store_false',
+                          help="send the HTML to the model without the reduction passes")
+    pipeline.add_argument('--passes', help=f"comma-separated reduction passes (default: all of {', '.join(PASSES)})")
+    pipeline.add_argument('--chunk-tokens', type=int, default=1024,
+                          help="split documents longer than this many tokens into chunks (0 disables)")
+    pipeline.add_argument('--chunk-workers', type=int, default=1)
+    pipeline.add_argument('--batch-size', type=int, default=8)
+    pipeline.add_argument('--token-budget', type=int, default=32768)
+    pipeline.add_argument('--cache', default=DEFAULT_CACHE_PATH, help="result cache database")
+    pipeline.add_argument('--no-cache', dest='use_cache', action='store_false', help="bypass the result cache")
+    return pipeline
+
+
+def add_metrics_arguments(parser):
+    metrics = parser.add_argument_group("metrics")
+    metrics.add_argument('--metrics-jsonl', help="append one JSON record per run with per-stage timings and memory")
+    metrics.add_argument('--metrics-prom', help="write aggregated metrics in Prometheus text format to this file")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="Convert HTML to Markdown with the Jina Reader-LM models.",
+        epilog="Without inputs, HTML is read from stdin and Markdown written to stdout."
+    )
+    parser.add_argument('inputs', nargs='*',
+                        help="HTML files, directories, glob patterns, URLs, sitemap URLs (.xml) or '-' for stdin")
+    parser.add_argument('-o', '--output-dir', help="write .md files here instead of next to each input")
+    parser.add_argument('--stdout', action='store_true', default=None,
+                        help="write results to stdout (default for a single stdin or URL input)")
+    pipeline = add_converter_arguments(parser)
+    pipeline.add_argument('--clean-only', action='store_true',
+                          help="only run the reduction passes and write the cleaned HTML; no model is loaded")
+    pipeline.add_argument('--report', action='store_true', help="print per-pass reduction sizes to stderr")
+
+    output = parser.add_argument_group("output")
+    output.add_argument('--sink', choices=list(SINKS), default='files',
+                        help="files: one .md per input (default); jsonl: one JSON-lines file; jsonl-gz: gzip "
+                             "JSON-lines shards; sqlite: a SQLite table. Records hold the source, input hash, "
+                             "Markdown and timings")
+    output.add_argument('--sink-path',
+                        help="JSON-lines file ('-' for stdout), shard directory or database "
+                             "(default: markdown.jsonl, markdown-shards or markdown.sqlite in --output-dir)")
+    output.add_argument('--shard-mb', type=int, default=DEFAULT_SHARD_BYTES // 1024 ** 2,
+                        help="compressed size after which a jsonl-gz shard is closed (default: %(default)s)")
+
+    fetching = parser.add_argument_group("fetching")
+    fetching.add_argument('--urls', action='append', metavar='FILE',
+                          help="read URLs from this file, one per line ('-' for stdin); may be repeated")
+    fetching.add_argument('--sitemap', action='append', metavar='URL',
+                          help="convert every page listed in this sitemap or sitemap index; may be repeated")
+    fetching.add_argument('--fetch-workers', type=int, default=DEFAULT_WORKERS, help="concurrent downloads")
+    fetching.add_argument('--timeout', type=float, default=30, help="per-request timeout in seconds")
+    fetching.add_argument('--http-cache', default=DEFAULT_HTTP_CACHE_PATH,
+                          help="ETag/Last-Modified cache for conditional requests")
+    fetching.add_argument('--no-http-cache', dest='use_http_cache', action='store_false',
+                          help="always download pages in full")
+
+    watching = parser.add_argument_group("watching")
+    watching.add_argument('--watch', action='store_true',
+                          help="keep running and convert HTML files created or changed in the input directory "
+                               "(and its subdirectories)")
+    watching.add_argument('--settle', type=float, default=DEFAULT_SETTLE_SECONDS,
+                          help="seconds a file must stay unchanged before it is converted (default: %(default)s)")
+    watching.add_argument('--poll', action='store_true', help="rescan the directory instead of using inotify")
+    watching.add_argument('--poll-interval', type=float, default=DEFAULT_POLL_INTERVAL,
+                          help="seconds between rescans when polling (default: %(default)s)")
+
+    add_metrics_arguments(parser)
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help="report outputs and, with metrics enabled, a per-run stage summary on stderr")
+    return parser
+
+
+def configure_metrics(args):
+    collectors = []
+    if args.metrics_jsonl:
+        collectors.append(JsonLinesCollector(args.metrics_jsonl))
+    if args.metrics_prom:
+        collectors.append(PrometheusTextCollector(args.metrics_prom))
+    if not collectors:
+        return
+    if args.verbose:
+        collectors.append(lambda record: print(f"[{record['kind']}] {format_record(record)}", file=sys.stderr))
+    for collector in collectors:
+        instrumentation.addCollector(collector)
+    instrumentation.enabled = True
+
+
+def create_converter(args):
+    if args.draft_tokens and args.do_sample:
+        print("--draft-tokens is ignored with --do-sample: sampled tokens seldom match the drafts",
+              file=sys.stderr)
+    converter = Converter(
+        args.model,
+        args.device,
+        {
+            'max_new_tokens': args.max_new_tokens,
+            'temperature': args.temperature,
+            'do_sample': args.do_sample,
+            'top_p': args.top_p,
+            'repetition_penalty': args.repetition_penalty,
+            'num_return_sequences': 1,
+            'draft_tokens': args.draft_tokens,
+            'ngram_size': args.ngram_size,
+            'stop_degenerate': args.stop_degenerate
+        },
+        reduce=args.reduce,
+        passes=args.passes.split(',') if args.passes else None,
+        chunking={'token_budget': args.chunk_tokens, 'workers': args.chunk_workers} if args.chunk_tokens else None,
+        cache=ResultCache(args.cache) if args.use_cache else None,
+        backend=backend_name(args.precision, args.compile),
+        routing=args.engine,
+        route_threshold=args.route_threshold
+    )
+    if args.threads or args.interop_threads:
+        configure_threads(args.threads, args.interop_threads)
+    configure_metrics(args)
+    return converter
+
+
+def clean_only(sources, fetcher, args, passes):
+    failed = 0
+
+    def on_error(source, error):
+        nonlocal failed
+        print(f"{source}: {error}", file=sys.stderr)
+        failed += 1
+
+    for source, html_content in iter_inputs(sources, fetcher, on_error):
+        try:
+            html_content, report = reduce_html(html_content, passes, report=args.report)
+        except Exception as e:
+            on_error(source, e)
+            continue
+        if report:
+            print(f"{source}\n{format_report(report)}", file=sys.stderr)
+        write_output(html_content, source, args, extension='.clean.html')
+    return 1 if failed else 0
+
+
+def report_stops(stops, args):
+    for source, early_stop in stops.items():
+        if is_degenerate(early_stop) or args.verbose:
+            print(f"{source}: {format_result(early_stop)}", file=sys.stderr)
+
+
+def watch_directory(directory, converter, convert, landed, args):
+    # Converts files as the watcher reports them until interrupted. The model
+    # is loaded and warmed up once up front and stays loaded; files that
+    # settle while a batch converts form the next batch.
+    if converter.routing != 'rules':
+        converter.preload()
+    ready = queue.Queue()
+    watcher = DirectoryWatcher(directory, ready.put, settle=args.settle, polling=args.poll,
+                               poll_interval=args.poll_interval).start()
+    print(f"Watching {watcher.directory} ({watcher.mode}); press Ctrl+C to stop", file=sys.stderr)
+    try:
+        while True:
+            changes = ready.get()
+            while True:
+                try:
+                    changes.extend(ready.get_nowait())
+                except queue.Empty:
+                    break
+            paths = list(dict.fromkeys(change.path for change in changes))
+            for change in changes:
+                landed.setdefault(change.path, change.detected)
+            report_stops(convert(paths), args)
+    except KeyboardInterrupt:
+        print("Stopped watching.", file=sys.stderr)
+    finally:
+        watcher.stop(timeout=5)
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    fetcher = Fetcher(HTTPCache(args.http_cache) if args.use_http_cache else None, args.fetch_workers, args.timeout)
+    if args.watch:
+        if len(args.inputs) != 1 or not os.path.isdir(args.inputs[0]) or args.urls or args.sitemap:
+            print("--watch takes exactly one directory.", file=sys.stderr)
+            return 1
+        if args.clean_only or args.stdout:
+            print("--watch cannot be combined with --clean-only or --stdout.", file=sys.stderr)
+            return 1
+        sources = []
+        args.stdout = False
+    else:
+        try:
+            sources = expand_inputs(args.inputs) if args.inputs or not (args.urls or args.sitemap) else []
+            sources = fetcher.expandSources(sources + read_url_lists(args.urls) + (args.sitemap or []))
+            sources = list(dict.fromkeys(sources))
+        except Exception as e:
+            print(f"Could not read the inputs: {e}", file=sys.stderr)
+            return 1
+        if not sources:
+            print("No HTML inputs found.", file=sys.stderr)
+            return 1
+    if args.stdout is None:
+        args.stdout = args.output_dir is None and len(sources) == 1 and (sources[0] == STDIN or is_url(sources[0]))
+
+    if args.clean_only:
+        return clean_only(sources, fetcher, args, args.passes.split(',') if args.passes else None)
+
+    converter = create_converter(args)
+
+    failed = 0
+    writer = None
+    if args.sink != 'files':
+        sink_path = args.sink_path or default_sink_path(args.sink, args.output_dir)
+        writer = SinkWriter(open_sink(args.sink, sink_path, args.shard_mb * 1024 ** 2))
+        records = Records(converter.model_path)
+    # Watch mode: source -> time the file was first seen changing.
+    landed = {}
+
+    def on_result(source, markdown_content, cached):
+        if writer is not None:
+            writer.put(records.record(source, markdown_content, cached))
+        else:
+            write_output(markdown_content, source, args)
+        detected = landed.pop(source, None)
+        if detected is not None and args.verbose:
+            print(f"{source}: {time.time() - detected:.1f} s from landing to output", file=sys.stderr)
+
+    def on_error(source, error):
+        nonlocal failed
+        print(f"{source}: {error}", file=sys.stderr)
+        failed += 1
+        landed.pop(source, None)
+        if writer is not None:
+            records.discard(source)
+
+    def convert(sources):
+        items = iter_inputs(sources, fetcher, on_error)
+        if writer is not None:
+            items = records.track(items)
+        # With URLs, convert each batch as soon as it has been downloaded
+        # instead of waiting for every page.
+        window = args.batch_size if any(is_url(source) for source in sources) else None
+        return converter.convertMany(items, on_result, on_error, batch_size=args.batch_size,
+                                     token_budget=args.token_budget, window=window,
+                                     details=records.details if writer is not None else None)
+
+    try:
+        if args.watch:
+            watch_directory(args.inputs[0], converter, convert, landed, args)
+            return 1 if failed else 0
+        stops = convert(sources)
+    finally:
+        if writer is not None:
+            written = writer.close()
+            if args.verbose:
+                print(f"{written} record(s) -> {sink_path}", file=sys.stderr)
+    report_stops(stops, args)
+    if stops and args.verbose:
+        print(f"{len(sources)} document(s): {format_summary(summarize(stops.values()))}", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,532 @@
+import copy
+import time
+
+from backends import DEFAULT_BACKEND
+from batch_engine import BatchEngine
+from chunking import convert_chunked
+from fast_path import DEFAULT_ROUTING, DEFAULT_THRESHOLD, markdown_from_html, route, split_blocks, split_segments
+from fetcher import Fetcher
+from generation import MarkdownStreamer, generate_markdown, warm_up
+from html_reduction import reduce_html
+from incremental import fingerprint
+from instrumentation import instrumentation as default_instrumentation
+from model_registry import registry
+from stopping import Cancelled, check_cancelled, is_degenerate, merge_results
+
+# Only the standard library, lxml and the modules above are imported here;
+# torch and transformers are pulled in by the registry on the first model
+# load, so cleaning and cache hits never pay for them.
+
+MODELS = {
+    "0.5B Model": "jinaai/reader-lm-0.5b",
+    "1.5B Model": "jinaai/reader-lm-1.5b"
+}
+DEFAULT_MODEL = "0.5B Model"
+
+DEFAULT_PARAMS = {
+    'max_new_tokens': 1024,
+    'temperature': 0.7,
+    'do_sample': True,
+    'top_p': 0.95,
+    'repetition_penalty': 1.1,
+    'num_return_sequences': 1,
+    'stop_degenerate': True
+}
+
+# Chunking options that only schedule the work; they do not change the
+# Markdown, so they are left out of result cache keys.
+CHUNKING_SCHEDULING_OPTIONS = ('workers', 'batch_size')
+
+
+def resolve_model(name_or_path):
+    return MODELS.get(name_or_path, name_or_path)
+
+
+class Converter:
+    # GUI-free conversion pipeline: optional HTML reduction, routing to the
+    # rule-based fast path or the model (see fast_path.ROUTING_MODES), result
+    # cache lookup, model load through the shared registry, then either a
+    # single (streamed) generate call or chunked conversion for long
+    # documents.
+    # chunking is None or a dict of convert_chunked options (token_budget,
+    # workers); cache is a ResultCache or None; backend names an inference
+    # backend from backends.py. Every conversion is recorded as a run of
+    # instrumentation (a no-op unless it is enabled). Degenerate results
+    # (see stopping.py) are returned flagged but not cached.
+    # cancelled is None or a callable polled between stages and every decode
+    # step; once it returns True the conversion raises stopping.Cancelled.
+
+    def __init__(self, model_path=MODELS[DEFAULT_MODEL], device='cpu', params=None, reduce=False, passes=None,
+                 chunking=None, cache=None, backend=None, instrumentation=None, routing=DEFAULT_ROUTING,
+                 route_threshold=DEFAULT_THRESHOLD):
+        self.model_path = resolve_model(model_path)
+        self.device = device
+        self.backend = backend
+        self.instrumentation = instrumentation or default_instrumentation
+        self.params = dict(DEFAULT_PARAMS, **(params or {}))
+        self.reduce = reduce
+        self.passes = passes
+        self.chunking = chunking
+        self.cache = cache
+        self.routing = routing
+        self.route_threshold = route_threshold
+        self.cancelled = None
+
+    def withParams(self, params):
+        # A converter sharing model, cache and options with different
+        # generation parameters.
+        converter = copy.copy(self)
+        converter.params = dict(self.params, **params)
+        return converter
+
+    def withCancellation(self, cancelled):
+        # A converter sharing everything with this one whose conversions can
+        # be cancelled through cancelled().
+        converter = copy.copy(self)
+        converter.cancelled = cancelled
+        return converter
+
+    def clean(self, html_content):
+        if not self.reduce:
+            return html_content
+        html_content, _ = reduce_html(html_content, self.passes)
+        return html_content
+
+    def load(self):
+        return registry.get(self.model_path, self.device, backend=self.backend)
+
+    def preload(self, warm=True, on_stage=None):
+        # Loads the model ahead of the first conversion and, with warm, runs
+        # one short generate (generation.warm_up) unless this registry entry
+        # is warm already. on_stage gets 'load' and 'warm_up'. Returns
+        # registry.info() for the model.
+        run = self.startRun('preload')
+        try:
+            if on_stage is not None:
+                on_stage('load')
+            with run.stage('load'):
+                tokenizer, model = self.load()
+            info = registry.info(self.model_path, self.device, backend=self.backend)
+            if warm and info is not None and not info['warm']:
+                if on_stage is not None:
+                    on_stage('warm_up')
+                with run.stage('warm_up'):
+                    warm_up(tokenizer, model, self.device)
+                registry.markWarm(self.model_path, self.device, backend=self.backend)
+        except BaseException as e:
+            run.finish('error', e)
+            raise
+        run.finish()
+        return registry.info(self.model_path, self.device, backend=self.backend)
+
+    def cacheOptions(self):
+        # Result cache key options: the backend (quantized and compiled runs
+        # can produce different tokens) and the chunking that shapes the
+        # output.
+        chunking = self.chunking
+        if chunking:
+            chunking = {name: value for name, value in chunking.items() if name not in CHUNKING_SCHEDULING_OPTIONS}
+        return {'backend': self.backend or DEFAULT_BACKEND, 'chunking': chunking}
+
+    def lookup(self, html_content):
+        if self.cache is None:
+            return None
+        return self.cache.lookup(html_content, self.model_path, self.params, self.cacheOptions())
+
+    def store(self, html_content, markdown_content, early_stop=None):
+        if self.cache is not None and not is_degenerate(early_stop):
+            self.cache.store(html_content, self.model_path, self.params, markdown_content, self.cacheOptions())
+
+    def needsChunking(self, tokenizer, html_content):
+        return bool(self.chunking) and len(tokenizer.encode(html_content)) > self.chunking['token_budget']
+
+    def routeDocument(self, html_content):
+        # Returns (engine, reasons, segments). engine is 'rules' or 'model';
+        # in blocks mode a document mixing both is 'mixed', with segments
+        # from fast_path.split_segments.
+        if self.routing in ('rules', 'model'):
+            return self.routing, ["selected by the user"], None
+        decision = route(html_content, self.route_threshold)
+        if self.routing == 'blocks' and decision.engine == 'model':
+            segments = split_segments(html_content, self.route_threshold)
+            engines = {engine for engine, _ in segments}
+            if engines == {'rules'}:
+                return 'rules', decision.reasons, None
+            if 'rules' in engines:
+                return 'mixed', decision.reasons, segments
+        return decision.engine, decision.reasons, None
+
+    def recordStop(self, run, early_stop):
+        if early_stop is None:
+            return
+        run.count('stopped_early', 1)
+        run.count('saved_tokens', early_stop['saved_tokens'])
+        if is_degenerate(early_stop):
+            run.count('degenerate', 1)
+
+    def startRun(self, kind='convert', **labels):
+        return self.instrumentation.run(kind, model=self.model_path, device=self.device,
+                                        backend=self.backend or 'fp32', **labels)
+
+    def convert(self, html_content, on_text=None, on_stage=None, on_progress=None, on_chunk=None, stats=None,
+                run=None):
+        # Callbacks follow MarkdownStreamer; on_stage additionally receives
+        # 'rules', 'cached', 'load' and 'chunks', on_chunk(done, total)
+        # reports chunks. stats is filled as in generate_markdown, plus the
+        # 'engine' used ('rules', 'model', 'mixed' or 'cache') and the
+        # router's 'route_reasons'; 'early_stop' is set for every engine. A
+        # run passed in (e.g. one that already timed a fetch) is recorded
+        # into but not finished.
+        owns_run = run is None
+        if owns_run:
+            run = self.startRun()
+        try:
+            markdown_content = self._convert(html_content, run, on_text, on_stage, on_progress, on_chunk, stats)
+        except Cancelled:
+            if owns_run:
+                run.finish('cancelled')
+            raise
+        except BaseException as e:
+            if owns_run:
+                run.finish('error', e)
+            raise
+        if owns_run:
+            run.finish()
+        return markdown_content
+
+    def _convert(self, html_content, run, on_text, on_stage, on_progress, on_chunk, stats):
+        run.count('input_bytes', len(html_content))
+        stats = {} if stats is None else stats
+        stats['early_stop'] = None
+        with run.stage('reduce'):
+            html_content = self.clean(html_content)
+        with run.stage('route'):
+            engine, stats['route_reasons'], segments = self.routeDocument(html_content)
+        stats['engine'] = engine
+        if engine == 'rules':
+            run.label(engine='rules')
+            if on_stage is not None:
+                on_stage('rules')
+            with run.stage('rules'):
+                return markdown_from_html(html_content)
+        if engine == 'mixed':
+            run.label(engine='mixed')
+            if on_stage is not None:
+                on_stage('chunks')
+            return self._convertSegments(segments, run, on_chunk, stats=stats)
+
+        with run.stage('cache'):
+            cached = self.lookup(html_content)
+        if cached is not None:
+            run.label(engine='cache')
+            stats['engine'] = 'cache'
+            if on_stage is not None:
+                on_stage('cached')
+            return cached
+
+        check_cancelled(self.cancelled)
+        if on_stage is not None:
+            on_stage('load')
+        with run.stage('load'):
+            tokenizer, model = self.load()
+        if self.needsChunking(tokenizer, html_content):
+            run.label(engine='model-chunked')
+            if on_stage is not None:
+                on_stage('chunks')
+            with run.stage('chunked'):
+                markdown_content = convert_chunked(tokenizer, model, self.device, self.params, html_content,
+                                                   on_chunk=on_chunk, stats=stats, cancelled=self.cancelled,
+                                                   **self.chunking)
+        else:
+            run.label(engine='model')
+            streamer = MarkdownStreamer(tokenizer, self.params['max_new_tokens'], on_text=on_text,
+                                        on_stage=on_stage, on_progress=on_progress)
+            start = time.perf_counter()
+            markdown_content = generate_markdown(tokenizer, model, html_content, self.device, self.params,
+                                                 streamer=streamer, stats=stats, cancelled=self.cancelled)
+            elapsed = time.perf_counter() - start
+            prefill = streamer.prefill_seconds or 0.0
+            decode = streamer.decodeSeconds()
+            # Whatever generate_markdown spent outside the model: encoding the
+            # prompt and decoding the output text.
+            run.record('tokenize', max(0.0, elapsed - prefill - decode))
+            run.record('prefill', prefill)
+            run.record('decode', decode)
+            run.count('prompt_tokens', stats.get('prompt_tokens', 0))
+            run.count('generated_tokens', stats.get('generated_tokens', 0))
+        self.recordStop(run, stats['early_stop'])
+        with run.stage('store'):
+            self.store(html_content, markdown_content, stats['early_stop'])
+        return markdown_content
+
+    def _convertSegments(self, segments, run, on_chunk=None, batch_size=8, token_budget=32768, stats=None):
+        # Stitches a blocks-mode document: rule segments are already
+        # Markdown, model segments go through the cache and one batched
+        # generate pass. stats, if given, receives the segments' merged
+        # 'early_stop' result.
+        parts = [content if engine == 'rules' else None for engine, content in segments]
+        misses = {}
+        for index, (engine, content) in enumerate(segments):
+            if engine != 'model':
+                continue
+            with run.stage('cache'):
+                parts[index] = self.lookup(content)
+            if parts[index] is None:
+                misses[index] = content
+        total = len(misses)
+        done = 0
+
+        def on_result(index, markdown_content, cached):
+            nonlocal done
+            parts[index] = markdown_content
+            done += 1
+            if on_chunk is not None:
+                on_chunk(done, total)
+
+        def failed(index, error):
+            raise error
+
+        stops = {}
+        if misses:
+            self._convertMisses(misses, run, on_result, failed, batch_size, token_budget, None, stops)
+        if stats is not None:
+            stats['early_stop'] = merge_results(stops.values())
+        return "\n\n".join(part.strip() for part in parts if part and part.strip())
+
+    def convertBlocks(self, html_content, block_cache, on_chunk=None, stats=None, run=None, batch_size=8,
+                      token_budget=32768):
+        # Incremental conversion: returns the Markdown of each top-level block
+        # (see incremental.py) in document order. Blocks found in block_cache
+        # are reused; the rest are converted, model blocks in one batched
+        # pass, and added to it. on_chunk(done, total) reports converted
+        # model blocks; stats receives 'blocks', 'reused' and 'converted'
+        # counts and 'early_stop'.
+        owns_run = run is None
+        if owns_run:
+            run = self.startRun('blocks')
+        try:
+            parts = self._convertBlocks(html_content, block_cache, run, on_chunk, stats, batch_size, token_budget)
+        except Cancelled:
+            if owns_run:
+                run.finish('cancelled')
+            raise
+        except BaseException as e:
+            if owns_run:
+                run.finish('error', e)
+            raise
+        if owns_run:
+            run.finish()
+        return parts
+
+    def _convertBlocks(self, html_content, block_cache, run, on_chunk, stats, batch_size, token_budget):
+        run.count('input_bytes', len(html_content))
+        stats = {} if stats is None else stats
+        with run.stage('reduce'):
+            html_content = self.clean(html_content)
+        with run.stage('route'):
+            blocks = split_blocks(html_content, self.route_threshold)
+        if self.routing in ('rules', 'model'):
+            blocks = [(self.routing, block_html) for _, block_html in blocks]
+
+        parts = [None] * len(blocks)
+        keys = [fingerprint(block_html, engine, self.model_path, self.params, self.backend or DEFAULT_BACKEND)
+                for engine, block_html in blocks]
+        misses = {}
+        reused = 0
+        with run.stage('blocks'):
+            for index, (engine, block_html) in enumerate(blocks):
+                parts[index] = block_cache.get(keys[index])
+                if parts[index] is not None:
+                    reused += 1
+                elif engine == 'rules':
+                    parts[index] = markdown_from_html(block_html)
+                    block_cache.put(keys[index], parts[index])
+                else:
+                    parts[index] = self.lookup(block_html)
+                    if parts[index] is None:
+                        misses[index] = block_html
+                    else:
+                        block_cache.put(keys[index], parts[index])
+        stats.update(blocks=len(blocks), reused=reused, converted=len(blocks) - reused, early_stop=None)
+        run.count('blocks', len(blocks))
+        run.count('reused_blocks', reused)
+
+        if misses:
+            total = len(misses)
+            done = 0
+            stops = {}
+
+            def on_result(index, markdown_content, cached):
+                nonlocal done
+                parts[index] = markdown_content
+                # Like the result cache, degenerate blocks are not kept, so
+                # the next conversion tries them again.
+                if not is_degenerate(stops.get(index)):
+                    block_cache.put(keys[index], markdown_content)
+                done += 1
+                if on_chunk is not None:
+                    on_chunk(done, total)
+
+            def failed(index, error):
+                raise error
+
+            self._convertMisses(misses, run, on_result, failed, batch_size, token_budget, None, stops)
+            stats['early_stop'] = merge_results(stops.values())
+        return parts
+
+    def convertMany(self, items, on_result, on_error=None, batch_size=8, token_budget=32768, should_stop=None,
+                    window=None, details=None):
+        # items are (key, html_content) pairs. on_result(key, markdown, cached)
+        # is called per document as soon as it is available; documents that
+        # need chunking are converted one by one, the rest in batches. By
+        # default all items are read before batching, which gives the best
+        # length bucketing; with a window, every `window` cache misses are
+        # converted as soon as they are collected, so a slow item source
+        # (e.g. Fetcher.iterPages) keeps producing during inference.
+        # Returns the early_stop result of every document that stopped early,
+        # by key, for stopping.summarize. should_stop defaults to cancelled;
+        # a cancellation raises stopping.Cancelled. details, if given, is a
+        # dict that receives {'engine', 'early_stop'} for a key just before
+        # on_result is called for it; engine is 'rules', 'model' or 'mixed'.
+        run = self.startRun('batch')
+        stops = {}
+        engines = None
+        if details is not None:
+            engines = {}
+            report = on_result
+
+            def on_result(key, markdown_content, cached):
+                details[key] = {'engine': engines.pop(key, None), 'early_stop': stops.get(key)}
+                report(key, markdown_content, cached)
+
+            def on_error(key, error, report_error=on_error):
+                engines.pop(key, None)
+                if report_error is None:
+                    raise error
+                report_error(key, error)
+        try:
+            self._convertMany(items, run, on_result, on_error, batch_size, token_budget,
+                              should_stop or self.cancelled, window, stops, engines)
+            check_cancelled(self.cancelled)
+        except Cancelled:
+            run.finish('cancelled')
+            raise
+        except BaseException as e:
+            run.finish('error', e)
+            raise
+        run.finish()
+        return stops
+
+    def _convertMany(self, items, run, on_result, on_error, batch_size, token_budget, should_stop, window, stops,
+                     engines=None):
+        misses = {}
+
+        def failed(key, error):
+            run.count('failed', 1)
+            if on_error is None:
+                raise error
+            on_error(key, error)
+
+        for key, html_content in items:
+            if should_stop is not None and should_stop():
+                return
+            run.count('documents', 1)
+            run.count('input_bytes', len(html_content))
+            try:
+                with run.stage('reduce'):
+                    html_content = self.clean(html_content)
+                with run.stage('route'):
+                    engine, _, segments = self.routeDocument(html_content)
+                if engine == 'rules':
+                    with run.stage('rules'):
+                        markdown_content = markdown_from_html(html_content)
+                elif engine == 'mixed':
+                    segment_stats = {}
+                    markdown_content = self._convertSegments(segments, run, batch_size=batch_size,
+                                                             token_budget=token_budget, stats=segment_stats)
+                    if segment_stats['early_stop'] is not None:
+                        stops[key] = segment_stats['early_stop']
+                else:
+                    with run.stage('cache'):
+                        cached = self.lookup(html_content)
+            except Cancelled:
+                raise
+            except Exception as e:
+                failed(key, e)
+                continue
+            run.count(engine, 1)
+            if engines is not None:
+                engines[key] = engine
+            if engine != 'model':
+                on_result(key, markdown_content, False)
+                continue
+            if cached is not None:
+                run.count('cached', 1)
+                on_result(key, cached, True)
+                continue
+            misses[key] = html_content
+            if window and len(misses) >= window:
+                self._convertMisses(misses, run, on_result, failed, batch_size, token_budget, should_stop, stops)
+                misses = {}
+        if misses:
+            self._convertMisses(misses, run, on_result, failed, batch_size, token_budget, should_stop, stops)
+
+    def _convertMisses(self, misses, run, on_result, failed, batch_size, token_budget, should_stop, stops):
+        # stops receives the early_stop result of every miss that stopped
+        # early, by key.
+        params = dict(self.params, num_return_sequences=1)
+        engine = None
+
+        def converted(key, markdown_content, early_stop=None):
+            if engine is not None and early_stop is None:
+                early_stop = engine.stops.get(key)
+            if early_stop is not None:
+                stops[key] = early_stop
+                self.recordStop(run, early_stop)
+            self.store(misses[key], markdown_content, early_stop)
+            run.count('converted', 1)
+            on_result(key, markdown_content, False)
+
+        with run.stage('load'):
+            tokenizer, model = self.load()
+        batched = []
+        for key, html_content in misses.items():
+            if should_stop is not None and should_stop():
+                return
+            if not self.needsChunking(tokenizer, html_content):
+                batched.append((key, html_content))
+                continue
+            chunk_stats = {}
+            try:
+                with run.stage('chunked'):
+                    markdown_content = convert_chunked(tokenizer, model, self.device, params, html_content,
+                                                       stats=chunk_stats, cancelled=self.cancelled, **self.chunking)
+            except Cancelled:
+                raise
+            except Exception as e:
+                failed(key, e)
+                continue
+            converted(key, markdown_content, chunk_stats['early_stop'])
+
+        engine = BatchEngine(tokenizer, model, self.device, params, batch_size=batch_size, token_budget=token_budget,
+                             cancelled=self.cancelled)
+        with run.stage('generate'):
+            engine.run(batched, converted, failed, should_stop)
+
+    def convertURL(self, url, timeout=30, fetcher=None, **callbacks):
+        # fetcher is a shared Fetcher (pooled connections, HTTP cache); a
+        # one-off one is used otherwise.
+        fetcher = fetcher or Fetcher(timeout=timeout)
+        run = self.startRun(url=url)
+        try:
+            with run.stage('fetch'):
+                page = fetcher.fetch(url)
+            markdown_content = self.convert(page.text, run=run, **callbacks)
+        except Cancelled:
+            run.finish('cancelled')
+            raise
+        except BaseException as e:
+            run.finish('error', e)
+            raise
+        run.finish()
+        return markdown_content
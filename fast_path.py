@@ -0,0 +1,409 @@
+import copy
+import re
+from collections import OrderedDict, namedtuple
+
+import lxml.html
+from lxml import etree
+
+# Rule-based HTML to Markdown conversion for documents simple enough not to
+# need the model, and the router that decides which documents (or blocks)
+# those are.
+
+ROUTING_MODES = OrderedDict([
+    ('auto', "Automatic (per document)"),
+    ('blocks', "Automatic (per block)"),
+    ('rules', "Rule-based only"),
+    ('model', "Model only"),
+])
+DEFAULT_ROUTING = 'auto'
+DEFAULT_THRESHOLD = 1.0
+
+HEADING_TAGS = ('h1', 'h2', 'h3', 'h4', 'h5', 'h6')
+CONTAINER_TAGS = {'html', 'body', 'div', 'section', 'article', 'main', 'header', 'footer', 'nav', 'aside',
+                  'figure', 'figcaption', 'address', 'details', 'summary', 'center', 'form', 'fieldset', 'hgroup'}
+BLOCK_TAGS = CONTAINER_TAGS | set(HEADING_TAGS) | {'p', 'ul', 'ol', 'li', 'blockquote', 'pre', 'table', 'hr',
+                                                  'dl', 'dt', 'dd'}
+SKIP_TAGS = {'head', 'script', 'style', 'noscript', 'template', 'title', 'meta', 'link', 'button', 'select',
+             'input', 'textarea', 'option'}
+CODE_TAGS = ('code', 'kbd', 'samp', 'tt')
+EMBEDDED_TAGS = ('iframe', 'object', 'embed', 'canvas', 'svg', 'math', 'video', 'audio')
+FORM_TAGS = ('form', 'input', 'select', 'textarea', 'button')
+LOOSE_TEXT_CONTAINERS = {'body', 'div', 'section', 'article', 'main', 'td', 'th', 'span', 'center', 'font'}
+
+MAX_DEPTH = 12
+MAX_ELEMENTS = 5000
+MAX_LOOSE_TEXT_RATIO = 0.2
+
+WHITESPACE = re.compile(r'\s+')
+ESCAPE = re.compile(r'([\\`*_\[\]<]|&(?=#?\w+;))')
+LINE_START_MARKER = re.compile(r'^(#{1,6}\s|>|[-+*]\s|\d+[.)]\s)')
+ORDERED_MARKER = re.compile(r'^(\d+)([.)])')
+LINE_BREAK = '\x00'
+
+Route = namedtuple('Route', ['engine', 'score', 'reasons'])
+
+
+def _parse(html_content):
+    try:
+        root = lxml.html.document_fromstring(html_content)
+    except etree.ParserError:
+        return None
+    body = root.find('body')
+    return body if body is not None else root
+
+
+def _is_element(node):
+    return isinstance(node.tag, str)
+
+
+def _title(element):
+    title = element.get('title')
+    return ' "' + title.replace('\\', '\\\\').replace('"', '\\"') + '"' if title else ''
+
+
+def table_rows(element):
+    # The table's own rows; iter('tr') would also yield those of tables
+    # nested in its cells.
+    rows = []
+    for child in element:
+        if child.tag == 'tr':
+            rows.append(child)
+        elif child.tag in ('thead', 'tbody', 'tfoot'):
+            rows.extend(row for row in child if row.tag == 'tr')
+    return rows
+
+
+class MarkdownWriter:
+    # Walks an lxml tree and renders CommonMark with GFM tables and
+    # strikethrough. Block elements become blank-line separated blocks;
+    # everything else is rendered inline.
+
+    def convert(self, element):
+        return "\n\n".join(block for block in self.blocks(element) if block.strip()).strip()
+
+    def blocks(self, element):
+        # Markdown blocks for the children of element.
+        blocks = []
+        inline = []
+
+        def flush():
+            paragraph = self.paragraph("".join(inline))
+            if paragraph:
+                blocks.append(paragraph)
+            inline.clear()
+
+        if element.text:
+            inline.append(self.text(element.text))
+        for child in element:
+            if _is_element(child) and child.tag not in SKIP_TAGS:
+                if child.tag in BLOCK_TAGS:
+                    flush()
+                    blocks.extend(self.block(child))
+                else:
+                    inline.append(self.inline(child))
+            if child.tail:
+                inline.append(self.text(child.tail))
+        flush()
+        return blocks
+
+    def block(self, element):
+        tag = element.tag
+        if tag in HEADING_TAGS:
+            text = self.paragraph(self.inlineChildren(element)).replace("\n", " ")
+            return [f"{'#' * int(tag[1])} {text}"] if text else []
+        if tag == 'p':
+            paragraph = self.paragraph(self.inlineChildren(element))
+            return [paragraph] if paragraph else []
+        if tag in ('ul', 'ol'):
+            return [self.list(element)]
+        if tag == 'blockquote':
+            inner = "\n\n".join(self.blocks(element))
+            return ["\n".join(f"> {line}" if line else ">" for line in inner.split("\n"))]
+        if tag == 'pre':
+            return [self.pre(element)]
+        if tag == 'hr':
+            return ["---"]
+        if tag == 'table':
+            return [self.table(element)]
+        if tag == 'dt':
+            term = self.paragraph(self.inlineChildren(element))
+            return [f"**{term}**"] if term else []
+        return self.blocks(element)
+
+    def list(self, element):
+        ordered = element.tag == 'ol'
+        try:
+            number = int(element.get('start', '1'))
+        except ValueError:
+            number = 1
+        items = []
+        for item in element:
+            if not _is_element(item) or item.tag != 'li':
+                continue
+            marker = f"{number}. " if ordered else "- "
+            number += 1
+            content = "\n\n".join(self.blocks(item)) or ""
+            # A tight item (one paragraph plus nested lists) stays compact.
+            content = re.sub(r'\n\n(?=\s*(?:[-+*]|\d+[.)]) )', "\n", content)
+            lines = content.split("\n")
+            indent = " " * len(marker)
+            items.append(marker + lines[0] + "".join(f"\n{indent}{line}" if line else "\n" for line in lines[1:]))
+        return "\n".join(items)
+
+    def pre(self, element):
+        code = element.find('code')
+        language = ''
+        for node in (element, code):
+            if node is None:
+                continue
+            for name in (node.get('class') or '').split():
+                if name.startswith(('language-', 'lang-')):
+                    language = name.split('-', 1)[1]
+        text = element.text_content().strip("\n")
+        longest = max((len(run) for run in re.findall(r'`+', text)), default=0)
+        fence = '`' * max(3, longest + 1)
+        return f"{fence}{language}\n{text}\n{fence}"
+
+    def table(self, element):
+        rows = []
+        for row in table_rows(element):
+            cells = []
+            for cell in row:
+                if _is_element(cell) and cell.tag in ('td', 'th'):
+                    text = self.paragraph(self.inlineChildren(cell)).replace("\n", " ").replace("|", "\\|")
+                    cells.append(text)
+            if cells:
+                rows.append(cells)
+        if not rows:
+            return ""
+        width = max(len(row) for row in rows)
+        rows = [row + [""] * (width - len(row)) for row in rows]
+        lines = ["| " + " | ".join(rows[0]) + " |", "| " + " | ".join(["---"] * width) + " |"]
+        lines.extend("| " + " | ".join(row) + " |" for row in rows[1:])
+        return "\n".join(lines)
+
+    def inlineChildren(self, element):
+        parts = [self.text(element.text)] if element.text else []
+        for child in element:
+            if _is_element(child) and child.tag not in SKIP_TAGS:
+                parts.append(self.inline(child))
+            if child.tail:
+                parts.append(self.text(child.tail))
+        return "".join(parts)
+
+    def inline(self, element):
+        tag = element.tag
+        if tag == 'br':
+            return LINE_BREAK
+        if tag == 'img':
+            alt = ESCAPE.sub(r'\\\1', element.get('alt', ''))
+            src = element.get('src')
+            return f"![{alt}]({src.replace(' ', '%20')}{_title(element)})" if src else alt
+        if tag in CODE_TAGS:
+            text = WHITESPACE.sub(' ', element.text_content())
+            ticks = '`' * (max((len(run) for run in re.findall(r'`+', text)), default=0) + 1)
+            padding = ' ' if text.startswith('`') or text.endswith('`') else ''
+            return f"{ticks}{padding}{text}{padding}{ticks}" if text.strip() else ""
+        content = self.inlineChildren(element)
+        if tag == 'a':
+            href = element.get('href')
+            if not href or href.startswith('javascript:'):
+                return content
+            return f"[{content.strip()}]({href.replace(' ', '%20')}{_title(element)})"
+        wrappers = {'strong': '**', 'b': '**', 'em': '*', 'i': '*', 'del': '~~', 's': '~~', 'strike': '~~'}
+        if tag in wrappers and content.strip():
+            # Emphasis markers must hug the text.
+            leading = content[:len(content) - len(content.lstrip())]
+            trailing = content[len(content.rstrip()):]
+            return f"{leading}{wrappers[tag]}{content.strip()}{wrappers[tag]}{trailing}"
+        return content
+
+    def text(self, text):
+        return ESCAPE.sub(r'\\\1', WHITESPACE.sub(' ', text))
+
+    def paragraph(self, inline):
+        lines = [WHITESPACE.sub(' ', line).strip() for line in inline.split(LINE_BREAK)]
+        while lines and not lines[-1]:
+            lines.pop()
+        while lines and not lines[0]:
+            lines.pop(0)
+        if not lines:
+            return ""
+        # Text that would start a heading, quote or list is escaped; a
+        # number's marker is escaped after the digits ("1\.").
+        for index, line in enumerate(lines):
+            if LINE_START_MARKER.match(line):
+                lines[index] = ORDERED_MARKER.sub(r'\1\\\2', line) if line[0].isdigit() else "\\" + line
+        return "  \n".join(lines)
+
+
+def markdown_from_html(html_content):
+    root = _parse(html_content)
+    if root is None:
+        return ""
+    return MarkdownWriter().convert(root)
+
+
+def _is_complex_table(table):
+    if table.find('.//table') is not None:
+        return True
+    rows = list(table.iter('tr'))
+    if len(rows) < 2:
+        return True
+    for cell in table.iter('td', 'th'):
+        if cell.get('colspan', '1') not in ('', '1') or cell.get('rowspan', '1') not in ('', '1'):
+            return True
+        if any(_is_element(child) and child.tag in BLOCK_TAGS for child in cell.iterdescendants()):
+            return True
+    return False
+
+
+def analyze(element):
+    # Structural features of a parsed document or block that the rule-based
+    # writer handles badly.
+    features = {'elements': 0, 'max_depth': 0, 'tables': 0, 'complex_tables': 0, 'forms': 0, 'embedded': 0,
+                'custom_elements': 0, 'text': 0, 'loose_text': 0}
+    stack = [(element, 0)]
+    while stack:
+        node, depth = stack.pop()
+        features['elements'] += 1
+        features['max_depth'] = max(features['max_depth'], depth)
+        tag = node.tag
+        if tag == 'table':
+            features['tables'] += 1
+            if _is_complex_table(node):
+                features['complex_tables'] += 1
+        elif tag in FORM_TAGS:
+            features['forms'] += 1
+        elif tag in EMBEDDED_TAGS:
+            features['embedded'] += 1
+        elif '-' in tag:
+            features['custom_elements'] += 1
+
+        children = [child for child in node if _is_element(child)]
+        # Text mixed with block siblings (e.g. <div>text<br>text<p>...</div>)
+        # has no clear paragraph structure.
+        if tag in LOOSE_TEXT_CONTAINERS and any(child.tag in BLOCK_TAGS for child in children):
+            loose = len((node.text or '').strip()) + sum(len((child.tail or '').strip()) for child in node)
+            features['loose_text'] += loose
+        if node.text:
+            features['text'] += len(node.text.strip())
+        for child in node:
+            if child.tail:
+                features['text'] += len(child.tail.strip())
+        stack.extend((child, depth + 1) for child in children if child.tag not in SKIP_TAGS)
+    return features
+
+
+def score(features):
+    # Returns (score, reasons); a score of 1.0 or more needs the model.
+    total = 0.0
+    reasons = []
+    if features['complex_tables']:
+        total += features['complex_tables']
+        reasons.append(f"{features['complex_tables']} complex table(s)")
+    if features['max_depth'] > MAX_DEPTH:
+        total += 1.0
+        reasons.append(f"nesting depth {features['max_depth']}")
+    if features['text'] and features['loose_text'] / features['text'] > MAX_LOOSE_TEXT_RATIO:
+        total += 1.0
+        reasons.append(f"{100 * features['loose_text'] / features['text']:.0f}% of the text outside paragraphs")
+    if features['forms']:
+        total += 0.5
+        reasons.append("forms")
+    if features['embedded']:
+        total += 0.5
+        reasons.append("embedded content")
+    if features['custom_elements']:
+        total += 0.5
+        reasons.append("custom elements")
+    if features['elements'] > MAX_ELEMENTS:
+        total += 0.5
+        reasons.append(f"{features['elements']} elements")
+    return total, reasons
+
+
+def route(html_content, threshold=DEFAULT_THRESHOLD):
+    root = _parse(html_content)
+    if root is None:
+        return Route('rules', 0.0, ["no markup"])
+    total, reasons = score(analyze(root))
+    return Route('model' if total >= threshold else 'rules', total, reasons or ["simple structure"])
+
+
+def _top_level_blocks(element):
+    # The blocks of a document: containers holding blocks are descended
+    # into, runs of inline content and loose text become paragraphs.
+    paragraph = etree.Element('p')
+
+    def take():
+        nonlocal paragraph
+        taken, paragraph = paragraph, etree.Element('p')
+        return taken if len(taken) or (taken.text or '').strip() else None
+
+    def add_text(text):
+        if not text or not text.strip():
+            return
+        if len(paragraph):
+            paragraph[-1].tail = (paragraph[-1].tail or '') + text
+        else:
+            paragraph.text = (paragraph.text or '') + text
+
+    add_text(element.text)
+    for child in element:
+        if _is_element(child) and child.tag not in SKIP_TAGS:
+            if child.tag in BLOCK_TAGS:
+                taken = take()
+                if taken is not None:
+                    yield taken
+                if child.tag in CONTAINER_TAGS and any(_is_element(node) and node.tag in BLOCK_TAGS
+                                                       for node in child):
+                    yield from _top_level_blocks(child)
+                else:
+                    yield child
+            else:
+                inline = copy.deepcopy(child)
+                inline.tail = None
+                paragraph.append(inline)
+        add_text(child.tail)
+    taken = take()
+    if taken is not None:
+        yield taken
+
+
+def split_blocks(html_content, threshold=DEFAULT_THRESHOLD):
+    # [(engine, html)] per top-level block in document order, unmerged, so
+    # that an edit to one block leaves the HTML of the others unchanged.
+    root = _parse(html_content)
+    if root is None:
+        return []
+    blocks = []
+    for block in _top_level_blocks(root):
+        total, _ = score(analyze(block))
+        blocks.append(('model' if total >= threshold else 'rules',
+                       lxml.html.tostring(block, encoding='unicode', with_tail=False)))
+    return blocks
+
+
+def split_segments(html_content, threshold=DEFAULT_THRESHOLD):
+    # Routes each top-level block and merges neighbours routed the same way.
+    # Returns [(engine, html)] in document order; rule segments are returned
+    # already converted to Markdown, model segments as HTML.
+    root = _parse(html_content)
+    if root is None:
+        return []
+    writer = MarkdownWriter()
+    segments = []
+    for block in _top_level_blocks(root):
+        total, _ = score(analyze(block))
+        engine = 'model' if total >= threshold else 'rules'
+        if engine == 'rules':
+            content = "\n\n".join(writer.block(block))
+        else:
+            content = lxml.html.tostring(block, encoding='unicode', with_tail=False)
+        if segments and segments[-1][0] == engine:
+            separator = "\n\n" if engine == 'rules' else "\n"
+            segments[-1] = (engine, segments[-1][1] + separator + content)
+        else:
+            segments.append((engine, content))
+    return [(engine, content) for engine, content in segments if content.strip()]
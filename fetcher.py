@@ -0,0 +1,303 @@
+import gzip
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+DEFAULT_HTTP_CACHE_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'html-to-md', 'http.sqlite')
+DEFAULT_HTTP_CACHE_BYTES = 256 * 1024 * 1024
+DEFAULT_WORKERS = 8
+USER_AGENT = 'html-to-md (+https://github.com/avnigashi/HTML-to-md)'
+SITEMAP_ROOTS = ('urlset', 'sitemapindex')
+
+FetchResult = namedtuple('FetchResult', ['url', 'text', 'status', 'cached', 'seconds'])
+
+
+def is_url(value):
+    return value.startswith(('http://', 'https://'))
+
+
+def url_filename(url, extension='.md'):
+    return (re.sub(r'[^\w.-]+', '_', url.split('://', 1)[-1].rstrip('/')) or 'index') + extension
+
+
+def is_sitemap(url):
+    # Only a hint: whether an .xml URL is a sitemap is decided by its root
+    # element once fetched (see Fetcher.expandSources).
+    return url.split('?', 1)[0].lower().endswith(('.xml', '.xml.gz'))
+
+
+def read_url_list(text):
+    # One URL per line; blank lines and '#' comments are skipped.
+    urls = []
+    for line in text.splitlines():
+        line = line.strip()
+        if line and not line.startswith('#'):
+            urls.append(line)
+    return urls
+
+
+def parse_sitemap(content):
+    # Returns (page_urls, sitemap_urls) from a <urlset> or <sitemapindex>
+    # document, gzipped or not. Raises ValueError for any other document.
+    from lxml import etree
+
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    if content[:2] == b'\x1f\x8b':
+        content = gzip.decompress(content)
+    content = content.lstrip()
+    try:
+        root = etree.fromstring(content, parser=etree.XMLParser(resolve_entities=False, no_network=True))
+    except etree.XMLSyntaxError as e:
+        raise ValueError(f"Not a sitemap: {e}")
+    name = etree.QName(root).localname
+    if name not in SITEMAP_ROOTS:
+        raise ValueError(f"Not a sitemap: the root element is <{name}>")
+    locations = [location.text.strip() for location in root.iter('{*}loc') if location.text]
+    if name == 'sitemapindex':
+        return [], locations
+    return locations, []
+
+
+class HTTPCache:
+    # Last response body per URL with its ETag/Last-Modified validators, in
+    # SQLite, so refetching an unchanged page is a conditional GET answered
+    # with 304 Not Modified. Oldest entries are dropped beyond max_bytes.
+
+    def __init__(self, path=DEFAULT_HTTP_CACHE_PATH, max_bytes=DEFAULT_HTTP_CACHE_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._connection = None
+
+    def _connect(self):
+        if self._connection is None:
+            if self.path != ':memory:':
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS pages ("
+                "url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, body TEXT NOT NULL, "
+                "size INTEGER NOT NULL, fetched REAL NOT NULL)"
+            )
+            self._connection.execute("CREATE INDEX IF NOT EXISTS pages_fetched ON pages (fetched)")
+            self._connection.commit()
+        return self._connection
+
+    def get(self, url):
+        # Returns (etag, last_modified, body) or None.
+        with self._lock:
+            return self._connect().execute(
+                "SELECT etag, last_modified, body FROM pages WHERE url = ?", (url,)).fetchone()
+
+    def put(self, url, etag, last_modified, body):
+        with self._lock:
+            connection = self._connect()
+            connection.execute(
+                "INSERT OR REPLACE INTO pages (url, etag, last_modified, body, size, fetched) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (url, etag, last_modified, body, len(body.encode('utf-8')), time.time())
+            )
+            self._evict(connection)
+            connection.commit()
+
+    def touch(self, url):
+        with self._lock:
+            connection = self._connect()
+            connection.execute("UPDATE pages SET fetched = ? WHERE url = ?", (time.time(), url))
+            connection.commit()
+
+    def _evict(self, connection):
+        if self.max_bytes is None:
+            return
+        total = connection.execute("SELECT COALESCE(SUM(size), 0) FROM pages").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        stale = []
+        for url, size in connection.execute("SELECT url, size FROM pages ORDER BY fetched").fetchall():
+            if total <= self.max_bytes:
+                break
+            stale.append((url,))
+            total -= size
+        connection.executemany("DELETE FROM pages WHERE url = ?", stale)
+
+    def clear(self):
+        with self._lock:
+            connection = self._connect()
+            connection.execute("DELETE FROM pages")
+            connection.commit()
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+
+class Fetcher:
+    # Fetches pages over one pooled requests.Session (keep-alive, gzip,
+    # retries on 429/5xx) with at most `workers` requests in flight.
+    # fetchMany yields pages as they arrive, so a consumer that converts
+    # them overlaps inference with the remaining downloads. cache is an
+    # HTTPCache or None.
+
+    def __init__(self, cache=None, workers=DEFAULT_WORKERS, timeout=30, retries=2):
+        self.cache = cache
+        self.workers = max(1, workers)
+        self.timeout = timeout
+        self.retries = retries
+        self._session = None
+        self._lock = threading.Lock()
+
+    @property
+    def session(self):
+        with self._lock:
+            if self._session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+                from urllib3.util.retry import Retry
+
+                session = requests.Session()
+                retry = Retry(total=self.retries, backoff_factor=0.5, status_forcelist=(429, 502, 503, 504),
+                              allowed_methods=('GET', 'HEAD'))
+                adapter = HTTPAdapter(pool_connections=self.workers, pool_maxsize=self.workers, max_retries=retry)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                session.headers.update({'User-Agent': USER_AGENT, 'Accept-Encoding': 'gzip, deflate'})
+                self._session = session
+            return self._session
+
+    def request(self, url):
+        # Conditional GET; returns (response, cached_body). cached_body is set
+        # when the server answered 304 Not Modified.
+        headers = {}
+        cached = self.cache.get(url) if self.cache is not None else None
+        if cached is not None:
+            etag, last_modified, _ = cached
+            if etag:
+                headers['If-None-Match'] = etag
+            if last_modified:
+                headers['If-Modified-Since'] = last_modified
+        response = self.session.get(url, headers=headers, timeout=self.timeout)
+        if response.status_code == 304 and cached is not None:
+            self.cache.touch(url)
+            return response, cached[2]
+        response.raise_for_status()
+        return response, None
+
+    def fetch(self, url):
+        start = time.perf_counter()
+        response, cached_body = self.request(url)
+        if cached_body is not None:
+            return FetchResult(url, cached_body, response.status_code, True, time.perf_counter() - start)
+        text = response.text
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        if self.cache is not None and (etag or last_modified):
+            self.cache.put(url, etag, last_modified, text)
+        return FetchResult(url, text, response.status_code, False, time.perf_counter() - start)
+
+    def fetchMany(self, urls, on_error=None, should_stop=None):
+        # Yields FetchResults in completion order. Failed URLs go to
+        # on_error(url, error) (or raise without it). At most twice `workers`
+        # URLs are queued ahead, so long lists are not downloaded faster than
+        # they are consumed.
+        urls = iter(urls)
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='fetch') as executor:
+            pending = {}
+
+            def submit():
+                for url in urls:
+                    pending[executor.submit(self.fetch, url)] = url
+                    if len(pending) >= 2 * self.workers:
+                        break
+
+            submit()
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    url = pending.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        if on_error is None:
+                            raise
+                        on_error(url, e)
+                        continue
+                    yield result
+                if should_stop is not None and should_stop():
+                    for future in pending:
+                        future.cancel()
+                    return
+                submit()
+
+    def iterPages(self, urls, on_error=None, should_stop=None):
+        # (url, html) pairs for Converter.convertMany.
+        for result in self.fetchMany(urls, on_error, should_stop):
+            yield result.url, result.text
+
+    def fetchSitemap(self, url):
+        # Sitemaps may be served gzipped as files (.xml.gz), which requests
+        # does not decode; they are cached decompressed.
+        response, cached_body = self.request(url)
+        if cached_body is not None:
+            return cached_body
+        content = response.content
+        if content[:2] == b'\x1f\x8b':
+            content = gzip.decompress(content)
+        text = content.decode('utf-8', errors='replace')
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        if self.cache is not None and (etag or last_modified):
+            self.cache.put(url, etag, last_modified, text)
+        return text
+
+    def expandSitemap(self, url, max_depth=3):
+        # Page URLs listed by a sitemap, following nested sitemap indexes.
+        # Raises ValueError if url is not a sitemap; nested entries that are
+        # not are skipped.
+        pages = []
+        seen = set()
+        queue = [(url, 0)]
+        while queue:
+            sitemap_url, depth = queue.pop(0)
+            if sitemap_url in seen:
+                continue
+            seen.add(sitemap_url)
+            try:
+                page_urls, sitemap_urls = parse_sitemap(self.fetchSitemap(sitemap_url))
+            except ValueError:
+                if depth == 0:
+                    raise
+                continue
+            pages.extend(page_urls)
+            if depth < max_depth:
+                queue.extend((nested, depth + 1) for nested in sitemap_urls)
+        seen = set()
+        return [page for page in pages if not (page in seen or seen.add(page))]
+
+    def expandSources(self, values):
+        # Sitemap URLs are replaced by the pages they list; other URLs,
+        # including .xml documents that turn out not to be sitemaps (feeds,
+        # XHTML pages), are kept as they are.
+        urls = []
+        for value in values:
+            if is_sitemap(value):
+                try:
+                    urls.extend(self.expandSitemap(value))
+                    continue
+                except ValueError:
+                    pass
+            urls.append(value)
+        return urls
+
+    def close(self):
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
@@ -0,0 +1,239 @@
+import time
+from contextlib import nullcontext
+
+import backends
+import speculative
+import stopping
+
+
+def build_prompt(html_content):
+    return f"Convert the following HTML to Markdown:\n\n{html_content}\n\nMarkdown:"
+
+
+WARM_UP_HTML = "<html><body><h1>Warm-up</h1><p>A short <a href=\"/\">document</a>.</p></body></html>"
+WARM_UP_TOKENS = 8
+
+
+def warm_up(tokenizer, model, device, tokens=WARM_UP_TOKENS):
+    # One short greedy generate, so the first real conversion does not pay
+    # for paging in the weights, allocator growth and kernel selection (or,
+    # with a compiled backend, compilation). Returns the seconds it took.
+    start = time.perf_counter()
+    inputs = tokenizer.encode(build_prompt(WARM_UP_HTML), return_tensors="pt").to(device)
+    model.generate(inputs, max_new_tokens=tokens, do_sample=False, pad_token_id=pad_token_id(tokenizer))
+    return time.perf_counter() - start
+
+
+def extract_markdown(text):
+    return text.split("Markdown:")[-1].strip()
+
+
+def generate_markdown(tokenizer, model, html_content, device, params, streamer=None, stats=None, cancelled=None):
+    # stats, if given, is a dict that receives token counts, 'early_stop'
+    # (a stopping result, or None if generation ended on its own) and, with
+    # speculative decoding enabled, its acceptance statistics. cancelled is
+    # a callable polled every decode step; stopping.Cancelled is raised once
+    # it returns True.
+    inputs = tokenizer.encode(build_prompt(html_content), return_tensors="pt").to(device)
+    guard = make_guard(tokenizer, model, inputs.shape[1], params, [html_content])
+
+    # Streamers only handle a single sequence, so they are dropped when
+    # several return sequences are requested.
+    if params['num_return_sequences'] > 1:
+        streamer = None
+
+    # Assisted decoding keeps its own dynamic cache, so it is skipped for
+    # models compiled around a static cache.
+    speculation = speculative.speculation_enabled(params) and not backends.is_compiled(model)
+    with speculative.count_acceptance(model) if speculation else nullcontext() as counter:
+        outputs = model.generate(
+            inputs,
+            max_new_tokens=params['max_new_tokens'],
+            temperature=params['temperature'],
+            do_sample=params['do_sample'],
+            top_p=params['top_p'],
+            repetition_penalty=params['repetition_penalty'],
+            num_return_sequences=params['num_return_sequences'],
+            streamer=streamer,
+            **speculative.generate_kwargs(params),
+            **stopping.generate_kwargs(guard, cancelled)
+        )
+    stopping.check_cancelled(cancelled)
+
+    result = guard.result(0) if guard is not None else None
+    if stats is not None:
+        stats['prompt_tokens'] = inputs.shape[1]
+        stats['generated_tokens'] = outputs.shape[1] - inputs.shape[1]
+        stats['early_stop'] = result if result and result['reason'] else None
+        if speculation:
+            stats['speculative'] = counter.stats(stats['prompt_tokens'], stats['generated_tokens'])
+
+    end = inputs.shape[1] + kept_tokens(result, outputs.shape[1] - inputs.shape[1])
+    markdown_output = tokenizer.decode(outputs[0][:end], skip_special_tokens=True)
+    return extract_markdown(markdown_output)
+
+
+def make_guard(tokenizer, model, prompt_length, params, documents):
+    if not stopping.stopping_enabled(params):
+        return None
+    return stopping.DegenerationGuard(tokenizer, prompt_length, params['max_new_tokens'], documents,
+                                      stopping.stop_token_ids(tokenizer, model))
+
+
+def kept_tokens(result, generated_tokens):
+    # Generated tokens that belong in the output: a row that stopped early
+    # ends where it stopped (batch rows are padded beyond that), minus what
+    # the stop trimmed (loop repeats, or tokens past the budget or the end).
+    if result is None or not result['reason']:
+        return generated_tokens
+    return result['generated_tokens'] - result['trim']
+
+
+def pad_token_id(tokenizer):
+    if tokenizer.pad_token_id is not None:
+        return tokenizer.pad_token_id
+    return tokenizer.eos_token_id
+
+
+def left_pad(sequences, pad_id):
+    # Decoder-only models continue from the last position, so padding goes
+    # on the left and is masked out.
+    import torch
+
+    width = max(len(ids) for ids in sequences)
+    input_ids = torch.full((len(sequences), width), pad_id, dtype=torch.long)
+    attention_mask = torch.zeros((len(sequences), width), dtype=torch.long)
+    for row, ids in enumerate(sequences):
+        input_ids[row, width - len(ids):] = torch.tensor(ids, dtype=torch.long)
+        attention_mask[row, width - len(ids):] = 1
+    return input_ids, attention_mask
+
+
+def generate_batch(tokenizer, model, prompt_ids, device, params, documents=None, stops=None, cancelled=None):
+    # prompt_ids is a list of token id lists built from build_prompt(); returns
+    # one Markdown string per prompt from a single padded generate call.
+    # Prompt-lookup drafting only supports one sequence, so it is used for
+    # single-prompt batches only. documents are the HTML inputs of the
+    # prompts (used to judge runaway output); stops, if given, is a list
+    # that receives one stopping result per prompt. cancelled works as in
+    # generate_markdown.
+    use_speculation = len(prompt_ids) == 1 and not backends.is_compiled(model)
+    extra_kwargs = speculative.generate_kwargs(params) if use_speculation else {}
+    input_ids, attention_mask = left_pad(prompt_ids, pad_token_id(tokenizer))
+    guard = make_guard(tokenizer, model, input_ids.shape[1], params, documents)
+    input_ids = input_ids.to(device)
+    attention_mask = attention_mask.to(device)
+
+    outputs = model.generate(
+        input_ids,
+        attention_mask=attention_mask,
+        max_new_tokens=params['max_new_tokens'],
+        temperature=params['temperature'],
+        do_sample=params['do_sample'],
+        top_p=params['top_p'],
+        repetition_penalty=params['repetition_penalty'],
+        pad_token_id=pad_token_id(tokenizer),
+        **extra_kwargs,
+        **stopping.generate_kwargs(guard, cancelled)
+    )
+    stopping.check_cancelled(cancelled)
+
+    new_tokens = outputs[:, input_ids.shape[1]:]
+    results = [guard.result(row) if guard is not None else None for row in range(len(prompt_ids))]
+    if stops is not None:
+        stops.extend(results)
+    return [tokenizer.decode(row[:kept_tokens(result, row.shape[0])], skip_special_tokens=True).strip()
+            for row, result in zip(new_tokens, results)]
+
+
+class MarkdownStreamer:
+    # Implements the put()/end() streamer protocol of model.generate without
+    # importing transformers. The first put() carries the prompt (prefill
+    # starts), every later one a freshly decoded token.
+    # on_text(str) gets incrementally decoded text, on_stage(str) is called
+    # with 'prefill', 'decode' and 'done', and on_progress(int, int, float)
+    # gets generated tokens, max_new_tokens and tokens per second.
+
+    def __init__(self, tokenizer, max_new_tokens, on_text=None, on_stage=None, on_progress=None):
+        self.tokenizer = tokenizer
+        self.max_new_tokens = max_new_tokens
+        self.on_text = on_text
+        self.on_stage = on_stage
+        self.on_progress = on_progress
+        self.prompt_tokens = 0
+        self.generated_tokens = 0
+        self.prefill_seconds = None
+        self.decode_start = None
+        self.decode_end = None
+        self._prompt_seen = False
+        self._start = None
+        self._token_cache = []
+        self._printed_len = 0
+
+    def put(self, value):
+        if value.dim() > 1:
+            value = value[0]
+        token_ids = value.tolist()
+
+        if not self._prompt_seen:
+            self._prompt_seen = True
+            self._start = time.perf_counter()
+            self.prompt_tokens = len(token_ids)
+            self._emitStage('prefill')
+            return
+
+        if self.decode_start is None:
+            self.decode_start = time.perf_counter()
+            self.prefill_seconds = self.decode_start - self._start
+            self._emitStage('decode')
+
+        self.generated_tokens += len(token_ids)
+        self._token_cache.extend(token_ids)
+        if self.on_text is not None:
+            self._emitText(final=False)
+        if self.on_progress is not None:
+            self.on_progress(self.generated_tokens, self.max_new_tokens, self.tokensPerSecond())
+
+    def end(self):
+        self.decode_end = time.perf_counter()
+        if self.on_text is not None:
+            self._emitText(final=True)
+        self._token_cache = []
+        self._printed_len = 0
+        self._emitStage('done')
+
+    def decodeSeconds(self):
+        if self.decode_start is None:
+            return 0.0
+        return (self.decode_end or time.perf_counter()) - self.decode_start
+
+    def tokensPerSecond(self):
+        if self.decode_start is None or self.generated_tokens == 0:
+            return 0.0
+        elapsed = time.perf_counter() - self.decode_start
+        return self.generated_tokens / elapsed if elapsed > 0 else 0.0
+
+    def _emitStage(self, stage):
+        if self.on_stage is not None:
+            self.on_stage(stage)
+
+    def _emitText(self, final):
+        text = self.tokenizer.decode(self._token_cache, skip_special_tokens=True)
+        if final:
+            new_text = text[self._printed_len:]
+            self._token_cache = []
+            self._printed_len = 0
+        elif text.endswith("\n"):
+            # Restart the decode window at line ends so each put() only
+            # re-decodes the current line.
+            new_text = text[self._printed_len:]
+            self._token_cache = []
+            self._printed_len = 0
+        elif text.endswith("\ufffd"):
+            # Incomplete multi-byte character, wait for more tokens.
+            return
+        else:
+            new_text = text[self._printed_len:]
+            self._printed_len = len(text)
+        if new_text:
+            self.on_text(new_text)
@@ -0,0 +1,240 @@
+import re
+from collections import OrderedDict
+
+import lxml.html
+from lxml import etree
+
+DROP_TAGS = ('script', 'style', 'noscript', 'template', 'link', 'meta', 'base')
+MEDIA_TAGS = ('svg', 'math', 'canvas', 'object', 'embed', 'video', 'audio', 'picture', 'source', 'iframe')
+BOILERPLATE_TAGS = ('nav', 'footer', 'aside')
+# The ARIA roles of the same regions. Headers and role=banner are kept: they
+# often hold the page's title.
+BOILERPLATE_ROLES = ('navigation', 'contentinfo', 'complementary')
+KEEP_ATTRIBUTES = {'href', 'src', 'alt', 'title', 'colspan', 'rowspan', 'start', 'type', 'lang', 'headers', 'scope'}
+VOID_TAGS = {'img', 'br', 'hr', 'input', 'area', 'col', 'wbr'}
+PRESERVE_WHITESPACE_TAGS = {'pre', 'code', 'textarea'}
+# Empty cells and items still hold a position: dropping one shifts a table's
+# columns or renumbers a list.
+KEEP_EMPTY_TAGS = {'td', 'th', 'tr', 'li', 'dd'}
+# A form counts as boilerplate (a search box, a login or newsletter form)
+# when it has little text per control and does not hold most of the page:
+# ASP.NET WebForms pages wrap the whole body in one form.
+FORM_TEXT_PER_CONTROL = 40
+FORM_MAX_SHARE = 0.5
+
+# Images served by known tracker hosts. Content images can have "pixel" or
+# "analytics" in their names, so only the host is matched.
+TRACKING_SRC = re.compile(
+    r'^(?:https?:)?//(?:[\w-]+\.)*(?:doubleclick\.net|google-analytics\.com|googletagmanager\.com'
+    r'|facebook\.com/tr\b|bat\.bing\.com|scorecardresearch\.com|quantserve\.com|px\.ads\.linkedin\.com'
+    r'|analytics\.twitter\.com|pixel\.wp\.com|stats\.wp\.com)(?:[:/?#]|$)', re.I)
+XML_DECLARATION = re.compile(r'^\s*<\?xml[^>]*\?>', re.I)
+FULL_DOCUMENT = re.compile(r'<(html|body)[\s>]', re.I)
+WHITESPACE = re.compile(r'\s+')
+
+
+def _remove(node):
+    # Like HtmlElement.drop_tree(), but also works for comments and
+    # processing instructions: the tail text stays in the document.
+    parent = node.getparent()
+    if parent is None:
+        return
+    if node.tail:
+        previous = node.getprevious()
+        if previous is not None:
+            previous.tail = (previous.tail or '') + node.tail
+        else:
+            parent.text = (parent.text or '') + node.tail
+    parent.remove(node)
+
+
+def _iter_elements(root, tags):
+    return list(root.iter(*tags))
+
+
+def remove_comments(root):
+    for node in list(root.iter(etree.Comment, etree.ProcessingInstruction)):
+        _remove(node)
+
+
+def remove_scripts(root):
+    for element in _iter_elements(root, DROP_TAGS):
+        _remove(element)
+
+
+def remove_media(root):
+    for element in _iter_elements(root, MEDIA_TAGS):
+        _remove(element)
+
+
+def remove_data_images(root):
+    for element in _iter_elements(root, ('img',)):
+        if element.get('src', '').lstrip().lower().startswith('data:'):
+            _remove(element)
+        elif 'srcset' in element.attrib:
+            del element.attrib['srcset']
+
+
+def _is_tiny(value):
+    try:
+        return int(str(value).strip().rstrip('px') or 0) <= 1
+    except ValueError:
+        return False
+
+
+def remove_tracking_pixels(root):
+    for element in _iter_elements(root, ('img',)):
+        width, height = element.get('width'), element.get('height')
+        if (width is not None and height is not None and _is_tiny(width) and _is_tiny(height)) \
+                or TRACKING_SRC.match(element.get('src', '').strip()):
+            _remove(element)
+
+
+def _text_length(element):
+    return len(WHITESPACE.sub(' ', element.text_content()).strip())
+
+
+def _is_control_form(form, page_length):
+    if form.find('.//textarea') is not None:
+        return False
+    length = _text_length(form)
+    if page_length and length > FORM_MAX_SHARE * page_length:
+        return False
+    controls = [element for element in form.iter('input', 'select', 'option', 'button')
+                if (element.get('type') or '').lower() != 'hidden']
+    return length <= FORM_TEXT_PER_CONTROL * max(1, len(controls))
+
+
+def remove_boilerplate(root):
+    for element in _iter_elements(root, BOILERPLATE_TAGS):
+        _remove(element)
+    page_length = _text_length(root)
+    for element in list(root.iter()):
+        if not isinstance(element.tag, str):
+            continue
+        if element.get('role', '').lower() in BOILERPLATE_ROLES:
+            _remove(element)
+        elif element.tag == 'form' and _is_control_form(element, page_length):
+            _remove(element)
+
+
+def strip_attributes(root):
+    for element in root.iter():
+        if not isinstance(element.tag, str):
+            continue
+        for name in list(element.attrib):
+            if name not in KEEP_ATTRIBUTES or element.attrib[name].lstrip().lower().startswith('javascript:'):
+                del element.attrib[name]
+
+
+def remove_empty(root):
+    # Bottom-up so containers emptied by removing their children go too.
+    for element in reversed(list(root.iter())):
+        if not isinstance(element.tag, str) or element.tag in VOID_TAGS or element.tag in KEEP_EMPTY_TAGS \
+                or element.tag in ('html', 'body', 'head'):
+            continue
+        if len(element) == 0 and not (element.text or '').strip():
+            _remove(element)
+
+
+def collapse_whitespace(root):
+    for element in root.iter():
+        if not isinstance(element.tag, str):
+            continue
+        if any(tag in PRESERVE_WHITESPACE_TAGS for tag in [element.tag] + [p.tag for p in element.iterancestors()]):
+            continue
+        if element.text:
+            element.text = WHITESPACE.sub(' ', element.text)
+        if element.tail:
+            element.tail = WHITESPACE.sub(' ', element.tail)
+
+
+PASSES = OrderedDict([
+    ('comments', remove_comments),
+    ('scripts', remove_scripts),
+    ('media', remove_media),
+    ('data_images', remove_data_images),
+    ('tracking_pixels', remove_tracking_pixels),
+    ('boilerplate', remove_boilerplate),
+    ('attributes', strip_attributes),
+    ('empty', remove_empty),
+    ('whitespace', collapse_whitespace),
+])
+
+PASS_LABELS = {
+    'comments': "Comments",
+    'scripts': "Scripts, styles and metadata",
+    'media': "SVG, canvas and embedded media",
+    'data_images': "Inline base64 images",
+    'tracking_pixels': "Tracking pixels",
+    'boilerplate': "Navigation, footer and sidebar boilerplate",
+    'attributes': "Inline style/class/data-* attributes",
+    'empty': "Empty elements",
+    'whitespace': "Redundant whitespace",
+}
+
+DEFAULT_PASSES = list(PASSES)
+
+
+def _serialize(root, full_document):
+    if full_document:
+        return lxml.html.tostring(root, encoding='unicode')
+    body = root.find('body')
+    if body is None:
+        body = root
+    parts = [body.text or '']
+    parts.extend(lxml.html.tostring(child, encoding='unicode') for child in body)
+    return ''.join(parts)
+
+
+def _measure(name, html_content, count_tokens):
+    return {
+        'pass': name,
+        'bytes': len(html_content.encode('utf-8')),
+        'tokens': count_tokens(html_content) if count_tokens is not None else None,
+    }
+
+
+def reduce_html(html_content, passes=None, count_tokens=None, report=False):
+    # Runs the named passes, in PASSES order, over one parsed tree. Returns
+    # (html, report); report is None unless requested, otherwise a list of
+    # {'pass', 'bytes', 'tokens'} entries starting with the 'input' size.
+    # count_tokens(str) -> int adds token counts to the report.
+    passes = DEFAULT_PASSES if passes is None else passes
+    unknown = set(passes) - set(PASSES)
+    if unknown:
+        raise ValueError(f"Unknown HTML reduction pass(es): {', '.join(sorted(unknown))}")
+
+    html_content = XML_DECLARATION.sub('', html_content)
+    stats = [_measure('input', html_content, count_tokens)] if report else None
+    if not html_content.strip():
+        return html_content, stats
+
+    full_document = bool(FULL_DOCUMENT.search(html_content[:4096]))
+    try:
+        root = lxml.html.document_fromstring(html_content)
+    except etree.ParserError:
+        return html_content, stats
+
+    for name, reduction in PASSES.items():
+        if name not in passes:
+            continue
+        reduction(root)
+        if report:
+            stats.append(_measure(name, _serialize(root, full_document), count_tokens))
+
+    return _serialize(root, full_document).strip(), stats
+
+
+def format_report(stats):
+    lines = []
+    previous = None
+    for entry in stats:
+        line = f"{entry['pass']:<16}{entry['bytes']:>10} bytes"
+        if entry['tokens'] is not None:
+            line += f"{entry['tokens']:>9} tokens"
+        if previous is not None and previous['bytes']:
+            line += f"  ({100 * (entry['bytes'] - previous['bytes']) / previous['bytes']:+.1f}%)"
+        lines.append(line)
+        previous = entry
+    return "\n".join(lines)
@@ -0,0 +1,91 @@
+import threading
+from collections import OrderedDict
+
+from result_cache import ResultCache
+
+# Incremental re-conversion: a document is split into top-level blocks
+# (fast_path.split_blocks) and each block's Markdown is kept in a BlockCache
+# under a fingerprint of its HTML, the model, its backend and the generation
+# parameters.
+# Converting an edited document again only converts the blocks whose HTML
+# changed, so the cost follows the size of the edit.
+
+DEFAULT_BLOCK_CACHE_BYTES = 64 * 1024 * 1024
+
+
+def fingerprint(block_html, engine, model_path, params, backend=None):
+    # Rule-based blocks do not depend on the model's backend.
+    return ResultCache.makeKey(block_html, model_path, params,
+                               {'block': engine, 'backend': backend if engine != 'rules' else None})
+
+
+def join_blocks(parts):
+    return "\n\n".join(part.strip() for part in parts if part and part.strip())
+
+
+def splice(old_text, new_text):
+    # (start, end, replacement): replacing old_text[start:end] with
+    # replacement gives new_text, with start and end just outside the
+    # common prefix and suffix.
+    limit = min(len(old_text), len(new_text))
+    start = 0
+    while start < limit and old_text[start] == new_text[start]:
+        start += 1
+    end = 0
+    while end < limit - start and old_text[-1 - end] == new_text[-1 - end]:
+        end += 1
+    return start, len(old_text) - end, new_text[start:len(new_text) - end]
+
+
+class BlockCache:
+    # In-memory LRU of block Markdown by fingerprint. Once the stored
+    # Markdown exceeds max_bytes (counted in characters) the least recently
+    # used blocks are dropped.
+
+    def __init__(self, max_bytes=DEFAULT_BLOCK_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, markdown_content):
+        size = len(markdown_content)
+        with self._lock:
+            if key in self._entries:
+                self.size -= self._entries.pop(key)[1]
+            self._entries[key] = (markdown_content, size)
+            self.size += size
+            self._evict()
+
+    def _evict(self):
+        while self.max_bytes is not None and self.size > self.max_bytes and self._entries:
+            _, (_, size) = self._entries.popitem(last=False)
+            self.size -= size
+
+    def setMaxBytes(self, max_bytes):
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self.size, 'hits': self.hits, 'misses': self.misses}
@@ -0,0 +1,262 @@
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    # Windows has no getrusage; peak RSS is reported as None there.
+    resource = None
+
+_run_ids = itertools.count(1)
+
+
+def current_rss_mb():
+    try:
+        with open('/proc/self/statm', 'r') as file:
+            pages = int(file.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def _cuda_peak_mb():
+    torch = sys.modules.get('torch')
+    if torch is None or not torch.cuda.is_available():
+        return None
+    return torch.cuda.max_memory_allocated() / (1024 * 1024)
+
+
+class _NullRun:
+    # Stand-in returned while instrumentation is disabled: every call is a
+    # no-op, so instrumented code costs one attribute lookup per stage.
+
+    enabled = False
+
+    @contextmanager
+    def stage(self, name):
+        yield
+
+    def record(self, name, seconds):
+        pass
+
+    def count(self, name, value):
+        pass
+
+    def label(self, **labels):
+        pass
+
+    def finish(self, status='ok', error=None):
+        pass
+
+
+NULL_RUN = _NullRun()
+
+
+class Run:
+    # Timings, token counts and memory of one conversion. Each stage gets its
+    # wall time, the resident set size when it ended and the process peak
+    # RSS so far (plus the CUDA allocator peak when torch uses a GPU).
+
+    enabled = True
+
+    def __init__(self, instrumentation, kind, labels):
+        self.instrumentation = instrumentation
+        self.record_data = {
+            'run_id': next(_run_ids),
+            'kind': kind,
+            'labels': dict(labels),
+            'started': time.time(),
+            'stages': {},
+            'counters': {},
+        }
+        self._start = time.perf_counter()
+        self._finished = False
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name, seconds):
+        stage = self.record_data['stages'].setdefault(name, {'seconds': 0.0})
+        stage['seconds'] += seconds
+        stage['rss_mb'] = current_rss_mb()
+        stage['peak_rss_mb'] = peak_rss_mb()
+        cuda_peak = _cuda_peak_mb()
+        if cuda_peak is not None:
+            stage['cuda_peak_mb'] = cuda_peak
+
+    def count(self, name, value):
+        counters = self.record_data['counters']
+        counters[name] = counters.get(name, 0) + value
+
+    def label(self, **labels):
+        self.record_data['labels'].update(labels)
+
+    def finish(self, status='ok', error=None):
+        if self._finished:
+            return
+        self._finished = True
+        self.record_data['duration'] = time.perf_counter() - self._start
+        self.record_data['status'] = status
+        if error is not None:
+            self.record_data['error'] = str(error)
+        self.instrumentation.publish(self.record_data)
+
+
+class Instrumentation:
+    # Per-stage instrumentation of conversions. Collectors are callables
+    # taking the finished run record (a dict); they run on the thread that
+    # finished the run and must not raise.
+
+    def __init__(self, enabled=False, collectors=None):
+        self.enabled = enabled
+        self.collectors = list(collectors or [])
+        self._lock = threading.Lock()
+
+    def addCollector(self, collector):
+        with self._lock:
+            self.collectors.append(collector)
+        return collector
+
+    def removeCollector(self, collector):
+        with self._lock:
+            if collector in self.collectors:
+                self.collectors.remove(collector)
+
+    def run(self, kind='convert', **labels):
+        if not self.enabled:
+            return NULL_RUN
+        return Run(self, kind, labels)
+
+    @contextmanager
+    def track(self, kind='convert', **labels):
+        run = self.run(kind, **labels)
+        try:
+            yield run
+        except BaseException as e:
+            run.finish('error', e)
+            raise
+        run.finish()
+
+    def publish(self, record):
+        with self._lock:
+            collectors = list(self.collectors)
+        for collector in collectors:
+            try:
+                collector(record)
+            except Exception as e:
+                print(f"Metrics collector {collector!r} failed: {e}", file=sys.stderr)
+
+
+class JsonLinesCollector:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def __call__(self, record):
+        line = json.dumps(record, sort_keys=True)
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as file:
+                file.write(line + "\n")
+
+
+class PrometheusTextCollector:
+    # Aggregates runs into Prometheus text exposition format and rewrites
+    # path after every run (atomically, for node_exporter's textfile
+    # collector).
+
+    def __init__(self, path, prefix='html_to_md'):
+        self.path = path
+        self.prefix = prefix
+        self.runs = {}
+        self.stage_seconds = {}
+        self.stage_counts = {}
+        self.counters = {}
+        self.peak_rss_mb = 0.0
+        self._lock = threading.Lock()
+
+    def __call__(self, record):
+        with self._lock:
+            run_key = (record['kind'], record.get('status', 'ok'))
+            self.runs[run_key] = self.runs.get(run_key, 0) + 1
+            for name, stage in record['stages'].items():
+                self.stage_seconds[name] = self.stage_seconds.get(name, 0.0) + stage['seconds']
+                self.stage_counts[name] = self.stage_counts.get(name, 0) + 1
+                self.peak_rss_mb = max(self.peak_rss_mb, stage.get('peak_rss_mb') or 0.0)
+            for name, value in record['counters'].items():
+                self.counters[name] = self.counters.get(name, 0) + value
+            text = self.render()
+            temporary_path = self.path + '.tmp'
+            with open(temporary_path, 'w', encoding='utf-8') as file:
+                file.write(text)
+            os.replace(temporary_path, self.path)
+
+    def render(self):
+        prefix = self.prefix
+        lines = [
+            f"# HELP {prefix}_runs_total Instrumented runs by kind and status.",
+            f"# TYPE {prefix}_runs_total counter",
+        ]
+        for (kind, status), value in sorted(self.runs.items()):
+            lines.append(f'{prefix}_runs_total{{kind="{kind}",status="{status}"}} {value}')
+        lines += [
+            f"# HELP {prefix}_stage_seconds Wall time spent per pipeline stage.",
+            f"# TYPE {prefix}_stage_seconds summary",
+        ]
+        for name in sorted(self.stage_seconds):
+            lines.append(f'{prefix}_stage_seconds_sum{{stage="{name}"}} {self.stage_seconds[name]:.6f}')
+            lines.append(f'{prefix}_stage_seconds_count{{stage="{name}"}} {self.stage_counts[name]}')
+        lines += [
+            f"# HELP {prefix}_count_total Token and byte counters.",
+            f"# TYPE {prefix}_count_total counter",
+        ]
+        for name, value in sorted(self.counters.items()):
+            lines.append(f'{prefix}_count_total{{name="{name}"}} {value}')
+        lines += [
+            f"# HELP {prefix}_peak_rss_megabytes Peak resident set size of the process.",
+            f"# TYPE {prefix}_peak_rss_megabytes gauge",
+            f"{prefix}_peak_rss_megabytes {self.peak_rss_mb:.1f}",
+        ]
+        return "\n".join(lines) + "\n"
+
+
+def format_record(record):
+    # One-line summary for status bars and logs.
+    parts = []
+    for name, stage in record['stages'].items():
+        seconds = stage['seconds']
+        parts.append(f"{name} {seconds * 1000:.0f} ms" if seconds < 1 else f"{name} {seconds:.2f} s")
+    counters = record['counters']
+    if 'generated_tokens' in counters:
+        tokens = f"{counters['generated_tokens']} tokens"
+        decode = record['stages'].get('decode', {}).get('seconds')
+        if decode:
+            tokens += f", {counters['generated_tokens'] / decode:.1f} tok/s"
+        parts.append(tokens)
+    peak = max((stage.get('peak_rss_mb') or 0.0 for stage in record['stages'].values()), default=0.0)
+    if peak:
+        parts.append(f"peak RSS {peak:.0f} MB")
+    summary = " | ".join(parts)
+    if record.get('status') not in (None, 'ok'):
+        summary = f"[{record['status']}] {summary}"
+    return summary
+
+
+instrumentation = Instrumentation()
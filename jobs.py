@@ -0,0 +1,197 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from stopping import Cancelled
+
+# Conversion jobs run one at a time on a single long-lived worker thread, so
+# only one generate call uses the loaded model at any time. Lower priority
+# numbers run first; an interactive conversion queued during a batch runs at
+# the batch's next checkpoint (between generate batches) and the batch then
+# carries on.
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = 0
+NORMAL = 5
+BATCH = 10
+PRIORITIES = OrderedDict([
+    (INTERACTIVE, "Interactive"),
+    (NORMAL, "Normal"),
+    (BATCH, "Batch"),
+])
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+FINISHED = (DONE, FAILED, CANCELLED)
+
+
+class Job:
+    # work(job) does the conversion on the worker thread and returns its
+    # result. It polls job.isCancelled (e.g. as Converter.withCancellation's
+    # callable) and may call job.checkpoint() at points where a
+    # higher-priority job can run in between.
+
+    _ids = itertools.count(1)
+
+    def __init__(self, kind, description, work, priority=NORMAL):
+        self.id = next(self._ids)
+        self.kind = kind
+        self.description = description
+        self.work = work
+        self.priority = priority
+        self.status = QUEUED
+        self.result = None
+        self.error = None
+        self.progress = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.queue = None
+        self._cancel = threading.Event()
+
+    def isCancelled(self):
+        return self._cancel.is_set()
+
+    def cancel(self):
+        self._cancel.set()
+
+    def checkpoint(self):
+        # Runs queued jobs that outrank this one; returns whether this job
+        # was cancelled meanwhile, so it can serve as a should_stop callable.
+        if self.queue is not None:
+            self.queue.runPreempting(self)
+        return self.isCancelled()
+
+    def report(self, done, total):
+        self.progress = (done, total)
+        if self.queue is not None:
+            self.queue.notify(self)
+
+    def seconds(self):
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.time()) - self.started
+
+
+class JobQueue:
+    # Listeners are called with a job whenever its status or progress
+    # changes, on the thread that changed it (usually the worker). A listener
+    # that raises is logged and does not affect the job or other listeners.
+
+    def __init__(self):
+        self.listeners = []
+        self._heap = []
+        self._jobs = OrderedDict()
+        self._order = itertools.count()
+        self._condition = threading.Condition()
+        self._stopping = False
+        self._thread = threading.Thread(target=self.run, name='conversion-jobs', daemon=True)
+        self._thread.start()
+
+    def addListener(self, listener):
+        self.listeners.append(listener)
+        return listener
+
+    def notify(self, job):
+        for listener in list(self.listeners):
+            try:
+                listener(job)
+            except Exception:
+                logger.exception("Job listener %r failed for job %d (%s)", listener, job.id, job.status)
+
+    def submit(self, job):
+        job.queue = self
+        with self._condition:
+            self._jobs[job.id] = job
+            heapq.heappush(self._heap, (job.priority, next(self._order), job))
+            self._condition.notify()
+        self.notify(job)
+        return job
+
+    def jobs(self):
+        with self._condition:
+            return list(self._jobs.values())
+
+    def cancel(self, job):
+        # Queued jobs are dropped at once; a running job stops within one
+        # decode step.
+        job.cancel()
+        with self._condition:
+            queued = job.status == QUEUED
+            if queued:
+                job.status = CANCELLED
+                job.finished = time.time()
+        if queued:
+            self.notify(job)
+
+    def cancelAll(self):
+        for job in self.jobs():
+            if job.status not in FINISHED:
+                self.cancel(job)
+
+    def clearFinished(self):
+        with self._condition:
+            for job_id in [job_id for job_id, job in self._jobs.items() if job.status in FINISHED]:
+                del self._jobs[job_id]
+
+    def _pop(self, below=None):
+        # Next queued job, optionally only one with a priority number below
+        # `below`; cancelled entries are discarded on the way.
+        with self._condition:
+            while self._heap:
+                priority, _, job = self._heap[0]
+                if job.status != QUEUED:
+                    heapq.heappop(self._heap)
+                    continue
+                if below is not None and priority >= below:
+                    return None
+                heapq.heappop(self._heap)
+                job.status = RUNNING
+                return job
+            return None
+
+    def runPreempting(self, job):
+        while True:
+            next_job = self._pop(below=job.priority)
+            if next_job is None:
+                return
+            self.execute(next_job)
+
+    def execute(self, job):
+        job.started = time.time()
+        self.notify(job)
+        try:
+            job.result = job.work(job)
+            job.status = CANCELLED if job.isCancelled() else DONE
+        except Cancelled:
+            job.status = CANCELLED
+        except Exception as e:
+            job.error = e
+            job.status = FAILED
+        job.finished = time.time()
+        self.notify(job)
+
+    def run(self):
+        while True:
+            with self._condition:
+                while not self._stopping and not any(job.status == QUEUED for _, _, job in self._heap):
+                    self._condition.wait()
+                if self._stopping:
+                    return
+            job = self._pop()
+            if job is not None:
+                self.execute(job)
+
+    def shutdown(self, timeout=None):
+        self.cancelAll()
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+        self._thread.join(timeout)
@@ -1,67 +1,436 @@
 import sys
 import os
-from PyQt5.QtWidgets import (QApplication, QMainWindow, QTextEdit, QPushButton, QVBoxLayout, QWidget, QProgressBar,
+import shutil
+import tempfile
+import time
+from PyQt5.QtWidgets import (QApplication, QMainWindow, QTextEdit, QPlainTextEdit, QPushButton, QVBoxLayout, QWidget, QProgressBar,
                              QMessageBox, QFileDialog, QComboBox, QHBoxLayout, QLabel, QGroupBox, QRadioButton,
-                             QTabWidget, QSplitter, QLineEdit, QCheckBox, QDoubleSpinBox, QSpinBox)
-from PyQt5.QtCore import Qt, QThread, pyqtSignal, QTimer, QUrl
-from PyQt5.QtGui import QFont, QColor, QPalette, QDesktopServices
-from transformers import AutoModelForCausalLM, AutoTokenizer
+                             QTabWidget, QSplitter, QLineEdit, QCheckBox, QDoubleSpinBox, QSpinBox, QTableWidget,
+                             QTableWidgetItem, QHeaderView, QAbstractItemView)
+from PyQt5.QtCore import Qt, QObject, QThread, pyqtSignal, QTimer, QUrl
+from PyQt5.QtGui import QFont, QColor, QPalette, QDesktopServices, QTextCursor
 import torch
 import markdown
-import requests
-from bs4 import BeautifulSoup
 import json
+from model_registry import registry
+from html_reduction import PASS_LABELS, PASSES, format_report, reduce_html
+from result_cache import ResultCache
+from batch_engine import list_html_files, read_html_files, write_markdown_next_to
+from converter import MODELS, Converter
+from backends import DEFAULT_BACKEND, PRECISIONS, backend_name, configure_threads, supports_precision
+from speculative import DEFAULT_DRAFT_TOKENS, DEFAULT_NGRAM_SIZE, format_stats
+from fast_path import DEFAULT_ROUTING, ROUTING_MODES
+from fetcher import DEFAULT_WORKERS, Fetcher, HTTPCache, is_url, read_url_list, url_filename
+from instrumentation import JsonLinesCollector, NULL_RUN, format_record, instrumentation
+from stopping import Cancelled, format_result, format_summary, is_degenerate, summarize
+from incremental import DEFAULT_BLOCK_CACHE_BYTES, BlockCache, join_blocks, splice
+from jobs import BATCH, FINISHED, INTERACTIVE, NORMAL, PRIORITIES, QUEUED, Job, JobQueue
+from sharded import ShardedRunner, format_progress
+from sinks import SINKS, Records, SinkWriter, open_sink
+from watcher import DirectoryWatcher
+
+MB = 1024 ** 2
+GB = 1024 ** 3
+
+# Documents larger than LARGE_DOCUMENT_CHARS are not held in the editors:
+# opened files are converted straight from disk, and pasted or fetched
+# content is first written to a temporary file. The editor only shows the
+# first PREVIEW_CHARS. Smaller texts longer than LOAD_CHUNK_CHARS are
+# loaded into an editor one slice per event-loop turn.
+LARGE_DOCUMENT_CHARS = 1024 ** 2
+PREVIEW_CHARS = 64 * 1024
+LOAD_CHUNK_CHARS = 128 * 1024
+
+
+class HTMLEditor(QPlainTextEdit):
+    # Plain-text editor that hands pastes above LARGE_DOCUMENT_CHARS to
+    # largePaste instead of inserting them.
+    largePaste = pyqtSignal(str)
+
+    def insertFromMimeData(self, source):
+        if source.hasText():
+            text = source.text()
+            if len(text) > LARGE_DOCUMENT_CHARS:
+                self.largePaste.emit(text)
+                return
+        super().insertFromMimeData(source)
+
+
+class ChunkedLoader(QObject):
+    # Fills a QPlainTextEdit with text one chunk per event-loop turn, so a
+    # large document does not block the window while it is laid out.
+    finished = pyqtSignal()
+
+    def __init__(self, editor, text, chunk_chars=LOAD_CHUNK_CHARS):
+        QObject.__init__(self, editor)
+        self.editor = editor
+        self.text = text
+        self.chunk_chars = chunk_chars
+        self.position = 0
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.loadChunk)
+
+    def start(self):
+        self.editor.setUndoRedoEnabled(False)
+        self.editor.clear()
+        self.timer.start(0)
+
+    def loadChunk(self):
+        chunk = self.text[self.position:self.position + self.chunk_chars]
+        cursor = QTextCursor(self.editor.document())
+        cursor.movePosition(QTextCursor.End)
+        cursor.insertText(chunk)
+        self.position += len(chunk)
+        if self.position >= len(self.text):
+            self.stop()
+            self.finished.emit()
+
+    def stop(self):
+        self.timer.stop()
+        self.editor.setUndoRedoEnabled(True)
+
+    def isActive(self):
+        return self.timer.isActive()
+
+# Conversions run as jobs on the window's JobQueue (one worker thread that
+# owns the model). The tasks below are the jobs' work; their signals are
+# emitted on the worker and delivered on the GUI thread.
+
+class PreloadTask(QObject):
+    # Loads and warms up a model ahead of the first conversion; finished
+    # carries registry.info() of the loaded model.
+    stage = pyqtSignal(str)
+    finished = pyqtSignal(dict)
+    error = pyqtSignal(str)
 
-class ModelThread(QThread):
+    def __init__(self, converter, warm):
+        QObject.__init__(self)
+        self.converter = converter
+        self.warm = warm
+
+    def work(self, job):
+        try:
+            info = self.converter.preload(self.warm, on_stage=self.stage.emit)
+        except Exception as e:
+            self.error.emit(str(e))
+            raise
+        self.finished.emit(info or {})
+        return info
+
+class ConversionTask(QObject):
+    # With a block_cache the conversion is incremental (Converter.convertBlocks)
+    # and nothing is streamed; started carries whether it is. With a path the
+    # HTML is read from that file on the worker instead of html_content.
+    started = pyqtSignal(bool)
     finished = pyqtSignal(str)
-    progress = pyqtSignal(int)
+    progress = pyqtSignal(int, int, float)
+    chunkProgress = pyqtSignal(int, int)
+    stage = pyqtSignal(str)
+    partial = pyqtSignal(str)
+    stats = pyqtSignal(dict)
+    cancelled = pyqtSignal()
     error = pyqtSignal(str)
 
-    def __init__(self, html_content, model_path, device, params):
-        QThread.__init__(self)
+    def __init__(self, html_content, converter, stream=True, run=NULL_RUN, block_cache=None, path=None):
+        QObject.__init__(self)
         self.html_content = html_content
-        self.model_path = model_path
-        self.device = device
-        self.params = params
+        self.path = path
+        self.converter = converter
+        self.stream = stream
+        self.run_metrics = run
+        self.block_cache = block_cache
+
+    def work(self, job):
+        self.started.emit(self.block_cache is not None)
+
+        def on_progress(generated_tokens, max_new_tokens, tokens_per_second):
+            self.progress.emit(generated_tokens, max_new_tokens, tokens_per_second)
+            job.report(generated_tokens, max_new_tokens)
+
+        try:
+            stats = {}
+            if self.path is not None:
+                with self.run_metrics.stage('read'):
+                    with open(self.path, 'r', encoding='utf-8', errors='replace') as file:
+                        self.html_content = file.read()
+            converter = self.converter.withCancellation(job.isCancelled)
+            if self.block_cache is not None:
+                self.stage.emit('chunks')
+                markdown_output = join_blocks(converter.convertBlocks(
+                    self.html_content, self.block_cache, on_chunk=self.chunkProgress.emit, stats=stats,
+                    run=self.run_metrics))
+            else:
+                markdown_output = converter.convert(
+                    self.html_content,
+                    on_text=self.partial.emit if self.stream else None,
+                    on_stage=self.stage.emit,
+                    on_progress=on_progress,
+                    on_chunk=self.chunkProgress.emit,
+                    stats=stats,
+                    run=self.run_metrics
+                )
+            self.run_metrics.finish()
+            self.stats.emit(stats)
+            self.finished.emit(markdown_output)
+            return markdown_output
+        except Cancelled:
+            self.run_metrics.finish('cancelled')
+            self.cancelled.emit()
+            raise
+        except Exception as e:
+            self.run_metrics.finish('error', e)
+            self.error.emit(str(e))
+            raise
+
+class BatchTask(QObject):
+    # finished carries converted, cached and failed counts and the
+    # stopping.summarize() totals. Results go next to the inputs, or with a
+    # sink (sinks.py) to a SinkWriter as records.
+    finished = pyqtSignal(int, int, int, dict)
+    progress = pyqtSignal(int, int)
+    cancelled = pyqtSignal()
+    error = pyqtSignal(str)
+
+    def __init__(self, paths, converter, batch_size, token_budget, sink=None):
+        QObject.__init__(self)
+        self.paths = paths
+        self.converter = converter
+        self.batch_size = batch_size
+        self.token_budget = token_budget
+        self.sink = sink
+        self.writer = None
+        self.records = None
+        self.job = None
+        self.converted = 0
+        self.cached = 0
+        self.failed = 0
+
+    def work(self, job):
+        self.job = job
+        items = read_html_files(self.paths)
+        try:
+            if self.sink is not None:
+                self.writer = SinkWriter(self.sink)
+                self.records = Records(self.converter.model_path)
+                items = self.records.track(items)
+            try:
+                stops = self.converter.withCancellation(job.isCancelled).convertMany(
+                    items, self.onResult, self.onError, batch_size=self.batch_size,
+                    token_budget=self.token_budget, should_stop=job.checkpoint,
+                    details=self.records.details if self.records is not None else None)
+            finally:
+                if self.writer is not None:
+                    self.writer.close()
+        except Cancelled:
+            self.cancelled.emit()
+            raise
+        except Exception as e:
+            self.error.emit(str(e))
+            raise
+        self.finished.emit(self.converted, self.cached, self.failed, summarize(stops.values()))
+
+    def reportProgress(self):
+        done = self.converted + self.cached + self.failed
+        self.progress.emit(done, len(self.paths))
+        self.job.report(done, len(self.paths))
+
+    def onResult(self, path, markdown_content, cached):
+        if self.writer is not None:
+            self.writer.put(self.records.record(path, markdown_content, cached))
+        else:
+            write_markdown_next_to(path, markdown_content)
+        if cached:
+            self.cached += 1
+        else:
+            self.converted += 1
+        self.reportProgress()
+
+    def onError(self, path, error):
+        if self.records is not None:
+            self.records.discard(path)
+        self.failed += 1
+        self.reportProgress()
+
+class ShardedTask(QObject):
+    # Converts a directory tree with worker processes (sharded.ShardedRunner);
+    # finished carries the final sharded.Progress.
+    finished = pyqtSignal(object)
+    progress = pyqtSignal(int, int)
+    cancelled = pyqtSignal()
+    error = pyqtSignal(str)
+
+    def __init__(self, runner):
+        QObject.__init__(self)
+        self.runner = runner
+        self.job = None
+
+    def work(self, job):
+        self.job = job
+        try:
+            result = self.runner.run(self.reportProgress, should_stop=job.checkpoint)
+        except Exception as e:
+            self.error.emit(str(e))
+            raise
+        if job.isCancelled():
+            self.cancelled.emit()
+        else:
+            self.finished.emit(result)
+        return result
+
+    def reportProgress(self, progress):
+        done = progress.converted + progress.skipped + progress.failed
+        self.progress.emit(done, progress.discovered)
+        self.job.report(done, progress.discovered)
+
+class FetchThread(QThread):
+    # finished carries the page, the path it was spooled to ('' if it was
+    # not) and the fetch time. Pages above LARGE_DOCUMENT_CHARS are written
+    # to a file from spool() and only their first PREVIEW_CHARS are sent.
+    finished = pyqtSignal(str, str, float)
+    error = pyqtSignal(str)
+
+    def __init__(self, fetcher, url, spool):
+        QThread.__init__(self)
+        self.fetcher = fetcher
+        self.url = url
+        self.spool = spool
 
     def run(self):
         try:
-            self.tokenizer = AutoTokenizer.from_pretrained(self.model_path)
-            self.model = AutoModelForCausalLM.from_pretrained(self.model_path).to(self.device)
+            page = self.fetcher.fetch(self.url)
+            if len(page.text) > LARGE_DOCUMENT_CHARS:
+                path = self.spool()
+                with open(path, 'w', encoding='utf-8') as file:
+                    file.write(page.text)
+                self.finished.emit(page.text[:PREVIEW_CHARS], path, page.seconds)
+            else:
+                self.finished.emit(page.text, '', page.seconds)
+        except Exception as e:
+            self.error.emit(str(e))
 
-            input_text = f"Convert the following HTML to Markdown:\n\n{self.html_content}\n\nMarkdown:"
+class PreviewThread(QThread):
+    # Renders Markdown to HTML for the preview window.
+    finished = pyqtSignal(str)
+    error = pyqtSignal(str)
 
-            inputs = self.tokenizer.encode(input_text, return_tensors="pt").to(self.device)
+    def __init__(self, markdown_content):
+        QThread.__init__(self)
+        self.markdown_content = markdown_content
 
-            outputs = self.model.generate(
-                inputs,
-                max_new_tokens=self.params['max_new_tokens'],
-                temperature=self.params['temperature'],
-                do_sample=self.params['do_sample'],
-                top_p=self.params['top_p'],
-                repetition_penalty=self.params['repetition_penalty'],
-                num_return_sequences=self.params['num_return_sequences']
-            )
+    def run(self):
+        try:
+            self.finished.emit(markdown.markdown(self.markdown_content))
+        except Exception as e:
+            self.error.emit(str(e))
 
-            markdown_output = self.tokenizer.decode(outputs[0], skip_special_tokens=True)
-            markdown_output = markdown_output.split("Markdown:")[-1].strip()
+class URLBatchTask(QObject):
+    # Expands sitemaps, then converts pages while the remaining ones are
+    # still downloading; one Markdown file per URL goes to output_dir.
+    finished = pyqtSignal(int, int, int, dict)
+    progress = pyqtSignal(int, int)
+    cancelled = pyqtSignal()
+    error = pyqtSignal(str)
 
-            self.finished.emit(markdown_output)
+    def __init__(self, sources, fetcher, converter, output_dir, batch_size, token_budget):
+        QObject.__init__(self)
+        self.sources = sources
+        self.fetcher = fetcher
+        self.converter = converter
+        self.output_dir = output_dir
+        self.batch_size = batch_size
+        self.token_budget = token_budget
+        self.job = None
+        self.total = 0
+        self.converted = 0
+        self.cached = 0
+        self.failed = 0
+
+    def work(self, job):
+        self.job = job
+        try:
+            urls = self.fetcher.expandSources(self.sources)
+            self.total = len(urls)
+            self.reportProgress()
+            pages = self.fetcher.iterPages(urls, self.onError, job.checkpoint)
+            stops = self.converter.withCancellation(job.isCancelled).convertMany(
+                pages, self.onResult, self.onError, batch_size=self.batch_size, token_budget=self.token_budget,
+                should_stop=job.checkpoint, window=self.batch_size)
+        except Cancelled:
+            self.cancelled.emit()
+            raise
         except Exception as e:
             self.error.emit(str(e))
+            raise
+        self.finished.emit(self.converted, self.cached, self.failed, summarize(stops.values()))
+
+    def reportProgress(self):
+        done = self.converted + self.cached + self.failed
+        self.progress.emit(done, self.total)
+        self.job.report(done, self.total)
+
+    def onResult(self, url, markdown_content, cached):
+        with open(os.path.join(self.output_dir, url_filename(url)), 'w', encoding='utf-8') as file:
+            file.write(markdown_content)
+        if cached:
+            self.cached += 1
+        else:
+            self.converted += 1
+        self.reportProgress()
+
+    def onError(self, url, error):
+        self.failed += 1
+        self.reportProgress()
 
 class HTMLtoMarkdownConverter(QMainWindow):
+    # Finished instrumentation runs and job updates, delivered on the GUI
+    # thread.
+    runRecorded = pyqtSignal(dict)
+    jobChanged = pyqtSignal(object)
+
     def __init__(self):
         super().__init__()
-        self.models = {
-            "0.5B Model": "jinaai/reader-lm-0.5b",
-            "1.5B Model": "jinaai/reader-lm-1.5b"
-        }
+        self.models = dict(MODELS)
         self.device = "cpu"
+        self.resultCache = ResultCache()
+        self.fetcher = Fetcher(HTTPCache())
+        self.fetchSeconds = None
+        self.metricsLog = None
+        self.jobQueue = JobQueue()
+        self.blockCache = BlockCache()
+        self.incrementalOutput = False
+        self.currentJob = None
+        self.jobRows = {}
+        self.preloadTask = None
+        self.preloadJob = None
+        self.inputFiles = {}
+        self.loaders = {}
+        self.spoolDir = None
+        self.previewThread = None
+        self.previewWindow = None
         self.initUI()
         self.loadSettings()
+        self.updateMemoryBudget()
+        self.updateCacheSize()
+        self.runRecorded.connect(self.onRunRecorded)
+        instrumentation.addCollector(self.runRecorded.emit)
+        self.jobChanged.connect(self.onJobChanged)
+        self.jobQueue.addListener(self.jobChanged.emit)
+        self.updateInstrumentation()
         self.setStyleSheet(self.getStyleSheet())
 
+        # Connected after loadSettings so restoring the settings does not
+        # start a load per changed widget; the restored model loads once.
+        self.model_selector.currentIndexChanged.connect(self.preloadModel)
+        self.gpu_radio.toggled.connect(self.preloadModel)
+        self.precision_selector.currentIndexChanged.connect(self.preloadModel)
+        self.compile_decode.toggled.connect(self.preloadModel)
+        self.preload_model.toggled.connect(self.preloadModel)
+        self.htmlInput.textChanged.connect(self.updateConvertButton)
+        self.urlContent.textChanged.connect(self.updateConvertButton)
+        self.tabs.currentChanged.connect(self.updateConvertButton)
+        self.preloadModel()
+        self.updateConvertButton()
+
     def initUI(self):
         self.setWindowTitle('HTML to Markdown Converter')
         self.setGeometry(100, 100, 1200, 800)
@@ -79,13 +448,14 @@ class HTMLtoMarkdownConverter(QMainWindow):
         self.tabs.addTab(self.createManualInputTab(), "Manual Input")
         self.tabs.addTab(self.createURLInputTab(), "URL Input")
         self.tabs.addTab(self.createSettingsTab(), "Settings")
+        self.tabs.addTab(self.createJobsTab(), "Jobs")
         main_layout.addWidget(self.tabs)
 
         # Convert button and progress bar
         main_layout.addLayout(self.createConversionControls())
 
         # Output area
-        self.markdownOutput = QTextEdit()
+        self.markdownOutput = QPlainTextEdit()
         self.markdownOutput.setReadOnly(True)
         main_layout.addWidget(self.markdownOutput)
 
@@ -96,12 +466,17 @@ class HTMLtoMarkdownConverter(QMainWindow):
         container.setLayout(main_layout)
         self.setCentralWidget(container)
 
+        self.lastRunLabel = QLabel()
+        self.statusBar().addPermanentWidget(self.lastRunLabel)
+
     def createModelSelection(self):
         model_layout = QHBoxLayout()
         model_layout.addWidget(QLabel("Select Model:"))
         self.model_selector = QComboBox()
         self.model_selector.addItems(self.models.keys())
         model_layout.addWidget(self.model_selector)
+        self.modelStatus = QLabel()
+        model_layout.addWidget(self.modelStatus)
         return model_layout
 
     def createHardwareSelection(self):
@@ -113,18 +488,46 @@ class HTMLtoMarkdownConverter(QMainWindow):
         self.gpu_radio.setEnabled(torch.cuda.is_available() or torch.backends.mps.is_available())
         hardware_layout.addWidget(self.cpu_radio)
         hardware_layout.addWidget(self.gpu_radio)
+
+        hardware_layout.addWidget(QLabel("Backend:"))
+        self.precision_selector = QComboBox()
+        for precision, label in PRECISIONS.items():
+            self.precision_selector.addItem(label, precision)
+        hardware_layout.addWidget(self.precision_selector)
+        self.compile_decode = QCheckBox("Compiled decode")
+        self.compile_decode.setToolTip("Static KV cache and torch.compile; the first conversion compiles the model")
+        hardware_layout.addWidget(self.compile_decode)
+
         hardware_group.setLayout(hardware_layout)
         self.cpu_radio.toggled.connect(self.updateDevice)
         self.gpu_radio.toggled.connect(self.updateDevice)
+        self.updateBackendOptions()
         return hardware_group
 
     def createManualInputTab(self):
         tab = QWidget()
         layout = QVBoxLayout()
-        self.removeStylesCheckbox = QCheckBox("Remove styles from input")
+        self.removeStylesCheckbox = QCheckBox("Reduce HTML before conversion")
         layout.addWidget(self.removeStylesCheckbox)
-        self.htmlInput = QTextEdit()
+        self.incrementalCheckbox = QCheckBox("Re-convert only the blocks that changed since the last conversion")
+        layout.addWidget(self.incrementalCheckbox)
+        self.reductionReport = QLabel()
+        self.reductionReport.setVisible(False)
+        layout.addWidget(self.reductionReport)
+        file_layout = QHBoxLayout()
+        open_button = QPushButton("Open HTML File...")
+        open_button.clicked.connect(self.openHTMLFile)
+        file_layout.addWidget(open_button)
+        self.closeFileButton = QPushButton("Close File")
+        self.closeFileButton.clicked.connect(lambda: self.closeDocumentFile(self.htmlInput))
+        self.closeFileButton.setEnabled(False)
+        file_layout.addWidget(self.closeFileButton)
+        self.inputFileLabel = QLabel()
+        file_layout.addWidget(self.inputFileLabel, 1)
+        layout.addLayout(file_layout)
+        self.htmlInput = HTMLEditor()
         self.htmlInput.setPlaceholderText("Enter HTML here...")
+        self.htmlInput.largePaste.connect(self.onLargePaste)
         layout.addWidget(self.htmlInput)
         tab.setLayout(layout)
         return tab
@@ -140,9 +543,60 @@ class HTMLtoMarkdownConverter(QMainWindow):
         self.fetchButton.clicked.connect(self.fetchHTML)
         url_layout.addWidget(self.fetchButton)
         layout.addLayout(url_layout)
-        self.urlContent = QTextEdit()
+        self.urlContent = QPlainTextEdit()
         self.urlContent.setReadOnly(True)
         layout.addWidget(self.urlContent)
+
+        url_list_group = QGroupBox("URL List or Sitemap")
+        url_list_layout = QVBoxLayout()
+        self.urlList = QTextEdit()
+        self.urlList.setAcceptRichText(False)
+        self.urlList.setPlaceholderText("One URL per line; sitemap URLs (.xml) are expanded to their pages")
+        url_list_layout.addWidget(self.urlList)
+
+        self.fetch_workers = QSpinBox()
+        self.fetch_workers.setRange(1, 64)
+        self.fetch_workers.setValue(self.fetcher.workers)
+        self.fetch_workers.valueChanged.connect(self.updateFetchWorkers)
+        url_list_layout.addWidget(QLabel("Concurrent Downloads:"))
+        url_list_layout.addWidget(self.fetch_workers)
+
+        self.urlBatchButton = QPushButton("Convert All to Directory...")
+        self.urlBatchButton.clicked.connect(self.convertURLList)
+        url_list_layout.addWidget(self.urlBatchButton)
+
+        self.urlBatchProgress = QProgressBar()
+        self.urlBatchProgress.setVisible(False)
+        url_list_layout.addWidget(self.urlBatchProgress)
+        url_list_group.setLayout(url_list_layout)
+        layout.addWidget(url_list_group)
+
+        tab.setLayout(layout)
+        return tab
+
+    def createJobsTab(self):
+        tab = QWidget()
+        layout = QVBoxLayout()
+        self.jobsTable = QTableWidget(0, 6)
+        self.jobsTable.setHorizontalHeaderLabels(["#", "Job", "Priority", "Status", "Progress", "Time"])
+        self.jobsTable.horizontalHeader().setSectionResizeMode(1, QHeaderView.Stretch)
+        self.jobsTable.verticalHeader().setVisible(False)
+        self.jobsTable.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.jobsTable.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        layout.addWidget(self.jobsTable)
+
+        buttons_layout = QHBoxLayout()
+        cancel_selected = QPushButton("Cancel Selected")
+        cancel_selected.clicked.connect(self.cancelSelectedJobs)
+        buttons_layout.addWidget(cancel_selected)
+        cancel_all = QPushButton("Cancel All")
+        cancel_all.clicked.connect(self.jobQueue.cancelAll)
+        buttons_layout.addWidget(cancel_all)
+        clear_finished = QPushButton("Clear Finished")
+        clear_finished.clicked.connect(self.clearFinishedJobs)
+        buttons_layout.addWidget(clear_finished)
+        layout.addLayout(buttons_layout)
+
         tab.setLayout(layout)
         return tab
 
@@ -191,9 +645,166 @@ class HTMLtoMarkdownConverter(QMainWindow):
         params_layout.addWidget(QLabel("Number of Return Sequences:"))
         params_layout.addWidget(self.num_return_sequences)
 
+        self.stream_output = QCheckBox("Stream output while generating")
+        self.stream_output.setChecked(True)
+        params_layout.addWidget(self.stream_output)
+
+        self.stop_degenerate = QCheckBox("Stop early on repetition loops and runaway output")
+        self.stop_degenerate.setChecked(True)
+        params_layout.addWidget(self.stop_degenerate)
+
+        self.speculative = QCheckBox("Speculative decoding (draft tokens copied from the input)")
+        self.speculative.setChecked(False)
+        params_layout.addWidget(self.speculative)
+
+        self.draft_tokens = QSpinBox()
+        self.draft_tokens.setRange(1, 64)
+        self.draft_tokens.setValue(DEFAULT_DRAFT_TOKENS)
+        params_layout.addWidget(QLabel("Draft Tokens per Step:"))
+        params_layout.addWidget(self.draft_tokens)
+
+        self.ngram_size = QSpinBox()
+        self.ngram_size.setRange(1, 8)
+        self.ngram_size.setValue(DEFAULT_NGRAM_SIZE)
+        params_layout.addWidget(QLabel("Draft N-gram Size:"))
+        params_layout.addWidget(self.ngram_size)
+
+        self.do_sample.toggled.connect(self.updateSpeculative)
+        self.updateSpeculative()
+
         params_group.setLayout(params_layout)
         layout.addWidget(params_group)
 
+        # Long document chunking
+        chunking_group = QGroupBox("Long Documents")
+        chunking_layout = QVBoxLayout()
+
+        self.chunking_enabled = QCheckBox("Split documents that exceed the chunk size")
+        self.chunking_enabled.setChecked(True)
+        chunking_layout.addWidget(self.chunking_enabled)
+
+        self.chunk_tokens = QSpinBox()
+        self.chunk_tokens.setRange(128, 32768)
+        self.chunk_tokens.setSingleStep(128)
+        self.chunk_tokens.setValue(1024)
+        chunking_layout.addWidget(QLabel("Chunk Size (input tokens):"))
+        chunking_layout.addWidget(self.chunk_tokens)
+
+        self.chunk_workers = QSpinBox()
+        self.chunk_workers.setRange(1, 16)
+        self.chunk_workers.setValue(1)
+        chunking_layout.addWidget(QLabel("Parallel Chunk Workers:"))
+        chunking_layout.addWidget(self.chunk_workers)
+
+        chunking_group.setLayout(chunking_layout)
+        layout.addWidget(chunking_group)
+
+        # HTML reduction passes
+        reduction_group = QGroupBox("HTML Reduction Passes")
+        reduction_layout = QVBoxLayout()
+        self.reduction_passes = {}
+        for name in PASSES:
+            checkbox = QCheckBox(PASS_LABELS[name])
+            checkbox.setChecked(True)
+            reduction_layout.addWidget(checkbox)
+            self.reduction_passes[name] = checkbox
+        reduction_group.setLayout(reduction_layout)
+        layout.addWidget(reduction_group)
+
+        # Result cache
+        cache_group = QGroupBox("Result Cache")
+        cache_layout = QVBoxLayout()
+
+        self.use_cache = QCheckBox("Reuse cached results for deterministic runs (Do Sample off)")
+        self.use_cache.setChecked(True)
+        cache_layout.addWidget(self.use_cache)
+
+        self.cache_size = QSpinBox()
+        self.cache_size.setRange(1, 65536)
+        self.cache_size.setValue(512)
+        self.cache_size.valueChanged.connect(self.updateCacheSize)
+        cache_layout.addWidget(QLabel("Maximum Cache Size (MB):"))
+        cache_layout.addWidget(self.cache_size)
+
+        self.block_cache_size = QSpinBox()
+        self.block_cache_size.setRange(1, 4096)
+        self.block_cache_size.setValue(DEFAULT_BLOCK_CACHE_BYTES // MB)
+        self.block_cache_size.valueChanged.connect(self.updateCacheSize)
+        cache_layout.addWidget(QLabel("Block Cache for Incremental Conversion (MB, in memory):"))
+        cache_layout.addWidget(self.block_cache_size)
+
+        self.cacheStats = QLabel()
+        cache_layout.addWidget(self.cacheStats)
+
+        clear_cache_button = QPushButton("Clear Cache")
+        clear_cache_button.clicked.connect(self.clearCache)
+        cache_layout.addWidget(clear_cache_button)
+
+        cache_group.setLayout(cache_layout)
+        layout.addWidget(cache_group)
+
+        # CPU threads
+        threads_group = QGroupBox("CPU Threads")
+        threads_layout = QVBoxLayout()
+
+        self.intra_op_threads = QSpinBox()
+        self.intra_op_threads.setRange(0, 512)
+        self.intra_op_threads.setSpecialValueText("Default")
+        threads_layout.addWidget(QLabel("Intra-op Threads:"))
+        threads_layout.addWidget(self.intra_op_threads)
+
+        self.inter_op_threads = QSpinBox()
+        self.inter_op_threads.setRange(0, 512)
+        self.inter_op_threads.setSpecialValueText("Default")
+        threads_layout.addWidget(QLabel("Inter-op Threads (applied once per session):"))
+        threads_layout.addWidget(self.inter_op_threads)
+
+        threads_group.setLayout(threads_layout)
+        layout.addWidget(threads_group)
+
+        # Loaded model memory
+        memory_group = QGroupBox("Model Memory")
+        memory_layout = QVBoxLayout()
+
+        self.memory_budget = QDoubleSpinBox()
+        self.memory_budget.setRange(0.0, 256.0)
+        self.memory_budget.setSingleStep(0.5)
+        self.memory_budget.setValue(8.0)
+        self.memory_budget.setSpecialValueText("Unlimited")
+        self.memory_budget.valueChanged.connect(self.updateMemoryBudget)
+        memory_layout.addWidget(QLabel("Memory Budget for Loaded Models (GB):"))
+        memory_layout.addWidget(self.memory_budget)
+
+        self.preload_model = QCheckBox("Load and warm up the selected model in the background")
+        self.preload_model.setChecked(True)
+        self.preload_model.setToolTip("Starts at launch and whenever the model, device or backend changes, "
+                                      "so the first conversion does not wait for the load")
+        memory_layout.addWidget(self.preload_model)
+
+        unload_button = QPushButton("Unload Models")
+        unload_button.clicked.connect(self.unloadModels)
+        memory_layout.addWidget(unload_button)
+
+        memory_group.setLayout(memory_layout)
+        layout.addWidget(memory_group)
+
+        # Per-stage metrics
+        metrics_group = QGroupBox("Metrics")
+        metrics_layout = QVBoxLayout()
+
+        self.record_metrics = QCheckBox("Record per-stage metrics")
+        self.record_metrics.toggled.connect(self.updateInstrumentation)
+        metrics_layout.addWidget(self.record_metrics)
+
+        self.metrics_log = QLineEdit()
+        self.metrics_log.setPlaceholderText("Optional JSON-lines log file")
+        self.metrics_log.editingFinished.connect(self.updateInstrumentation)
+        metrics_layout.addWidget(QLabel("Metrics Log:"))
+        metrics_layout.addWidget(self.metrics_log)
+
+        metrics_group.setLayout(metrics_layout)
+        layout.addWidget(metrics_group)
+
         # Save and reset buttons
         buttons_layout = QHBoxLayout()
         save_button = QPushButton("Save Settings")
@@ -213,6 +824,20 @@ class HTMLtoMarkdownConverter(QMainWindow):
         self.convertButton = QPushButton('Convert to Markdown')
         self.convertButton.clicked.connect(self.convertHTML)
         convert_layout.addWidget(self.convertButton)
+        self.cancelButton = QPushButton('Cancel')
+        self.cancelButton.clicked.connect(self.cancelConversion)
+        self.cancelButton.setEnabled(False)
+        convert_layout.addWidget(self.cancelButton)
+
+        convert_layout.addWidget(QLabel("Engine:"))
+        self.engine_selector = QComboBox()
+        for mode, label in ROUTING_MODES.items():
+            self.engine_selector.addItem(label, mode)
+        self.engine_selector.setToolTip("Automatic routing converts simple documents with the rule-based "
+                                        "converter and only uses the model for complex ones")
+        convert_layout.addWidget(self.engine_selector)
+        self.engineLabel = QLabel()
+        convert_layout.addWidget(self.engineLabel)
 
         self.progressBar = QProgressBar()
         self.progressBar.setVisible(False)
@@ -248,6 +873,7 @@ class HTMLtoMarkdownConverter(QMainWindow):
             self.device = "cuda" if torch.cuda.is_available() else "mps"
         else:
             self.device = "cpu"
+        self.updateBackendOptions()
         QMessageBox.information(self, "Device Updated", f"Using {self.device.upper()} for inference")
 
     def fetchHTML(self):
@@ -255,83 +881,544 @@ class HTMLtoMarkdownConverter(QMainWindow):
         if not url:
             QMessageBox.warning(self, "Input Error", "Please enter a URL.")
             return
+        self.fetchButton.setEnabled(False)
+        self.fetchThread = FetchThread(self.fetcher, url, self.spoolPath)
+        self.fetchThread.finished.connect(self.onFetched)
+        self.fetchThread.error.connect(self.onFetchError)
+        self.fetchThread.start()
+
+    def onFetched(self, html_content, path, seconds):
+        self.fetchButton.setEnabled(True)
+        self.fetchSeconds = seconds
+        if path:
+            # Reduced on the worker as part of the conversion.
+            self.inputFiles[self.urlContent] = path
+            self.setEditorText(self.urlContent, html_content)
+            self.statusBar().showMessage(f"Large page ({os.path.getsize(path) / MB:.1f} MB): showing the first "
+                                         f"{PREVIEW_CHARS // 1024} KB, the whole page is converted")
+            return
+        self.inputFiles.pop(self.urlContent, None)
+        if self.removeStylesCheckbox.isChecked():
+            html_content = self.reduceHTML(html_content)
+        self.setEditorText(self.urlContent, html_content)
+
+    def spoolPath(self):
+        # A new temporary file for a large pasted or fetched document; the
+        # directory is removed when the window closes. Called from
+        # FetchThread too, so only uses thread-safe calls.
+        if self.spoolDir is None:
+            self.spoolDir = tempfile.mkdtemp(prefix='html-to-md-')
+        handle, path = tempfile.mkstemp(suffix='.html', dir=self.spoolDir)
+        os.close(handle)
+        return path
+
+    def setEditorText(self, editor, text):
+        loader = self.loaders.pop(editor, None)
+        if loader is not None:
+            loader.stop()
+        if len(text) <= LOAD_CHUNK_CHARS:
+            editor.setPlainText(text)
+            return
+        loader = ChunkedLoader(editor, text)
+        loader.finished.connect(lambda: self.loaders.pop(editor, None))
+        self.loaders[editor] = loader
+        loader.start()
+
+    def editorText(self, editor):
+        # The full text, also while a ChunkedLoader is still filling editor.
+        loader = self.loaders.get(editor)
+        if loader is not None and loader.isActive():
+            return loader.text
+        return editor.toPlainText()
+
+    def openHTMLFile(self):
+        path, _ = QFileDialog.getOpenFileName(self, "Open HTML File", "", "HTML Files (*.html *.htm);;All Files (*)")
+        if path:
+            self.openDocumentFile(self.htmlInput, path)
+
+    def openDocumentFile(self, editor, path):
+        # Small files are loaded for editing; large ones stay on disk and
+        # are read by the conversion itself.
         try:
-            response = requests.get(url)
-            response.raise_for_status()
-            html_content = response.text
-            if self.removeStylesCheckbox.isChecked():
-                html_content = self.remove_styles(html_content)
-            self.urlContent.setPlainText(html_content)
-        except requests.RequestException as e:
-            QMessageBox.critical(self, "Fetch Error", f"Failed to fetch HTML: {str(e)}")
-
-    def remove_styles(self, html_content):
-        soup = BeautifulSoup(html_content, 'html.parser')
-        for style in soup(["style", "script"]):
-            style.decompose()
-        return str(soup)
+            if os.path.getsize(path) <= LARGE_DOCUMENT_CHARS:
+                with open(path, 'r', encoding='utf-8', errors='replace') as file:
+                    text = file.read()
+                self.closeDocumentFile(editor)
+                self.setEditorText(editor, text)
+                return
+            with open(path, 'r', encoding='utf-8', errors='replace') as file:
+                preview = file.read(PREVIEW_CHARS)
+        except OSError as e:
+            QMessageBox.critical(self, "Open Error", f"Failed to open {path}: {e}")
+            return
+        self.inputFiles[editor] = path
+        editor.setReadOnly(True)
+        self.setEditorText(editor, preview)
+        self.updateInputFile()
+
+    def closeDocumentFile(self, editor):
+        if self.inputFiles.pop(editor, None) is not None:
+            editor.setReadOnly(editor is self.urlContent)
+            editor.clear()
+        self.updateInputFile()
+
+    def onLargePaste(self, text):
+        path = self.spoolPath()
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(text)
+        self.openDocumentFile(self.htmlInput, path)
+
+    def updateInputFile(self):
+        path = self.inputFiles.get(self.htmlInput)
+        self.closeFileButton.setEnabled(path is not None)
+        if path is None:
+            self.inputFileLabel.clear()
+        else:
+            self.inputFileLabel.setText(f"{os.path.basename(path)} ({os.path.getsize(path) / MB:.1f} MB) is "
+                                        f"converted from disk; showing the first {PREVIEW_CHARS // 1024} KB")
+            self.inputFileLabel.setToolTip(path)
+        self.updateConvertButton()
+
+    def onFetchError(self, error_message):
+        self.fetchButton.setEnabled(True)
+        QMessageBox.critical(self, "Fetch Error", f"Failed to fetch HTML: {error_message}")
+
+    def updateFetchWorkers(self):
+        # Running fetches keep the previous pool until they finish.
+        self.fetcher = Fetcher(self.fetcher.cache, self.fetch_workers.value())
+
+    def batchOptions(self):
+        # (batch_size, token_budget) for multi-document conversions.
+        return 8, 32768
+
+    def convertURLList(self):
+        sources = read_url_list(self.urlList.toPlainText())
+        invalid = [source for source in sources if not is_url(source)]
+        if not sources or invalid:
+            QMessageBox.warning(self, "Input Error", "Please enter one http(s) URL per line.")
+            return
+        output_dir = QFileDialog.getExistingDirectory(self, "Select Output Directory")
+        if not output_dir:
+            return
+
+        batch_size, token_budget = self.batchOptions()
+        converter = self.createConverter(reduce=self.removeStylesCheckbox.isChecked())
+        task = URLBatchTask(sources, self.fetcher, converter, output_dir, batch_size, token_budget)
+        task.progress.connect(self.onURLBatchProgress)
+        task.finished.connect(self.onURLBatchFinished)
+        task.cancelled.connect(self.onURLBatchCancelled)
+        task.error.connect(self.onURLBatchError)
+        self.jobQueue.submit(Job('urls', f"{len(sources)} URL source(s) to {output_dir}", task.work, BATCH))
+
+    def onURLBatchProgress(self, done, total):
+        self.urlBatchProgress.setVisible(True)
+        self.urlBatchProgress.setRange(0, max(1, total))
+        self.urlBatchProgress.setValue(done)
+
+    def onURLBatchCancelled(self):
+        self.urlBatchProgress.setVisible(False)
+
+    def onURLBatchFinished(self, converted, cached, failed, stops):
+        self.urlBatchProgress.setVisible(False)
+        self.updateCacheStats()
+        message = f"Converted {converted + cached} page(s) to Markdown."
+        if cached:
+            message += f" {cached} came from the result cache."
+        if failed:
+            message += f" {failed} page(s) failed."
+        if stops['stopped']:
+            message += f" {format_summary(stops)}."
+        QMessageBox.information(self, "URL Conversion Complete", message)
+
+    def onURLBatchError(self, error_message):
+        self.urlBatchProgress.setVisible(False)
+        QMessageBox.critical(self, "URL Conversion Error", f"An error occurred: {error_message}")
+
+    def reduceHTML(self, html_content):
+        passes = [name for name, checkbox in self.reduction_passes.items() if checkbox.isChecked()]
+        # This runs on the GUI thread, so tokens are only counted once a
+        # conversion has loaded the tokenizer; loading it here would freeze
+        # the window.
+        tokenizer = registry.loadedTokenizer(self.currentModelPath())
+        count_tokens = (lambda text: len(tokenizer.encode(text))) if tokenizer is not None else None
+        html_content, report = reduce_html(html_content, passes, count_tokens=count_tokens, report=True)
+
+        first, last = report[0], report[-1]
+        summary = f"Reduced input from {first['bytes']} to {last['bytes']} bytes"
+        if count_tokens is not None:
+            summary += f" ({first['tokens']} to {last['tokens']} tokens)"
+        self.reductionReport.setText(summary)
+        self.reductionReport.setToolTip(format_report(report))
+        self.reductionReport.setVisible(True)
+        return html_content
 
     def convertHTML(self):
         if self.tabs.currentIndex() == 0:
-            html_content = self.htmlInput.toPlainText()
+            editor = self.htmlInput
+            description = "Manual input"
         else:
-            html_content = self.urlContent.toPlainText()
+            editor = self.urlContent
+            description = self.urlInput.text() or "Fetched page"
+        path = self.inputFiles.get(editor)
+        html_content = None if path else self.editorText(editor)
 
-        if not html_content:
+        if not path and not html_content:
             QMessageBox.warning(self, "Input Error", "Please enter or fetch some HTML content.")
             return
 
-        if self.removeStylesCheckbox.isChecked():
-            html_content = self.remove_styles(html_content)
-
-        self.convertButton.setEnabled(False)
+        # File-backed documents are reduced by the converter on the worker
+        # rather than here, with no per-pass report.
+        converter = self.createConverter(reduce=bool(path) and self.removeStylesCheckbox.isChecked())
+        run = converter.startRun()
+        if self.tabs.currentIndex() == 1 and self.fetchSeconds is not None:
+            run.record('fetch', self.fetchSeconds)
+        if path:
+            description = f"{description} ({os.path.basename(path)})"
+        elif self.removeStylesCheckbox.isChecked():
+            with run.stage('reduce'):
+                html_content = self.reduceHTML(html_content)
+
+        # Incremental mode applies to the manual input, which is what gets
+        # edited and converted again.
+        incremental = self.tabs.currentIndex() == 0 and self.incrementalCheckbox.isChecked()
+        task = ConversionTask(html_content, converter, self.stream_output.isChecked(), run,
+                              self.blockCache if incremental else None, path)
+        task.started.connect(self.onConversionStarted)
+        task.finished.connect(self.onConversionFinished)
+        task.cancelled.connect(self.onConversionCancelled)
+        task.error.connect(self.onError)
+        task.stage.connect(self.onStageChanged)
+        task.progress.connect(self.updateProgressBar)
+        task.chunkProgress.connect(self.updateChunkProgress)
+        task.partial.connect(self.onPartialOutput)
+        task.stats.connect(self.onConversionStats)
+        # Interactive conversions run ahead of queued batches.
+        self.currentJob = self.jobQueue.submit(Job('convert', description, task.work, INTERACTIVE))
+        self.cancelButton.setEnabled(True)
+        if self.currentJob.status == QUEUED:
+            self.statusBar().showMessage("Conversion queued; it starts when the current job reaches a checkpoint")
+
+    def cancelConversion(self):
+        if self.currentJob is not None:
+            self.jobQueue.cancel(self.currentJob)
+
+    def onConversionStarted(self, incremental):
+        # Incremental results are spliced into the previous output when they
+        # arrive, so it is kept until then.
+        self.incrementalOutput = incremental
+        self.engineLabel.clear()
+        if not incremental:
+            self.markdownOutput.clear()
+        self.statusBar().clearMessage()
         self.progressBar.setVisible(True)
+        self.progressBar.setRange(0, 100)
         self.progressBar.setValue(0)
 
-        model_name = self.model_selector.currentText()
-        model_path = self.models[model_name]
-
-        params = {
+    def onConversionCancelled(self):
+        self.progressBar.setVisible(False)
+        self.progressBar.resetFormat()
+        self.statusBar().showMessage("Conversion cancelled")
+
+    def onJobChanged(self, job):
+        if job is self.currentJob and job.status in FINISHED:
+            self.cancelButton.setEnabled(False)
+        row = self.jobRows.get(job.id)
+        if row is None:
+            row = self.jobsTable.rowCount()
+            self.jobsTable.insertRow(row)
+            self.jobRows[job.id] = row
+        progress = f"{job.progress[0]}/{job.progress[1]}" if job.progress else ""
+        status = job.status if job.error is None else f"{job.status}: {job.error}"
+        values = [str(job.id), job.description, PRIORITIES.get(job.priority, str(job.priority)), status, progress,
+                  f"{job.seconds():.1f} s" if job.started else ""]
+        for column, value in enumerate(values):
+            self.jobsTable.setItem(row, column, QTableWidgetItem(value))
+
+    def cancelSelectedJobs(self):
+        selected = {index.row() for index in self.jobsTable.selectionModel().selectedRows()}
+        for job in self.jobQueue.jobs():
+            if self.jobRows.get(job.id) in selected:
+                self.jobQueue.cancel(job)
+
+    def clearFinishedJobs(self):
+        self.jobQueue.clearFinished()
+        self.jobsTable.setRowCount(0)
+        self.jobRows = {}
+        for job in self.jobQueue.jobs():
+            self.onJobChanged(job)
+
+    def closeEvent(self, event):
+        self.jobQueue.shutdown(timeout=5)
+        if self.spoolDir is not None:
+            shutil.rmtree(self.spoolDir, ignore_errors=True)
+        super().closeEvent(event)
+
+    def currentModelPath(self):
+        return self.models[self.model_selector.currentText()]
+
+    def createConverter(self, reduce=False):
+        configure_threads(self.intra_op_threads.value(), self.inter_op_threads.value())
+        return Converter(
+            self.currentModelPath(),
+            self.device,
+            self.getGenerationParams(),
+            reduce=reduce,
+            passes=[name for name, checkbox in self.reduction_passes.items() if checkbox.isChecked()],
+            chunking=self.getChunkingOptions(),
+            cache=self.activeCache(),
+            backend=self.currentBackend(),
+            routing=self.engine_selector.currentData()
+        )
+
+    def currentBackend(self):
+        return backend_name(self.precision_selector.currentData(), self.compile_decode.isChecked())
+
+    def updateBackendOptions(self):
+        # Disable precisions the selected device cannot run
+        model = self.precision_selector.model()
+        for index in range(self.precision_selector.count()):
+            supported = supports_precision(self.precision_selector.itemData(index), self.device)
+            model.item(index).setEnabled(supported)
+            if not supported and self.precision_selector.currentIndex() == index:
+                self.precision_selector.setCurrentIndex(self.precision_selector.findData(DEFAULT_BACKEND))
+
+    def updateSpeculative(self):
+        # Drafting is only used with greedy decoding: sampled tokens seldom
+        # match the drafts.
+        greedy = not self.do_sample.isChecked()
+        for widget in (self.speculative, self.draft_tokens, self.ngram_size):
+            widget.setEnabled(greedy)
+        self.speculative.setToolTip("" if greedy else "Only used when Do Sample is off")
+
+    def getGenerationParams(self):
+        return {
             'max_new_tokens': self.max_new_tokens.value(),
             'temperature': self.temperature.value(),
             'do_sample': self.do_sample.isChecked(),
             'top_p': self.top_p.value(),
             'repetition_penalty': self.repetition_penalty.value(),
-            'num_return_sequences': self.num_return_sequences.value()
+            'num_return_sequences': self.num_return_sequences.value(),
+            'stop_degenerate': self.stop_degenerate.isChecked(),
+            'draft_tokens': self.draft_tokens.value() if self.speculative.isChecked() else 0,
+            'ngram_size': self.ngram_size.value()
+        }
+
+    def getChunkingOptions(self):
+        if not self.chunking_enabled.isChecked():
+            return None
+        return {
+            'token_budget': self.chunk_tokens.value(),
+            'workers': self.chunk_workers.value()
         }
 
-        self.thread = ModelThread(html_content, model_path, self.device, params)
-        self.thread.finished.connect(self.onConversionFinished)
-        self.thread.error.connect(self.onError)
-        self.thread.start()
+    def activeCache(self):
+        return self.resultCache if self.use_cache.isChecked() else None
 
-        self.timer = QTimer(self)
-        self.timer.timeout.connect(self.updateProgressBar)
-        self.timer.start(100)
+    def updateCacheSize(self):
+        self.resultCache.setMaxBytes(self.cache_size.value() * MB)
+        self.blockCache.setMaxBytes(self.block_cache_size.value() * MB)
+        self.updateCacheStats()
 
-    def updateProgressBar(self):
-        current_value = self.progressBar.value()
-        if current_value < 99:
-            self.progressBar.setValue(current_value + 1)
+    def updateCacheStats(self):
+        try:
+            stats = self.resultCache.stats()
+        except Exception as e:
+            self.cacheStats.setText(f"Cache unavailable: {e}")
+            return
+        block_stats = self.blockCache.stats()
+        self.cacheStats.setText(
+            f"{stats['entries']} entries, {stats['bytes'] / MB:.1f} MB - "
+            f"{stats['hits']} hits, {stats['misses']} misses this session\n"
+            f"Blocks: {block_stats['entries']} in memory, {block_stats['bytes'] / MB:.1f} MB"
+        )
+
+    def clearCache(self):
+        self.resultCache.clear()
+        self.blockCache.clear()
+        self.updateCacheStats()
+
+    def updateMemoryBudget(self):
+        budget = self.memory_budget.value()
+        registry.setMemoryBudget(int(budget * GB) if budget > 0 else None)
+
+    def updateInstrumentation(self):
+        instrumentation.enabled = self.record_metrics.isChecked()
+        if self.metricsLog is not None:
+            instrumentation.removeCollector(self.metricsLog)
+            self.metricsLog = None
+        path = self.metrics_log.text().strip()
+        if path:
+            self.metricsLog = instrumentation.addCollector(JsonLinesCollector(path))
+
+    def onRunRecorded(self, record):
+        self.lastRunLabel.setText(f"Last run: {format_record(record)}")
+
+    def unloadModels(self):
+        count = registry.unload()
+        self.updateModelStatus()
+        QMessageBox.information(self, "Models Unloaded", f"Unloaded {count} model(s) from memory.")
+
+    def preloadModel(self):
+        # Loads and warms up the selected model on the job queue, so the first
+        # conversion does not stall on it. A queued preload of an earlier
+        # selection is dropped; a running one finishes and stays cached.
+        if self.preloadJob is not None and self.preloadJob.status == QUEUED:
+            self.jobQueue.cancel(self.preloadJob)
+        self.preloadTask = None
+        self.preloadJob = None
+        converter = self.createConverter()
+        info = registry.info(converter.model_path, converter.device, backend=converter.backend)
+        if self.preload_model.isChecked() and (info is None or not info['warm']):
+            self.preloadTask = PreloadTask(converter, warm=True)
+            self.preloadTask.stage.connect(self.onPreloadStage)
+            self.preloadTask.finished.connect(self.onPreloadFinished)
+            self.preloadTask.error.connect(self.onPreloadError)
+            self.preloadJob = self.jobQueue.submit(
+                Job('load', f"Load {self.model_selector.currentText()}", self.preloadTask.work, NORMAL))
+        self.updateModelStatus()
+
+    def preloading(self):
+        return self.preloadJob is not None and self.preloadJob.status not in FINISHED
+
+    def onPreloadStage(self, stage):
+        if self.sender() is not self.preloadTask:
+            return
+        name = self.model_selector.currentText()
+        self.modelStatus.setText(f"Loading {name}..." if stage == 'load' else f"Warming up {name}...")
+        self.modelStatus.setToolTip("")
+
+    def onPreloadFinished(self, info):
+        if self.sender() is self.preloadTask:
+            self.preloadJob = None
+            self.updateModelStatus()
+
+    def onPreloadError(self, error_message):
+        if self.sender() is not self.preloadTask:
+            return
+        self.preloadJob = None
+        self.updateConvertButton()
+        self.modelStatus.setText("Model failed to load")
+        self.modelStatus.setToolTip(error_message)
+
+    def updateModelStatus(self):
+        info = registry.info(self.currentModelPath(), self.device, backend=self.currentBackend())
+        if self.preloading():
+            text = f"Waiting to load {self.model_selector.currentText()}..."
+        elif info is None:
+            text = "Not loaded; the first conversion loads the model"
         else:
-            self.timer.stop()
+            text = f"Ready ({info['size'] / MB:.0f} MB"
+            if info['mapped']:
+                text += f", {info['mapped'] / MB:.0f} MB memory-mapped"
+            text += ")" if info['warm'] else ", not warmed up)"
+        self.modelStatus.setText(text)
+        self.modelStatus.setToolTip("")
+        self.updateConvertButton()
+
+    def updateConvertButton(self):
+        # Convert needs input on the current tab. While the selected model is
+        # still loading, a conversion waits for it, which the label says.
+        source = self.htmlInput if self.tabs.currentIndex() == 0 else self.urlContent
+        self.convertButton.setEnabled(source in self.inputFiles or not source.document().isEmpty())
+        if self.preloading():
+            self.convertButton.setText('Convert to Markdown (after the model loads)')
+        else:
+            self.convertButton.setText('Convert to Markdown')
+
+    def onStageChanged(self, stage):
+        if stage in ('load', 'prefill'):
+            # Busy indicator: neither stage reports incremental progress
+            self.progressBar.setRange(0, 0)
+            self.progressBar.setFormat("Loading model..." if stage == 'load' else "Reading input...")
+        elif stage == 'cached':
+            self.progressBar.setRange(0, 1)
+            self.progressBar.setValue(1)
+            self.progressBar.setFormat("Loaded from cache")
+        elif stage == 'rules':
+            self.progressBar.setRange(0, 1)
+            self.progressBar.setValue(1)
+            self.progressBar.setFormat("Converted without the model")
+        elif stage == 'chunks':
+            self.progressBar.setRange(0, 0)
+            self.progressBar.setFormat("Splitting document...")
+        elif stage == 'decode':
+            self.progressBar.setRange(0, self.max_new_tokens.value())
+            self.progressBar.setValue(0)
+
+    def updateProgressBar(self, generated_tokens, max_new_tokens, tokens_per_second):
+        self.progressBar.setRange(0, max_new_tokens)
+        self.progressBar.setValue(min(generated_tokens, max_new_tokens))
+        self.progressBar.setFormat(f"%v/%m tokens ({tokens_per_second:.1f} tok/s)")
+
+    def updateChunkProgress(self, done, total):
+        self.progressBar.setRange(0, total)
+        self.progressBar.setValue(done)
+        self.progressBar.setFormat("%v/%m chunks")
+
+    def onConversionStats(self, stats):
+        engines = {'rules': "Rule-based", 'model': "Model", 'mixed': "Rule-based + model", 'cache': "Cache"}
+        if 'blocks' in stats:
+            self.engineLabel.setText(f"Reused {stats['reused']} of {stats['blocks']} blocks, "
+                                     f"converted {stats['converted']}")
+            if stats['early_stop'] is not None:
+                self.statusBar().showMessage(format_result(stats['early_stop']))
+            return
+        self.engineLabel.setText(f"Used: {engines.get(stats.get('engine'), stats.get('engine', ''))}")
+        self.engineLabel.setToolTip("Router: " + ", ".join(stats.get('route_reasons', [])))
+        messages = []
+        early_stop = stats.get('early_stop')
+        if early_stop is not None:
+            messages.append(format_result(early_stop))
+            if is_degenerate(early_stop):
+                self.engineLabel.setText(self.engineLabel.text() + " - output may be incomplete")
+        if 'speculative' in stats:
+            messages.append(format_stats(stats['speculative']))
+        if messages:
+            self.statusBar().showMessage(" | ".join(messages))
+        else:
+            self.statusBar().clearMessage()
+
+    def onPartialOutput(self, text):
+        cursor = self.markdownOutput.textCursor()
+        cursor.movePosition(cursor.End)
+        cursor.insertText(text)
+        self.markdownOutput.setTextCursor(cursor)
+        self.markdownOutput.ensureCursorVisible()
+
+    def spliceOutput(self, markdown_output):
+        # Replaces only the span that differs, keeping the scroll position.
+        # QTextCursor positions count UTF-16 code units.
+        old_text = self.editorText(self.markdownOutput)
+        start, end, replacement = splice(old_text, markdown_output)
+        if start == end and not replacement:
+            return
+        utf16 = lambda text: len(text.encode('utf-16-le')) // 2
+        cursor = self.markdownOutput.textCursor()
+        cursor.setPosition(utf16(old_text[:start]))
+        cursor.setPosition(utf16(old_text[:end]), cursor.KeepAnchor)
+        cursor.insertText(replacement)
 
     def onConversionFinished(self, markdown_output):
-        self.markdownOutput.setPlainText(markdown_output)
-        self.convertButton.setEnabled(True)
+        self.updateModelStatus()
+        if self.incrementalOutput and self.markdownOutput not in self.loaders:
+            self.spliceOutput(markdown_output)
+        else:
+            self.setEditorText(self.markdownOutput, markdown_output)
+        self.updateCacheStats()
         self.saveButton.setEnabled(True)
         self.copyButton.setEnabled(True)
         self.previewButton.setEnabled(True)
         self.progressBar.setVisible(False)
+        self.progressBar.resetFormat()
         QMessageBox.information(self, "Conversion Complete", "HTML has been successfully converted to Markdown!")
 
     def onError(self, error_message):
-        self.convertButton.setEnabled(True)
         self.progressBar.setVisible(False)
+        self.progressBar.resetFormat()
         QMessageBox.critical(self, "Error", f"An error occurred: {error_message}")
 
     def saveMarkdown(self):
-        markdown_content = self.markdownOutput.toPlainText()
+        markdown_content = self.editorText(self.markdownOutput)
         if not markdown_content:
             QMessageBox.warning(self, "Output Error", "There's no Markdown content to save.")
             return
@@ -343,7 +1430,7 @@ class HTMLtoMarkdownConverter(QMainWindow):
             QMessageBox.information(self, "Save Successful", f"Markdown content has been saved to {file_path}")
 
     def copyToClipboard(self):
-        markdown_content = self.markdownOutput.toPlainText()
+        markdown_content = self.editorText(self.markdownOutput)
         if markdown_content:
             clipboard = QApplication.clipboard()
             clipboard.setText(markdown_content)
@@ -352,17 +1439,29 @@ class HTMLtoMarkdownConverter(QMainWindow):
             QMessageBox.warning(self, "Copy Error", "There's no Markdown content to copy.")
 
     def previewHTML(self):
-            markdown_content = self.markdownOutput.toPlainText()
-            if markdown_content:
-                html_content = markdown.markdown(markdown_content)
-                preview = QTextEdit()
-                preview.setHtml(html_content)
-                preview.setReadOnly(True)
-                preview.setWindowTitle("HTML Preview")
-                preview.resize(600, 400)
-                preview.show()
-            else:
-                QMessageBox.warning(self, "Preview Error", "There's no Markdown content to preview.")
+        markdown_content = self.editorText(self.markdownOutput)
+        if not markdown_content:
+            QMessageBox.warning(self, "Preview Error", "There's no Markdown content to preview.")
+            return
+        # Rendered on a thread; only setHtml runs on the GUI thread.
+        self.previewButton.setEnabled(False)
+        self.previewThread = PreviewThread(markdown_content)
+        self.previewThread.finished.connect(self.showPreview)
+        self.previewThread.error.connect(self.onPreviewError)
+        self.previewThread.start()
+
+    def showPreview(self, html_content):
+        self.previewButton.setEnabled(True)
+        self.previewWindow = QTextEdit()
+        self.previewWindow.setHtml(html_content)
+        self.previewWindow.setReadOnly(True)
+        self.previewWindow.setWindowTitle("HTML Preview")
+        self.previewWindow.resize(600, 400)
+        self.previewWindow.show()
+
+    def onPreviewError(self, error_message):
+        self.previewButton.setEnabled(True)
+        QMessageBox.critical(self, "Preview Error", f"Failed to render the preview: {error_message}")
 
     def openGitHubRepo(self):
         url = QUrl("https://github.com/yourusername/HTML-to-md-advanced")
@@ -376,9 +1475,32 @@ class HTMLtoMarkdownConverter(QMainWindow):
             'top_p': self.top_p.value(),
             'repetition_penalty': self.repetition_penalty.value(),
             'num_return_sequences': self.num_return_sequences.value(),
+            'stream_output': self.stream_output.isChecked(),
+            'stop_degenerate': self.stop_degenerate.isChecked(),
+            'speculative': self.speculative.isChecked(),
+            'draft_tokens': self.draft_tokens.value(),
+            'ngram_size': self.ngram_size.value(),
+            'chunking': self.chunking_enabled.isChecked(),
+            'chunk_tokens': self.chunk_tokens.value(),
+            'chunk_workers': self.chunk_workers.value(),
             'remove_styles': self.removeStylesCheckbox.isChecked(),
+            'incremental': self.incrementalCheckbox.isChecked(),
+            'block_cache_size': self.block_cache_size.value(),
+            'reduction_passes': [name for name, checkbox in self.reduction_passes.items() if checkbox.isChecked()],
+            'memory_budget': self.memory_budget.value(),
+            'preload_model': self.preload_model.isChecked(),
+            'use_cache': self.use_cache.isChecked(),
+            'cache_size': self.cache_size.value(),
             'model': self.model_selector.currentText(),
-            'device': self.device
+            'device': self.device,
+            'precision': self.precision_selector.currentData(),
+            'compile_decode': self.compile_decode.isChecked(),
+            'intra_op_threads': self.intra_op_threads.value(),
+            'inter_op_threads': self.inter_op_threads.value(),
+            'fetch_workers': self.fetch_workers.value(),
+            'routing': self.engine_selector.currentData(),
+            'record_metrics': self.record_metrics.isChecked(),
+            'metrics_log': self.metrics_log.text()
         }
         with open('settings.json', 'w') as f:
             json.dump(settings, f)
@@ -394,13 +1516,41 @@ class HTMLtoMarkdownConverter(QMainWindow):
             self.top_p.setValue(settings.get('top_p', 0.95))
             self.repetition_penalty.setValue(settings.get('repetition_penalty', 1.1))
             self.num_return_sequences.setValue(settings.get('num_return_sequences', 1))
+            self.stream_output.setChecked(settings.get('stream_output', True))
+            self.stop_degenerate.setChecked(settings.get('stop_degenerate', True))
+            self.speculative.setChecked(settings.get('speculative', False))
+            self.draft_tokens.setValue(settings.get('draft_tokens', DEFAULT_DRAFT_TOKENS))
+            self.ngram_size.setValue(settings.get('ngram_size', DEFAULT_NGRAM_SIZE))
+            self.chunking_enabled.setChecked(settings.get('chunking', True))
+            self.chunk_tokens.setValue(settings.get('chunk_tokens', 1024))
+            self.chunk_workers.setValue(settings.get('chunk_workers', 1))
             self.removeStylesCheckbox.setChecked(settings.get('remove_styles', False))
+            self.incrementalCheckbox.setChecked(settings.get('incremental', False))
+            self.block_cache_size.setValue(settings.get('block_cache_size', DEFAULT_BLOCK_CACHE_BYTES // MB))
+            enabled_passes = settings.get('reduction_passes', list(PASSES))
+            for name, checkbox in self.reduction_passes.items():
+                checkbox.setChecked(name in enabled_passes)
+            self.memory_budget.setValue(settings.get('memory_budget', 8.0))
+            self.preload_model.setChecked(settings.get('preload_model', True))
+            self.use_cache.setChecked(settings.get('use_cache', True))
+            self.cache_size.setValue(settings.get('cache_size', 512))
             self.model_selector.setCurrentText(settings.get('model', '0.5B Model'))
             self.device = settings.get('device', 'cpu')
             if self.device == 'cpu':
                 self.cpu_radio.setChecked(True)
             else:
                 self.gpu_radio.setChecked(True)
+            self.precision_selector.setCurrentIndex(
+                max(0, self.precision_selector.findData(settings.get('precision', DEFAULT_BACKEND))))
+            self.updateBackendOptions()
+            self.compile_decode.setChecked(settings.get('compile_decode', False))
+            self.intra_op_threads.setValue(settings.get('intra_op_threads', 0))
+            self.inter_op_threads.setValue(settings.get('inter_op_threads', 0))
+            self.fetch_workers.setValue(settings.get('fetch_workers', DEFAULT_WORKERS))
+            self.engine_selector.setCurrentIndex(
+                max(0, self.engine_selector.findData(settings.get('routing', DEFAULT_ROUTING))))
+            self.record_metrics.setChecked(settings.get('record_metrics', False))
+            self.metrics_log.setText(settings.get('metrics_log', ''))
         except FileNotFoundError:
             # If settings file doesn't exist, use defaults
             pass
@@ -412,10 +1562,35 @@ class HTMLtoMarkdownConverter(QMainWindow):
         self.top_p.setValue(0.95)
         self.repetition_penalty.setValue(1.1)
         self.num_return_sequences.setValue(1)
+        self.stream_output.setChecked(True)
+        self.stop_degenerate.setChecked(True)
+        self.speculative.setChecked(False)
+        self.draft_tokens.setValue(DEFAULT_DRAFT_TOKENS)
+        self.ngram_size.setValue(DEFAULT_NGRAM_SIZE)
+        self.chunking_enabled.setChecked(True)
+        self.chunk_tokens.setValue(1024)
+        self.chunk_workers.setValue(1)
         self.removeStylesCheckbox.setChecked(False)
+        self.incrementalCheckbox.setChecked(False)
+        self.block_cache_size.setValue(DEFAULT_BLOCK_CACHE_BYTES // MB)
+        for checkbox in self.reduction_passes.values():
+            checkbox.setChecked(True)
+        self.memory_budget.setValue(8.0)
+        self.preload_model.setChecked(True)
+        self.use_cache.setChecked(True)
+        self.cache_size.setValue(512)
         self.model_selector.setCurrentText('0.5B Model')
         self.cpu_radio.setChecked(True)
         self.device = 'cpu'
+        self.precision_selector.setCurrentIndex(self.precision_selector.findData(DEFAULT_BACKEND))
+        self.compile_decode.setChecked(False)
+        self.intra_op_threads.setValue(0)
+        self.inter_op_threads.setValue(0)
+        self.fetch_workers.setValue(DEFAULT_WORKERS)
+        self.engine_selector.setCurrentIndex(self.engine_selector.findData(DEFAULT_ROUTING))
+        self.record_metrics.setChecked(False)
+        self.metrics_log.clear()
+        self.updateInstrumentation()
         QMessageBox.information(self, "Settings Reset", "Settings have been reset to default values.")
 
     def getStyleSheet(self):
@@ -424,7 +1599,7 @@ class HTMLtoMarkdownConverter(QMainWindow):
                 background-color: #2b2b2b;
                 color: #ffffff;
             }
-            QTextEdit, QLineEdit {
+            QTextEdit, QPlainTextEdit, QLineEdit {
                 background-color: #3c3f41;
                 color: #ffffff;
                 border: 1px solid #555555;
@@ -473,8 +1648,15 @@ class HTMLtoMarkdownConverter(QMainWindow):
         """
 
 class AdvancedHTMLtoMarkdownConverter(HTMLtoMarkdownConverter):
+    # Emitted from the directory watcher's thread with a list of
+    # watcher.Change.
+    watchReady = pyqtSignal(list)
+
     def __init__(self):
         super().__init__()
+        self.watcher = None
+        self.watchConverted = 0
+        self.watchReady.connect(self.onWatchReady)
         self.initAdvancedUI()
 
     def initAdvancedUI(self):
@@ -505,9 +1687,49 @@ class AdvancedHTMLtoMarkdownConverter(HTMLtoMarkdownConverter):
         # Batch processing
         batch_group = QGroupBox("Batch Processing")
         batch_layout = QVBoxLayout()
+        self.batch_size = QSpinBox()
+        self.batch_size.setRange(1, 256)
+        self.batch_size.setValue(8)
+        batch_layout.addWidget(QLabel("Batch Size:"))
+        batch_layout.addWidget(self.batch_size)
+
+        self.token_budget = QSpinBox()
+        self.token_budget.setRange(1024, 1048576)
+        self.token_budget.setSingleStep(1024)
+        self.token_budget.setValue(32768)
+        batch_layout.addWidget(QLabel("Token Budget per Batch:"))
+        batch_layout.addWidget(self.token_budget)
+
+        # More than one worker process converts the whole directory tree in
+        # parallel and resumes from a manifest when run again.
+        self.batch_workers = QSpinBox()
+        self.batch_workers.setRange(1, os.cpu_count() or 1)
+        self.batch_workers.setValue(1)
+        batch_layout.addWidget(QLabel("Worker Processes (more than 1 includes subdirectories):"))
+        batch_layout.addWidget(self.batch_workers)
+
+        # Bulk outputs write one record per input instead of one .md file.
+        self.batch_sink = QComboBox()
+        for kind, label in SINKS.items():
+            self.batch_sink.addItem(label, kind)
+        batch_layout.addWidget(QLabel("Output:"))
+        batch_layout.addWidget(self.batch_sink)
+
         self.batchButton = QPushButton("Select Directory for Batch Processing")
         self.batchButton.clicked.connect(self.batchProcess)
         batch_layout.addWidget(self.batchButton)
+
+        self.batchProgress = QProgressBar()
+        self.batchProgress.setVisible(False)
+        batch_layout.addWidget(self.batchProgress)
+
+        # Watching converts files as they are created or changed, writing
+        # Markdown next to them; the model stays loaded in between.
+        self.watchButton = QPushButton("Watch Directory...")
+        self.watchButton.clicked.connect(self.toggleWatching)
+        batch_layout.addWidget(self.watchButton)
+        self.watchLabel = QLabel()
+        batch_layout.addWidget(self.watchLabel)
         batch_group.setLayout(batch_layout)
         layout.addWidget(batch_group)
 
@@ -516,23 +1738,135 @@ class AdvancedHTMLtoMarkdownConverter(HTMLtoMarkdownConverter):
 
     def batchProcess(self):
         directory = QFileDialog.getExistingDirectory(self, "Select Directory for Batch Processing")
-        if directory:
-            for filename in os.listdir(directory):
-                if filename.endswith(".html"):
-                    with open(os.path.join(directory, filename), 'r', encoding='utf-8') as file:
-                        html_content = file.read()
-                    # Process HTML content
-                    markdown_content = self.processHTML(html_content)
-                    # Save markdown content
-                    output_filename = os.path.splitext(filename)[0] + '.md'
-                    with open(os.path.join(directory, output_filename), 'w', encoding='utf-8') as file:
-                        file.write(markdown_content)
-            QMessageBox.information(self, "Batch Processing Complete", "All HTML files in the selected directory have been converted to Markdown.")
+        if not directory:
+            return
+        if self.batch_workers.value() > 1:
+            self.shardedBatchProcess(directory)
+            return
+        paths = list_html_files(directory)
+        if not paths:
+            QMessageBox.warning(self, "Input Error", "The selected directory contains no HTML files.")
+            return
+
+        sink = self.chooseSink()
+        if sink is False:
+            return
+        converter = self.createConverter(reduce=self.removeStylesCheckbox.isChecked())
+        task = BatchTask(paths, converter, self.batch_size.value(), self.token_budget.value(), sink)
+        task.progress.connect(self.onBatchProgress)
+        task.finished.connect(self.onBatchFinished)
+        task.cancelled.connect(self.onBatchCancelled)
+        task.error.connect(self.onBatchError)
+        self.jobQueue.submit(Job('batch', f"{len(paths)} file(s) in {directory}", task.work, BATCH))
+
+    def chooseSink(self):
+        # The selected sinks.py output, None for Markdown files next to the
+        # inputs, or False if the user cancelled the path dialog.
+        kind = self.batch_sink.currentData()
+        if kind == 'files':
+            return None
+        if kind == 'jsonl-gz':
+            path = QFileDialog.getExistingDirectory(self, "Select Directory for the Shards")
+        else:
+            file_filter = "JSON Lines (*.jsonl)" if kind == 'jsonl' else "SQLite Databases (*.sqlite *.db)"
+            path, _ = QFileDialog.getSaveFileName(self, "Select Output File", "", file_filter)
+        return open_sink(kind, path) if path else False
+
+    def shardedBatchProcess(self, directory):
+        if self.batch_sink.currentData() != 'files':
+            QMessageBox.information(self, "Batch Output", "Worker processes write Markdown files into the "
+                                    "directory tree; the Output setting applies to single-process batches.")
+        converter = self.createConverter(reduce=self.removeStylesCheckbox.isChecked())
+        runner = ShardedRunner(converter, directory, workers=self.batch_workers.value(),
+                               batch_size=self.batch_size.value(), token_budget=self.token_budget.value())
+        task = ShardedTask(runner)
+        task.progress.connect(self.onBatchProgress)
+        task.finished.connect(self.onShardedBatchFinished)
+        task.cancelled.connect(self.onBatchCancelled)
+        task.error.connect(self.onBatchError)
+        self.jobQueue.submit(Job('batch', f"{directory} with {runner.workers} worker processes", task.work, BATCH))
+
+    def onShardedBatchFinished(self, progress):
+        self.batchProgress.setVisible(False)
+        QMessageBox.information(self, "Batch Processing Complete", f"Processed {format_progress(progress)}.")
+
+    def onBatchProgress(self, done, total):
+        self.batchProgress.setVisible(True)
+        self.batchProgress.setRange(0, total)
+        self.batchProgress.setValue(done)
+
+    def onBatchCancelled(self):
+        self.batchProgress.setVisible(False)
+
+    def onBatchFinished(self, converted, cached, failed, stops):
+        self.batchProgress.setVisible(False)
+        self.updateCacheStats()
+        message = f"Converted {converted + cached} HTML file(s) to Markdown."
+        if cached:
+            message += f" {cached} came from the result cache."
+        if failed:
+            message += f" {failed} file(s) failed."
+        if stops['stopped']:
+            message += f" {format_summary(stops)}."
+        QMessageBox.information(self, "Batch Processing Complete", message)
+
+    def onBatchError(self, error_message):
+        self.batchProgress.setVisible(False)
+        QMessageBox.critical(self, "Batch Error", f"An error occurred: {error_message}")
+
+    def batchOptions(self):
+        return self.batch_size.value(), self.token_budget.value()
+
+    def toggleWatching(self):
+        if self.watcher is not None:
+            self.stopWatching()
+            return
+        directory = QFileDialog.getExistingDirectory(self, "Select Directory to Watch")
+        if not directory:
+            return
+        self.watcher = DirectoryWatcher(directory, self.watchReady.emit).start()
+        self.watchConverted = 0
+        self.watchButton.setText("Stop Watching")
+        self.watchLabel.setText(f"Watching {directory} ({self.watcher.mode})")
+        self.preloadModel()
+
+    def stopWatching(self):
+        self.watcher.stop(timeout=5)
+        self.watcher = None
+        self.watchButton.setText("Watch Directory...")
+        self.watchLabel.setText("Not watching")
+
+    def onWatchReady(self, changes):
+        if self.watcher is None:
+            return
+        paths = [change.path for change in changes]
+        detected = min(change.detected for change in changes)
+        converter = self.createConverter(reduce=self.removeStylesCheckbox.isChecked())
+        task = BatchTask(paths, converter, self.batch_size.value(), self.token_budget.value())
+        task.finished.connect(lambda converted, cached, failed, stops: self.onWatchBatchFinished(
+            converted + cached, failed, detected))
+        task.error.connect(lambda error_message: self.watchLabel.setText(f"Watch conversion failed: {error_message}"))
+        # Ahead of directory batches, behind interactive conversions.
+        self.jobQueue.submit(Job('watch', f"{len(paths)} changed file(s) in {self.watcher.directory}", task.work,
+                                 NORMAL))
+
+    def onWatchBatchFinished(self, converted, failed, detected):
+        self.watchConverted += converted
+        if self.watcher is None:
+            return
+        message = (f"Watching {self.watcher.directory} ({self.watcher.mode}): {self.watchConverted} converted, "
+                   f"last batch written {time.time() - detected:.1f} s after the first file landed")
+        if failed:
+            message += f", {failed} failed"
+        self.watchLabel.setText(message)
+
+    def closeEvent(self, event):
+        if self.watcher is not None:
+            self.watcher.stop(timeout=5)
+        super().closeEvent(event)
 
     def processHTML(self, html_content):
-        # This method should be implemented to process HTML content
-        # For now, we'll use a placeholder implementation
-        return "Placeholder Markdown content"
+        return self.createConverter(reduce=self.removeStylesCheckbox.isChecked()).convert(html_content)
 
     def convertHTML(self):
         super().convertHTML()
@@ -0,0 +1,208 @@
+import gc
+import threading
+from collections import OrderedDict
+
+import backends
+
+
+def _tensor_bytes(value):
+    if isinstance(value, (tuple, list)):
+        return sum(_tensor_bytes(item) for item in value)
+    if hasattr(value, 'numel') and hasattr(value, 'element_size'):
+        return value.numel() * value.element_size()
+    return 0
+
+
+def model_size_bytes(model):
+    # state_dict rather than parameters() so that the packed weights of
+    # dynamically quantized Linear layers are counted too.
+    return sum(_tensor_bytes(value) for value in model.state_dict().values())
+
+
+def _mapped_regions(extension='.safetensors'):
+    regions = []
+    with open('/proc/self/maps') as maps:
+        for line in maps:
+            fields = line.split()
+            if len(fields) >= 6 and fields[-1].endswith(extension):
+                start, end = fields[0].split('-')
+                regions.append((int(start, 16), int(end, 16)))
+    return regions
+
+
+def mapped_bytes(model):
+    # Bytes of weights still backed by a memory-mapped safetensors file, i.e.
+    # paged in on first use and shared through the page cache with other
+    # processes that load the same checkpoint. transformers maps safetensors
+    # files; tensors only stay mapped when no dtype conversion, quantization
+    # or device move copied them. None where /proc/self/maps is unavailable.
+    try:
+        regions = _mapped_regions()
+    except OSError:
+        return None
+    total = 0
+    for value in model.state_dict().values():
+        if hasattr(value, 'data_ptr') and any(start <= value.data_ptr() < end for start, end in regions):
+            total += _tensor_bytes(value)
+    return total
+
+
+class ModelRegistry:
+    # Process-wide cache of loaded (tokenizer, model) pairs keyed by
+    # (model path, device, dtype, backend). Least recently used entries are evicted
+    # once the loaded weights exceed memory_budget bytes (None = unlimited).
+
+    def __init__(self, memory_budget=None):
+        self.memory_budget = memory_budget
+        self._entries = OrderedDict()
+        self._tokenizers = {}
+        self._load_locks = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def makeKey(model_path, device, dtype=None, backend=None):
+        return (model_path, device, str(dtype) if dtype is not None else None, backend or backends.DEFAULT_BACKEND)
+
+    def get(self, model_path, device='cpu', dtype=None, backend=None):
+        key = self.makeKey(model_path, device, dtype, backend)
+        with self._lock:
+            entry = self._touch(key)
+            if entry is not None:
+                return entry['tokenizer'], entry['model']
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+
+        # Only one thread loads a given key; the others wait on its lock and
+        # then pick the finished entry up from the cache.
+        with load_lock:
+            with self._lock:
+                entry = self._touch(key)
+                if entry is not None:
+                    return entry['tokenizer'], entry['model']
+
+            tokenizer, model = self._load(model_path, device, dtype, backend)
+            size = model_size_bytes(model)
+            mapped = mapped_bytes(model)
+
+            with self._lock:
+                self._entries[key] = {'tokenizer': tokenizer, 'model': model, 'size': size, 'mapped': mapped,
+                                      'warm': False}
+                self._load_locks.pop(key, None)
+                evicted = self._evict(keep=key)
+
+        if evicted:
+            self._releaseMemory()
+        return tokenizer, model
+
+    def getTokenizer(self, model_path):
+        # Tokenizers are small and shared by every device/dtype of a model,
+        # so they are cached separately and never evicted.
+        with self._lock:
+            tokenizer = self._tokenizers.get(model_path)
+        if tokenizer is None:
+            from transformers import AutoTokenizer
+
+            tokenizer = AutoTokenizer.from_pretrained(model_path)
+            with self._lock:
+                tokenizer = self._tokenizers.setdefault(model_path, tokenizer)
+        return tokenizer
+
+    def loadedTokenizer(self, model_path):
+        # The tokenizer if it was already loaded, without loading it.
+        with self._lock:
+            return self._tokenizers.get(model_path)
+
+    def isLoaded(self, model_path, device='cpu', dtype=None, backend=None):
+        with self._lock:
+            return self.makeKey(model_path, device, dtype, backend) in self._entries
+
+    def info(self, model_path, device='cpu', dtype=None, backend=None):
+        # {'size', 'mapped', 'warm'} of a loaded model, or None.
+        with self._lock:
+            entry = self._entries.get(self.makeKey(model_path, device, dtype, backend))
+            if entry is None:
+                return None
+            return {'size': entry['size'], 'mapped': entry['mapped'], 'warm': entry['warm']}
+
+    def markWarm(self, model_path, device='cpu', dtype=None, backend=None):
+        with self._lock:
+            entry = self._entries.get(self.makeKey(model_path, device, dtype, backend))
+            if entry is not None:
+                entry['warm'] = True
+
+    def loadedKeys(self):
+        with self._lock:
+            return list(self._entries.keys())
+
+    def usedBytes(self):
+        with self._lock:
+            return sum(entry['size'] for entry in self._entries.values())
+
+    def setMemoryBudget(self, memory_budget):
+        with self._lock:
+            self.memory_budget = memory_budget
+            evicted = self._evict()
+        if evicted:
+            self._releaseMemory()
+
+    def unload(self, model_path=None, device=None, dtype=None, backend=None):
+        # With no arguments every model is unloaded; otherwise only entries
+        # matching all of the given fields.
+        with self._lock:
+            keys = [
+                key for key in self._entries
+                if (model_path is None or key[0] == model_path)
+                and (device is None or key[1] == device)
+                and (dtype is None or key[2] == str(dtype))
+                and (backend is None or key[3] == backend)
+            ]
+            for key in keys:
+                del self._entries[key]
+        if keys:
+            self._releaseMemory()
+        return len(keys)
+
+    def _touch(self, key):
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def _evict(self, keep=None):
+        if self.memory_budget is None:
+            return 0
+        evicted = 0
+        total = sum(entry['size'] for entry in self._entries.values())
+        for key in list(self._entries.keys()):
+            if total <= self.memory_budget:
+                break
+            if key == keep:
+                continue
+            total -= self._entries.pop(key)['size']
+            evicted += 1
+        return evicted
+
+    def _load(self, model_path, device, dtype, backend):
+        from transformers import AutoModelForCausalLM
+
+        kwargs = backends.load_kwargs(backend)
+        if dtype is not None:
+            kwargs['dtype'] = dtype
+        tokenizer = self.getTokenizer(model_path)
+        model = AutoModelForCausalLM.from_pretrained(model_path, **kwargs).to(device)
+        model.eval()
+        model = backends.prepare(model, backend, device)
+        return tokenizer, model
+
+    def _releaseMemory(self):
+        gc.collect()
+        try:
+            import torch
+        except ImportError:
+            return
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+        if hasattr(torch, 'mps') and torch.backends.mps.is_available():
+            torch.mps.empty_cache()
+
+
+registry = ModelRegistry()
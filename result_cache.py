@@ -0,0 +1,141 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'html-to-md', 'results.sqlite')
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+CACHE_KEY_PARAMS = ('max_new_tokens', 'temperature', 'do_sample', 'top_p', 'repetition_penalty', 'stop_degenerate')
+
+
+def is_deterministic(params):
+    return not params.get('do_sample', False)
+
+
+class ResultCache:
+    # Content-addressed store of finished conversions in SQLite. Entries are
+    # keyed by a hash of the cleaned HTML, the model path and the generation
+    # parameters; once the stored Markdown exceeds max_bytes the least
+    # recently used entries are deleted. Only deterministic (do_sample=False)
+    # runs are served or stored, since a sampled run is expected to differ
+    # each time.
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._connection = None
+
+    def _connect(self):
+        if self._connection is None:
+            if self.path != ':memory:':
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "key TEXT PRIMARY KEY, markdown TEXT NOT NULL, size INTEGER NOT NULL, "
+                "created REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            self._connection.execute("CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)")
+            self._connection.commit()
+        return self._connection
+
+    @staticmethod
+    def makeKey(html_content, model_path, params, options=None):
+        # options covers anything else that changes the output, e.g. chunking.
+        payload = json.dumps({
+            'model': model_path,
+            'params': {name: params.get(name) for name in CACHE_KEY_PARAMS},
+            'options': options,
+        }, sort_keys=True)
+        digest = hashlib.sha256()
+        digest.update(payload.encode('utf-8'))
+        digest.update(b'\0')
+        digest.update(html_content.encode('utf-8'))
+        return digest.hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            connection = self._connect()
+            row = connection.execute("SELECT markdown FROM results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            connection.execute("UPDATE results SET accessed = ? WHERE key = ?", (time.time(), key))
+            connection.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key, markdown_content):
+        now = time.time()
+        with self._lock:
+            connection = self._connect()
+            connection.execute(
+                "INSERT OR REPLACE INTO results (key, markdown, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, markdown_content, len(markdown_content.encode('utf-8')), now, now)
+            )
+            self._evict(connection)
+            connection.commit()
+
+    def lookup(self, html_content, model_path, params, options=None):
+        if not is_deterministic(params):
+            return None
+        return self.get(self.makeKey(html_content, model_path, params, options))
+
+    def store(self, html_content, model_path, params, markdown_content, options=None):
+        if is_deterministic(params):
+            self.put(self.makeKey(html_content, model_path, params, options), markdown_content)
+
+    def _evict(self, connection):
+        if self.max_bytes is None:
+            return
+        total = connection.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = connection.execute("SELECT key, size FROM results ORDER BY accessed").fetchall()
+        stale = []
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            stale.append((key,))
+            total -= size
+        connection.executemany("DELETE FROM results WHERE key = ?", stale)
+
+    def setMaxBytes(self, max_bytes):
+        with self._lock:
+            self.max_bytes = max_bytes
+            if self._connection is not None:
+                self._evict(self._connection)
+                self._connection.commit()
+
+    def clear(self):
+        with self._lock:
+            connection = self._connect()
+            connection.execute("DELETE FROM results")
+            connection.commit()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            entries, size = self._connect().execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            'entries': entries,
+            'bytes': size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
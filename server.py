@@ -0,0 +1,426 @@
+import argparse
+import itertools
+import json
+import math
+import queue
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+from cli import add_converter_arguments, add_metrics_arguments, create_converter
+from fetcher import DEFAULT_WORKERS, Fetcher, HTTPCache, is_url
+from stopping import Cancelled, summarize
+
+# Per-request generation parameters and their types; anything else in a
+# request's "params" is rejected.
+REQUEST_PARAMS = {
+    'max_new_tokens': int,
+    'temperature': float,
+    'do_sample': bool,
+    'top_p': float,
+    'repetition_penalty': float,
+    'draft_tokens': int,
+    'ngram_size': int,
+    'stop_degenerate': bool,
+}
+# Valid values of the numeric parameters, as (check, description).
+PARAM_RANGES = {
+    'max_new_tokens': (lambda value: value >= 1, "at least 1"),
+    'temperature': (lambda value: value > 0, "greater than 0"),
+    'top_p': (lambda value: 0 < value <= 1, "greater than 0 and at most 1"),
+    'repetition_penalty': (lambda value: value > 0, "greater than 0"),
+    'draft_tokens': (lambda value: value >= 0, "at least 0"),
+    'ngram_size': (lambda value: value >= 1, "at least 1"),
+}
+TRUE_STRINGS = ('1', 'true', 'yes', 'on')
+FALSE_STRINGS = ('0', 'false', 'no', 'off')
+MAX_BODY_BYTES = 16 * 1024 * 1024
+
+
+class ServerBusy(Exception):
+    pass
+
+
+class FetchFailed(Exception):
+    pass
+
+
+def _coerce(kind, value):
+    # JSON values must have the parameter's type (an int is a valid float);
+    # query string values are parsed. Raises ValueError otherwise.
+    if isinstance(value, str):
+        if kind is not bool:
+            return kind(value)
+        if value.lower() in TRUE_STRINGS + FALSE_STRINGS:
+            return value.lower() in TRUE_STRINGS
+    elif isinstance(value, bool):
+        if kind is bool:
+            return value
+    elif isinstance(value, int) and kind in (int, float):
+        return kind(value)
+    elif isinstance(value, float) and kind is float:
+        return value
+    raise ValueError(value)
+
+
+def parse_params(values, max_new_tokens_limit):
+    if values is None:
+        return {}
+    if not isinstance(values, dict):
+        raise ValueError("params must be an object")
+    params = {}
+    for name, value in values.items():
+        if name not in REQUEST_PARAMS:
+            raise ValueError(f"Unknown generation parameter: {name}")
+        kind = REQUEST_PARAMS[name]
+        try:
+            value = _coerce(kind, value)
+        except ValueError:
+            raise ValueError(f"Invalid value for {name}: {value!r} (expected {kind.__name__})")
+        if kind is float and not math.isfinite(value):
+            raise ValueError(f"Invalid value for {name}: {value!r}")
+        check, description = PARAM_RANGES.get(name, (None, None))
+        if check is not None and not check(value):
+            raise ValueError(f"{name} must be {description}, got {value!r}")
+        params[name] = value
+    if params.get('max_new_tokens', 0) > max_new_tokens_limit:
+        raise ValueError(f"max_new_tokens is limited to {max_new_tokens_limit}")
+    return params
+
+
+class ConversionRequest:
+    _ids = itertools.count(1)
+
+    def __init__(self, html_content, params):
+        self.id = next(self._ids)
+        self.html_content = html_content
+        self.params = params
+        self.params_key = json.dumps(params, sort_keys=True)
+        self.enqueued = time.perf_counter()
+        self.queue_seconds = 0.0
+        self.markdown = None
+        self.cached = False
+        self.error = None
+        self.abandoned = False
+        self.done = threading.Event()
+
+    def estimatedTokens(self, default_max_new_tokens):
+        # About four bytes of HTML per token; BatchEngine enforces the exact
+        # budget once the batch is tokenized.
+        return len(self.html_content) // 4 + self.params.get('max_new_tokens', default_max_new_tokens)
+
+    def resolve(self, markdown_content=None, cached=False, error=None):
+        self.markdown = markdown_content
+        self.cached = cached
+        self.error = error
+        self.done.set()
+
+
+class BatchScheduler:
+    # Collects queued requests into shared generate batches on one worker
+    # thread that owns the model. After the first request arrives it waits
+    # up to max_wait seconds for more, until max_batch_size requests or an
+    # estimated token_budget is reached, then converts the batch; requests
+    # with different generation parameters are converted in separate groups.
+    # The queue holds at most max_queue requests; submit raises ServerBusy
+    # beyond that. Requests abandoned after a timeout are dropped from the
+    # queue, and a group is cancelled once all of its requests are abandoned.
+
+    def __init__(self, converter, max_batch_size=8, token_budget=32768, max_wait=0.05, max_queue=64):
+        self.converter = converter
+        self.max_batch_size = max(1, max_batch_size)
+        self.token_budget = token_budget
+        self.max_wait = max_wait
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.counters = {'requests': 0, 'rejected': 0, 'timed_out': 0, 'batches': 0, 'batched_requests': 0,
+                         'cached': 0, 'failed': 0, 'stopped': 0, 'degenerate': 0, 'saved_tokens': 0}
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self.run, name='batch-scheduler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        self._thread.join()
+
+    def count(self, name, value=1):
+        with self._lock:
+            self.counters[name] += value
+
+    def submit(self, html_content, params):
+        request = ConversionRequest(html_content, params)
+        try:
+            self.queue.put_nowait(request)
+        except queue.Full:
+            self.count('rejected')
+            raise ServerBusy("The conversion queue is full")
+        self.count('requests')
+        return request
+
+    def abandon(self, request):
+        # The client got its timeout response; the request is not converted
+        # unless it already is.
+        request.abandoned = True
+        self.count('timed_out')
+
+    def collect(self, first):
+        default_max_new_tokens = self.converter.params['max_new_tokens']
+        batch = [first]
+        tokens = first.estimatedTokens(default_max_new_tokens)
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size and tokens < self.token_budget:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                request = self.queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(request)
+            tokens += request.estimatedTokens(default_max_new_tokens)
+        return batch
+
+    def run(self):
+        while not self._stopping.is_set():
+            try:
+                first = self.queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            batch = [request for request in self.collect(first) if not request.abandoned]
+            if not batch:
+                continue
+            now = time.perf_counter()
+            for request in batch:
+                request.queue_seconds = now - request.enqueued
+            self.count('batches')
+            self.count('batched_requests', len(batch))
+            groups = {}
+            for request in batch:
+                groups.setdefault(request.params_key, []).append(request)
+            for requests in groups.values():
+                self.convertGroup(requests)
+
+    def convertGroup(self, requests):
+        requests = [request for request in requests if not request.abandoned]
+        if not requests:
+            return
+        by_id = {request.id: request for request in requests}
+
+        def on_result(request_id, markdown_content, cached):
+            if cached:
+                self.count('cached')
+            by_id.pop(request_id).resolve(markdown_content, cached)
+
+        def on_error(request_id, error):
+            self.count('failed')
+            by_id.pop(request_id).resolve(error=error)
+
+        converter = self.converter.withParams(requests[0].params).withCancellation(
+            lambda: all(request.abandoned for request in requests))
+        try:
+            stops = converter.convertMany(((request.id, request.html_content) for request in requests), on_result,
+                                          on_error, batch_size=self.max_batch_size, token_budget=self.token_budget)
+            for name, value in summarize(stops.values()).items():
+                self.count(name, value)
+        except Cancelled as e:
+            for request in list(by_id.values()):
+                by_id.pop(request.id).resolve(error=e)
+        except Exception as e:
+            for request in list(by_id.values()):
+                on_error(request.id, e)
+        for request in list(by_id.values()):
+            on_error(request.id, RuntimeError("The request was not converted"))
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+        stats['queued'] = self.queue.qsize()
+        stats['mean_batch_size'] = stats['batched_requests'] / stats['batches'] if stats['batches'] else 0.0
+        return stats
+
+
+class ConversionHandler(BaseHTTPRequestHandler):
+    # POST /convert  JSON {"html": ...} or {"url": ...}, optional "params";
+    #                or a raw text/html body with params in the query string.
+    #                Returns {"markdown", "cached", "seconds", "queue_seconds"};
+    #                503 with Retry-After while the queue is full.
+    # GET /health    model, device and queue depth.
+    # GET /stats     scheduler counters.
+
+    protocol_version = 'HTTP/1.1'
+    server_version = 'html-to-md'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def sendJSON(self, status, payload, headers=None):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def refuse(self, status, message):
+        # An error answered before the body is read: the connection is closed
+        # since the unread body would be taken for the next request.
+        self.sendJSON(status, {'error': message}, {'Connection': 'close'})
+        self.close_connection = True
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        scheduler = self.server.scheduler
+        if path == '/health':
+            self.sendJSON(200, {
+                'status': 'ok',
+                'model': scheduler.converter.model_path,
+                'device': scheduler.converter.device,
+                'queued': scheduler.queue.qsize(),
+            })
+        elif path == '/stats':
+            self.sendJSON(200, scheduler.stats())
+        else:
+            self.sendJSON(404, {'error': f"Unknown path: {path}"})
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if url.path != '/convert':
+            self.sendJSON(404, {'error': f"Unknown path: {url.path}"})
+            return
+        length = self.headers.get('Content-Length')
+        if length is None:
+            self.refuse(411, "A Content-Length header is required")
+            return
+        try:
+            length = int(length)
+        except ValueError:
+            length = -1
+        if length < 0:
+            self.refuse(400, "Invalid Content-Length header")
+            return
+        if length > MAX_BODY_BYTES:
+            self.refuse(413, f"Request bodies are limited to {MAX_BODY_BYTES} bytes")
+            return
+        body = self.rfile.read(length).decode('utf-8', errors='replace')
+
+        start = time.perf_counter()
+        try:
+            html_content, params = self.parseRequest(body, dict(parse_qsl(url.query)))
+            request = self.server.scheduler.submit(html_content, params)
+        except ServerBusy as e:
+            self.sendJSON(503, {'error': str(e)}, {'Retry-After': '1'})
+            return
+        except ValueError as e:
+            self.sendJSON(400, {'error': str(e)})
+            return
+        except FetchFailed as e:
+            self.sendJSON(502, {'error': f"Could not fetch the page: {e}"})
+            return
+
+        if not request.done.wait(self.server.request_timeout):
+            self.server.scheduler.abandon(request)
+            self.sendJSON(504, {'error': "The conversion timed out"})
+            return
+        if request.error is not None:
+            self.sendJSON(500, {'error': str(request.error)})
+            return
+        self.sendJSON(200, {
+            'markdown': request.markdown,
+            'cached': request.cached,
+            'seconds': round(time.perf_counter() - start, 4),
+            'queue_seconds': round(request.queue_seconds, 4),
+        })
+
+    def parseRequest(self, body, query):
+        limit = self.server.max_new_tokens_limit
+        if self.headers.get('Content-Type', '').startswith('application/json'):
+            try:
+                payload = json.loads(body)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"Invalid JSON: {e}")
+            if not isinstance(payload, dict):
+                raise ValueError("Expected a JSON object")
+            params = parse_params(payload.get('params'), limit)
+            if 'url' in payload:
+                if not isinstance(payload['url'], str) or not is_url(payload['url']):
+                    raise ValueError("url must be an http(s) URL")
+                try:
+                    return self.server.fetcher.fetch(payload['url']).text, params
+                except Exception as e:
+                    raise FetchFailed(e)
+            if not isinstance(payload.get('html'), str):
+                raise ValueError("Expected an 'html' or 'url' field")
+            return payload['html'], params
+        return body, parse_params(query, limit)
+
+
+class ConversionServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, scheduler, fetcher=None, request_timeout=600, max_new_tokens_limit=4096,
+                 verbose=False):
+        super().__init__(address, ConversionHandler)
+        self.scheduler = scheduler
+        self.fetcher = fetcher or Fetcher()
+        self.request_timeout = request_timeout
+        self.max_new_tokens_limit = max_new_tokens_limit
+        self.verbose = verbose
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="Serve HTML to Markdown conversion over HTTP with the model kept in memory.",
+        epilog="POST HTML to /convert, e.g. curl --data-binary @page.html http://127.0.0.1:8000/convert"
+    )
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    add_converter_arguments(parser)
+
+    scheduling = parser.add_argument_group("scheduling")
+    scheduling.add_argument('--max-wait-ms', type=float, default=50,
+                            help="how long the first request of a batch waits for others to join")
+    scheduling.add_argument('--max-queue', type=int, default=64,
+                            help="queued requests before new ones are answered 503 Service Unavailable")
+    scheduling.add_argument('--request-timeout', type=float, default=600)
+    scheduling.add_argument('--max-new-tokens-limit', type=int, default=4096,
+                            help="upper bound for a request's max_new_tokens")
+    scheduling.add_argument('--fetch-workers', type=int, default=DEFAULT_WORKERS,
+                            help="pooled connections for {\"url\": ...} requests")
+
+    add_metrics_arguments(parser)
+    parser.add_argument('-v', '--verbose', action='store_true', help="log requests to stderr")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    converter = create_converter(args)
+    if converter.routing != 'rules':
+        print(f"Loading {converter.model_path} on {converter.device}...", file=sys.stderr)
+        converter.preload()
+
+    scheduler = BatchScheduler(converter, args.batch_size, args.token_budget, args.max_wait_ms / 1000,
+                               args.max_queue)
+    scheduler.start()
+    server = ConversionServer((args.host, args.port), scheduler, Fetcher(HTTPCache(), args.fetch_workers),
+                              args.request_timeout, args.max_new_tokens_limit, args.verbose)
+    print(f"Listening on http://{args.host}:{server.server_address[1]}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        scheduler.stop()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
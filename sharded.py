@@ -0,0 +1,361 @@
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+from collections import namedtuple
+
+from backends import configure_threads
+from converter import Converter
+from result_cache import ResultCache
+
+# Multi-process batch conversion. Worker processes each load the model once
+# with an equal share of the CPU threads and pull work from one shared
+# queue: a directory item is listed by whichever worker takes it (its
+# subdirectories go back on the queue), HTML files are converted in batches.
+# A SQLite manifest records every file's hash, status and conversion
+# settings, so a re-run skips files that are done and unchanged under the
+# same settings and an interrupted run resumes where it stopped.
+
+HTML_EXTENSIONS = ('.html', '.htm')
+MANIFEST_NAME = '.html-to-md-manifest.sqlite'
+
+Progress = namedtuple('Progress', ['converted', 'skipped', 'failed', 'discovered', 'files_per_second', 'eta_seconds'])
+
+
+def file_digest(content):
+    return hashlib.sha256(content).hexdigest()
+
+
+def settings_key(converter):
+    # Hash of everything besides a file's content that shapes its Markdown:
+    # model, backend, generation parameters and pipeline options.
+    settings = {
+        'model': converter.model_path,
+        'params': converter.params,
+        'options': converter.cacheOptions(),
+        'reduce': converter.reduce,
+        'passes': converter.passes,
+        'routing': converter.routing,
+        'route_threshold': converter.route_threshold,
+    }
+    return hashlib.sha256(json.dumps(settings, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def converter_options(converter):
+    # Picklable keyword arguments that rebuild converter in a worker; the
+    # result cache is passed by path and reopened there.
+    return {
+        'model_path': converter.model_path,
+        'device': converter.device,
+        'params': dict(converter.params),
+        'reduce': converter.reduce,
+        'passes': converter.passes,
+        'chunking': converter.chunking,
+        'backend': converter.backend,
+        'routing': converter.routing,
+        'route_threshold': converter.route_threshold,
+        'cache_path': converter.cache.path if converter.cache is not None else None,
+    }
+
+
+def output_path(path, root, output_dir):
+    if output_dir is None:
+        return os.path.splitext(path)[0] + '.md'
+    return os.path.join(output_dir, os.path.splitext(os.path.relpath(path, root))[0] + '.md')
+
+
+def format_eta(seconds):
+    if seconds is None:
+        return "unknown"
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}"
+
+
+def format_progress(progress):
+    return (f"{progress.converted + progress.skipped + progress.failed}/{progress.discovered} files "
+            f"({progress.skipped} unchanged, {progress.failed} failed), "
+            f"{progress.files_per_second:.2f} files/s, ETA {format_eta(progress.eta_seconds)}")
+
+
+class Manifest:
+    # Per-file hash, status ('done' or 'failed') and settings_key of a
+    # sharded run. Only the coordinating process writes to it.
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._connection = sqlite3.connect(path)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            "path TEXT PRIMARY KEY, hash TEXT NOT NULL, settings TEXT NOT NULL, status TEXT NOT NULL, "
+            "output TEXT, error TEXT, seconds REAL, updated REAL NOT NULL)"
+        )
+        self._connection.commit()
+
+    def completed(self, settings):
+        # {path: hash} of files converted successfully with these settings.
+        return dict(self._connection.execute(
+            "SELECT path, hash FROM files WHERE status = 'done' AND settings = ?", (settings,)))
+
+    def record(self, path, digest, settings, status, output=None, error=None, seconds=None):
+        self._connection.execute(
+            "INSERT OR REPLACE INTO files (path, hash, settings, status, output, error, seconds, updated) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (path, digest, settings, status, output, error, seconds, time.time())
+        )
+        self._connection.commit()
+
+    def counts(self):
+        return dict(self._connection.execute("SELECT status, COUNT(*) FROM files GROUP BY status"))
+
+    def close(self):
+        self._connection.close()
+
+
+def _list_directory(directory, tasks, results):
+    found = 0
+    try:
+        entries = sorted(os.scandir(directory), key=lambda entry: entry.name)
+    except OSError as e:
+        results.put(('result', directory, '', 'failed', None, 0.0, str(e)))
+        return
+    for entry in entries:
+        if entry.is_dir(follow_symlinks=False):
+            tasks.put(('dir', entry.path))
+        elif entry.is_file() and entry.name.lower().endswith(HTML_EXTENSIONS):
+            tasks.put(('file', entry.path))
+            found += 1
+    results.put(('discovered', found))
+
+
+def _convert_files(converter, paths, completed, root, output_dir, batch_size, token_budget, results):
+    items = []
+    digests = {}
+    for path in paths:
+        try:
+            with open(path, 'rb') as file:
+                content = file.read()
+        except OSError as e:
+            results.put(('result', path, '', 'failed', None, 0.0, str(e)))
+            continue
+        digests[path] = file_digest(content)
+        if completed.get(path) == digests[path]:
+            results.put(('skipped', path))
+            continue
+        items.append((path, content.decode('utf-8', errors='replace')))
+    if not items:
+        return
+
+    start = time.perf_counter()
+
+    def on_result(path, markdown_content, cached):
+        target = output_path(path, root, output_dir)
+        os.makedirs(os.path.dirname(os.path.abspath(target)), exist_ok=True)
+        with open(target, 'w', encoding='utf-8') as file:
+            file.write(markdown_content)
+        results.put(('result', path, digests[path], 'done', target, (time.perf_counter() - start) / len(items),
+                     None))
+
+    def on_error(path, error):
+        results.put(('result', path, digests[path], 'failed', None, 0.0, str(error)))
+
+    converter.convertMany(items, on_result, on_error, batch_size=batch_size, token_budget=token_budget)
+
+
+def _worker(options, threads, completed, root, output_dir, batch_size, token_budget, tasks, results):
+    configure_threads(threads, 1)
+    options = dict(options)
+    cache_path = options.pop('cache_path')
+    converter = Converter(cache=ResultCache(cache_path) if cache_path else None, **options)
+    while True:
+        kind, path = tasks.get()
+        if kind == 'stop':
+            tasks.task_done()
+            return
+        if kind == 'dir':
+            _list_directory(path, tasks, results)
+            tasks.task_done()
+            continue
+        # Take up to batch_size queued files for one convertMany call;
+        # directories met on the way are listed right away.
+        files = [path]
+        taken = 1
+        while len(files) < batch_size:
+            try:
+                kind, path = tasks.get_nowait()
+            except queue.Empty:
+                break
+            taken += 1
+            if kind == 'dir':
+                _list_directory(path, tasks, results)
+            elif kind == 'file':
+                files.append(path)
+            else:
+                tasks.put((kind, path))
+                break
+        try:
+            _convert_files(converter, files, completed, root, output_dir, batch_size, token_budget, results)
+        except Exception as e:
+            for file_path in files:
+                results.put(('result', file_path, '', 'failed', None, 0.0, str(e)))
+        for _ in range(taken):
+            tasks.task_done()
+
+
+class ShardedRunner:
+    # Converts every HTML file below root with `workers` processes (default:
+    # one per four CPU cores). converter supplies the model and pipeline
+    # options; each worker gets `threads` torch threads (default: an equal
+    # share of the cores). Outputs mirror root's layout in output_dir, or go
+    # next to the inputs.
+
+    def __init__(self, converter, root, output_dir=None, workers=None, manifest_path=None, batch_size=8,
+                 token_budget=32768, threads=None):
+        cpus = os.cpu_count() or 1
+        self.options = converter_options(converter)
+        self.settings = settings_key(converter)
+        self.root = os.path.abspath(root)
+        self.output_dir = os.path.abspath(output_dir) if output_dir else None
+        self.workers = max(1, workers or cpus // 4)
+        self.threads = threads or max(1, cpus // self.workers)
+        self.manifest_path = manifest_path or os.path.join(self.output_dir or self.root, MANIFEST_NAME)
+        self.batch_size = max(1, batch_size)
+        self.token_budget = token_budget
+
+    def run(self, on_progress=None, should_stop=None, progress_interval=1.0):
+        # Returns the final Progress. on_progress(Progress) is called about
+        # every progress_interval seconds; when should_stop() returns True the
+        # workers are terminated (finished files stay in the manifest).
+        manifest = Manifest(self.manifest_path)
+        context = multiprocessing.get_context('spawn')
+        tasks = context.JoinableQueue()
+        results = context.Queue()
+        tasks.put(('dir', self.root))
+        completed = manifest.completed(self.settings)
+        processes = [
+            context.Process(target=_worker, name=f'html-to-md-{index}', daemon=True,
+                            args=(self.options, self.threads, completed, self.root, self.output_dir,
+                                  self.batch_size, self.token_budget, tasks, results))
+            for index in range(self.workers)
+        ]
+        for process in processes:
+            process.start()
+
+        def stop_workers():
+            tasks.join()
+            for _ in processes:
+                tasks.put(('stop', None))
+
+        threading.Thread(target=stop_workers, daemon=True).start()
+
+        counts = {'done': 0, 'skipped': 0, 'failed': 0, 'discovered': 0}
+        start = time.perf_counter()
+        last_report = 0.0
+
+        def progress():
+            elapsed = time.perf_counter() - start
+            processed = counts['done'] + counts['failed']
+            rate = processed / elapsed if elapsed > 0 else 0.0
+            remaining = counts['discovered'] - processed - counts['skipped']
+            eta = remaining / rate if rate > 0 else None
+            return Progress(counts['done'], counts['skipped'], counts['failed'], counts['discovered'], rate, eta)
+
+        try:
+            while True:
+                try:
+                    message = results.get(timeout=0.2)
+                except queue.Empty:
+                    message = None
+                if message is not None:
+                    self.handle(message, manifest, counts)
+                elif not any(process.is_alive() for process in processes):
+                    break
+                if should_stop is not None and should_stop():
+                    break
+                crashed = [process for process in processes if process.exitcode not in (None, 0)]
+                if crashed:
+                    raise RuntimeError(f"Worker {crashed[0].name} exited with code {crashed[0].exitcode}; "
+                                       f"run again to resume")
+                if on_progress is not None and time.perf_counter() - last_report >= progress_interval:
+                    last_report = time.perf_counter()
+                    on_progress(progress())
+        finally:
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+                process.join()
+            manifest.close()
+        final = progress()
+        if on_progress is not None:
+            on_progress(final)
+        return final
+
+    def handle(self, message, manifest, counts):
+        kind = message[0]
+        if kind == 'discovered':
+            counts['discovered'] += message[1]
+        elif kind == 'skipped':
+            counts['skipped'] += 1
+        else:
+            _, path, digest, status, output, seconds, error = message
+            counts[status] += 1
+            if digest:
+                manifest.record(path, digest, self.settings, status, output, error, seconds)
+            if error is not None:
+                print(f"{path}: {error}", file=sys.stderr)
+
+
+def build_parser():
+    from cli import add_converter_arguments
+
+    parser = argparse.ArgumentParser(
+        description="Convert every HTML file below a directory with several worker processes.",
+        epilog="Re-running with the same manifest skips files that are converted and unchanged."
+    )
+    parser.add_argument('directory')
+    parser.add_argument('-o', '--output-dir', help="mirror the directory tree here instead of writing next to inputs")
+    add_converter_arguments(parser)
+    sharding = parser.add_argument_group("sharding")
+    sharding.add_argument('--workers', type=int, default=0,
+                          help="worker processes, each with an equal share of the CPU threads "
+                               "(default: one per four cores)")
+    sharding.add_argument('--manifest', help=f"manifest database (default: {MANIFEST_NAME} in the output directory)")
+    # Runs happen in the workers, so cli's per-run metrics do not apply.
+    parser.set_defaults(metrics_jsonl=None, metrics_prom=None, verbose=False)
+    return parser
+
+
+def main(argv=None):
+    from cli import create_converter
+
+    args = build_parser().parse_args(argv)
+    if not os.path.isdir(args.directory):
+        print(f"Not a directory: {args.directory}", file=sys.stderr)
+        return 1
+    runner = ShardedRunner(create_converter(args), args.directory, args.output_dir, args.workers or None,
+                           args.manifest, args.batch_size, args.token_budget, args.threads or None)
+    print(f"{runner.workers} worker(s) x {runner.threads} thread(s), manifest {runner.manifest_path}",
+          file=sys.stderr)
+
+    def report(progress):
+        print(f"\r{format_progress(progress)}", end='', file=sys.stderr, flush=True)
+
+    try:
+        final = runner.run(report)
+    except KeyboardInterrupt:
+        print("\nInterrupted; run again to resume.", file=sys.stderr)
+        return 130
+    print(file=sys.stderr)
+    return 1 if final.failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
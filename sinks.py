@@ -0,0 +1,285 @@
+import gzip
+import hashlib
+import json
+import os
+import queue
+import re
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from stopping import is_degenerate
+
+# Bulk outputs for batch runs. Instead of one .md file per input, records
+# ({source, sha256, markdown, engine, ...}) go to a JSON-lines file, gzip-compressed
+# JSON-lines shards of a target size, or a SQLite table. A SinkWriter does
+# the serialization, compression and writes on its own thread, a batch of
+# records at a time, so the conversion thread only queues them.
+
+SINKS = OrderedDict([
+    ('files', "Markdown files"),
+    ('jsonl', "JSON lines"),
+    ('jsonl-gz', "Compressed JSON-lines shards"),
+    ('sqlite', "SQLite table"),
+])
+DEFAULT_SINK_NAMES = {
+    'jsonl': 'markdown.jsonl',
+    'jsonl-gz': 'markdown-shards',
+    'sqlite': 'markdown.sqlite',
+}
+DEFAULT_SHARD_BYTES = 256 * 1024 * 1024
+WRITE_BATCH_RECORDS = 512
+MAX_PENDING_RECORDS = 4096
+
+
+class Records:
+    # Builds sink records for Converter.convertMany: track() wraps its
+    # (key, html) items to note each input's hash, size and read time,
+    # details is passed as its details argument, and record() turns a result
+    # into a record. A record's engine is 'rules', 'model' or 'mixed'; model
+    # is None for rule-based output. early_stop is the stopping reason, or
+    # None when generation ended on its own (or the result was cached).
+    # convert_seconds is the time from reading the input to its result.
+
+    def __init__(self, model_path):
+        self.model_path = model_path
+        self.details = {}
+        self._inputs = {}
+        self._lock = threading.Lock()
+
+    def track(self, items):
+        for key, html_content in items:
+            data = html_content.encode('utf-8')
+            with self._lock:
+                self._inputs[key] = (hashlib.sha256(data).hexdigest(), len(data), time.time())
+            yield key, html_content
+
+    def record(self, key, markdown_content, cached):
+        with self._lock:
+            digest, size, read_at = self._inputs.pop(key, (None, None, None))
+        details = self.details.pop(key, None) or {}
+        engine = details.get('engine')
+        early_stop = details.get('early_stop')
+        converted_at = time.time()
+        return {
+            'source': key,
+            'sha256': digest,
+            'markdown': markdown_content,
+            'cached': cached,
+            'engine': engine,
+            'model': None if engine == 'rules' else self.model_path,
+            'early_stop': early_stop['reason'] if early_stop else None,
+            'degenerate': is_degenerate(early_stop),
+            'input_bytes': size,
+            'read_at': read_at,
+            'converted_at': converted_at,
+            'convert_seconds': converted_at - read_at if read_at is not None else None,
+        }
+
+    def discard(self, key):
+        with self._lock:
+            self._inputs.pop(key, None)
+        self.details.pop(key, None)
+
+
+def dump_record(record):
+    return json.dumps(record, ensure_ascii=False) + "\n"
+
+
+class JsonLinesSink:
+    # Appends one JSON object per line to path ('-' for stdout).
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def writeMany(self, records):
+        if self._file is None:
+            if self.path == '-':
+                self._file = sys.stdout
+            else:
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                self._file = open(self.path, 'a', encoding='utf-8')
+        self._file.write("".join(dump_record(record) for record in records))
+        self._file.flush()
+
+    def close(self):
+        if self._file is not None and self._file is not sys.stdout:
+            self._file.close()
+        self._file = None
+
+
+class ShardedJsonLinesSink:
+    # Gzip-compressed JSON-lines shards part-00000.jsonl.gz, part-00001... in
+    # directory, each closed once about shard_bytes of compressed data has
+    # been written. Numbering continues after shards already present, so a
+    # second run adds shards rather than overwriting them.
+
+    SHARD_PATTERN = re.compile(r'^part-(\d+)\.jsonl\.gz$')
+
+    def __init__(self, directory, shard_bytes=DEFAULT_SHARD_BYTES, compresslevel=6):
+        self.directory = directory
+        self.shard_bytes = shard_bytes
+        self.compresslevel = compresslevel
+        self.shards = []
+        self._raw = None
+        self._gzip = None
+        self._index = None
+
+    def nextIndex(self):
+        indices = [int(match.group(1)) for match in map(self.SHARD_PATTERN.match, os.listdir(self.directory))
+                   if match]
+        return max(indices) + 1 if indices else 0
+
+    def openShard(self):
+        if self._index is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self._index = self.nextIndex()
+        path = os.path.join(self.directory, f"part-{self._index:05d}.jsonl.gz")
+        self._index += 1
+        self._raw = open(path, 'wb')
+        self._gzip = gzip.GzipFile(fileobj=self._raw, mode='wb', compresslevel=self.compresslevel)
+        self.shards.append(path)
+
+    def writeMany(self, records):
+        for record in records:
+            if self._gzip is None:
+                self.openShard()
+            self._gzip.write(dump_record(record).encode('utf-8'))
+            # The compressor buffers, so the file size trails what was
+            # written by up to one deflate block; shards end slightly large.
+            if self._raw.tell() >= self.shard_bytes:
+                self.closeShard()
+
+    def closeShard(self):
+        if self._gzip is not None:
+            self._gzip.close()
+            self._raw.close()
+        self._gzip = None
+        self._raw = None
+
+    def close(self):
+        self.closeShard()
+
+
+class SQLiteSink:
+    # One row per source in `table`, replaced when a source is written
+    # again. The connection is opened by the first write, i.e. on the
+    # writer thread.
+
+    COLUMNS = OrderedDict([
+        ('source', 'TEXT PRIMARY KEY'),
+        ('sha256', 'TEXT'),
+        ('markdown', 'TEXT NOT NULL'),
+        ('cached', 'INTEGER NOT NULL'),
+        ('engine', 'TEXT'),
+        ('model', 'TEXT'),
+        ('early_stop', 'TEXT'),
+        ('degenerate', 'INTEGER'),
+        ('input_bytes', 'INTEGER'),
+        ('read_at', 'REAL'),
+        ('converted_at', 'REAL NOT NULL'),
+        ('convert_seconds', 'REAL'),
+    ])
+
+    def __init__(self, path, table='documents'):
+        self.path = path
+        self.table = table
+        self._connection = None
+
+    def connect(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._connection = sqlite3.connect(self.path)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.table} ("
+            + ", ".join(f"{name} {kind}" for name, kind in self.COLUMNS.items()) + ")"
+        )
+        self._connection.commit()
+
+    def writeMany(self, records):
+        if self._connection is None:
+            self.connect()
+        with self._connection:
+            self._connection.executemany(
+                f"INSERT OR REPLACE INTO {self.table} ({', '.join(self.COLUMNS)}) "
+                f"VALUES ({', '.join(':' + name for name in self.COLUMNS)})",
+                records
+            )
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+        self._connection = None
+
+
+def open_sink(kind, path, shard_bytes=DEFAULT_SHARD_BYTES):
+    if kind == 'jsonl':
+        return JsonLinesSink(path)
+    if kind == 'jsonl-gz':
+        return ShardedJsonLinesSink(path, shard_bytes)
+    if kind == 'sqlite':
+        return SQLiteSink(path)
+    raise ValueError(f"Unknown output sink: {kind}")
+
+
+def default_sink_path(kind, output_dir=None):
+    return os.path.join(output_dir or '.', DEFAULT_SINK_NAMES[kind])
+
+
+class SinkWriter:
+    # Writes records to a sink on a background thread, up to batch_records
+    # per writeMany call. put() blocks once max_pending records are queued,
+    # so a slow disk holds the converter back instead of filling memory.
+    # A failed write is raised again from the next put() or from close().
+
+    _STOP = object()
+
+    def __init__(self, sink, batch_records=WRITE_BATCH_RECORDS, max_pending=MAX_PENDING_RECORDS):
+        self.sink = sink
+        self.batch_records = batch_records
+        self.written = 0
+        self.error = None
+        self._queue = queue.Queue(max_pending)
+        self._thread = threading.Thread(target=self.run, name='sink-writer', daemon=True)
+        self._thread.start()
+
+    def put(self, record):
+        if self.error is not None:
+            raise self.error
+        self._queue.put(record)
+
+    def run(self):
+        stopping = False
+        while not stopping:
+            records = [self._queue.get()]
+            while len(records) < self.batch_records:
+                try:
+                    records.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if records[-1] is self._STOP:
+                records.pop()
+                stopping = True
+            if records and self.error is None:
+                try:
+                    self.sink.writeMany(records)
+                    self.written += len(records)
+                except Exception as e:
+                    self.error = e
+        try:
+            self.sink.close()
+        except Exception as e:
+            self.error = self.error or e
+
+    def close(self):
+        # Flushes queued records, closes the sink (on the writer thread, which
+        # owns its SQLite connection) and returns the number of records
+        # written.
+        self._queue.put(self._STOP)
+        self._thread.join()
+        if self.error is not None:
+            raise self.error
+        return self.written
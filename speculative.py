@@ -0,0 +1,74 @@
+from contextlib import contextmanager
+
+# Prompt-lookup decoding: draft tokens are copied from the prompt wherever the
+# last ngram_size generated tokens also occur in the input, and the model
+# verifies up to draft_tokens of them in one forward pass. Reader-LM copies
+# most of its output verbatim from the HTML, so drafts are accepted often.
+# The drafting and verification loop is transformers' own assisted decoding
+# (prompt_lookup_num_tokens); this module only wires the parameters and
+# measures how well it works. Sampled tokens seldom match drafts copied from
+# the input, so drafting is only used with greedy decoding.
+
+DEFAULT_DRAFT_TOKENS = 10
+DEFAULT_NGRAM_SIZE = 3
+
+
+def speculation_enabled(params):
+    return (params.get('draft_tokens', 0) > 0 and params.get('num_return_sequences', 1) == 1
+            and not params.get('do_sample', False))
+
+
+def generate_kwargs(params):
+    if not speculation_enabled(params):
+        return {}
+    return {
+        'prompt_lookup_num_tokens': params['draft_tokens'],
+        'max_matching_ngram_size': params.get('ngram_size', DEFAULT_NGRAM_SIZE)
+    }
+
+
+class AcceptanceCounter:
+    # Counts the tokens fed to the model per forward pass. The first pass
+    # carries the prompt plus the first draft; every later pass carries the
+    # last accepted token plus the drafted candidates.
+
+    def __init__(self):
+        self.input_lengths = []
+
+    def hook(self, module, args, kwargs):
+        input_ids = kwargs.get('input_ids')
+        if input_ids is None and args:
+            input_ids = args[0]
+        if input_ids is not None:
+            self.input_lengths.append(input_ids.shape[-1])
+
+    def stats(self, prompt_tokens, generated_tokens):
+        if not self.input_lengths:
+            return {'forward_passes': 0, 'drafted': 0, 'accepted': 0, 'acceptance_rate': 0.0,
+                    'tokens_per_pass': 0.0}
+        drafted = max(0, self.input_lengths[0] - prompt_tokens)
+        drafted += sum(length - 1 for length in self.input_lengths[1:])
+        passes = len(self.input_lengths)
+        accepted = max(0, min(drafted, generated_tokens - passes))
+        return {
+            'forward_passes': passes,
+            'drafted': drafted,
+            'accepted': accepted,
+            'acceptance_rate': accepted / drafted if drafted else 0.0,
+            'tokens_per_pass': generated_tokens / passes
+        }
+
+
+@contextmanager
+def count_acceptance(model):
+    counter = AcceptanceCounter()
+    handle = model.register_forward_pre_hook(counter.hook, with_kwargs=True)
+    try:
+        yield counter
+    finally:
+        handle.remove()
+
+
+def format_stats(stats):
+    return (f"Speculative decoding: {stats['accepted']}/{stats['drafted']} drafted tokens accepted "
+            f"({100 * stats['acceptance_rate']:.0f}%), {stats['tokens_per_pass']:.2f} tokens per forward pass")
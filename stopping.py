@@ -0,0 +1,271 @@
+import re
+
+import lxml.html
+from lxml import etree
+
+from fast_path import MarkdownWriter
+
+# Early stopping for degenerate generations. The small Reader-LM models can
+# loop on a line or table row until max_new_tokens; DegenerationGuard ends
+# such rows early and records why:
+#   repetition      - the tail of the output is the same token sequence
+#                     repeated (the repeats are trimmed from the result)
+#   length          - far more output tokens than the input's Markdown
+#                     can take (the result ends at the budget)
+#   end_of_document - the input's last text was written and a blank line
+#                     followed, so anything after it is not in the document
+#                     (the result ends at that blank line)
+# Every cut is placed by the tokens, not by the step the stop was noticed
+# at, so steps that add several tokens (speculative decoding) give the same
+# result as plain decoding.
+
+REASONS = {
+    'repetition': "repetition loop",
+    'length': "output much longer than the input",
+    'end_of_document': "end of document reached",
+}
+# Reasons that indicate a broken result rather than a clean early finish.
+DEGENERATE_REASONS = ('repetition', 'length')
+
+MIN_REPEATS = 4
+MIN_LOOP_TOKENS = 64
+MAX_PERIOD = 256
+LENGTH_RATIO = 3.0
+LENGTH_SLACK_TOKENS = 128
+END_MARKER_CHARS = 32
+END_WINDOW_TOKENS = 48
+CHECK_END_EVERY = 4
+
+NON_ALPHANUMERIC = re.compile(r'[\W_]+')
+BLANK_LINE = re.compile(r'\n[ \t]*\n')
+
+
+class Cancelled(Exception):
+    pass
+
+
+def stopping_enabled(params):
+    return params.get('stop_degenerate', True)
+
+
+def _normalize(text):
+    return NON_ALPHANUMERIC.sub('', text.lower())
+
+
+def document_profile(tokenizer, html_content):
+    # (content_tokens, end_marker): tokens of the Markdown the input needs at
+    # least, and the normalized tail of the last text. The rule-based
+    # rendering stands in for that Markdown, as it carries the table and list
+    # syntax, link targets and image alt and title text the plain text lacks;
+    # the text and link targets count too, for elements it leaves out.
+    try:
+        root = lxml.html.document_fromstring(html_content)
+    except etree.ParserError:
+        return 0, ''
+    estimate = MarkdownWriter().convert(root)
+    for element in list(root.iter('script', 'style', 'head')):
+        element.drop_tree()
+    text = root.text_content()
+    urls = [value for element in root.iter('a', 'img') for value in (element.get('href'), element.get('src'))
+            if value]
+    content_tokens = max(len(tokenizer.encode(estimate)), len(tokenizer.encode(text + " " + " ".join(urls))))
+    normalized = _normalize(text)
+    end_marker = normalized[-END_MARKER_CHARS:] if len(normalized) >= END_MARKER_CHARS // 2 else ''
+    return content_tokens, end_marker
+
+
+class DegenerationGuard:
+    # A stopping criterion for model.generate (the StoppingCriteria protocol,
+    # duck-typed so transformers is not imported here). documents are the
+    # HTML inputs of the batch rows, or None to check loops only; with
+    # several return sequences per input, rows map onto documents in order.
+
+    def __init__(self, tokenizer, prompt_length, max_new_tokens, documents=None, stop_token_ids=()):
+        self.tokenizer = tokenizer
+        self.prompt_length = prompt_length
+        self.max_new_tokens = max_new_tokens
+        self.stop_token_ids = set(stop_token_ids)
+        self.profiles = [document_profile(tokenizer, document) if document else (0, '')
+                         for document in (documents or [])]
+        self.rows = []
+
+    def _state(self, row_index, row_count):
+        while len(self.rows) < row_count:
+            index = len(self.rows)
+            content_tokens, end_marker = (self.profiles[index * len(self.profiles) // row_count]
+                                          if self.profiles else (0, ''))
+            budget = int(LENGTH_RATIO * content_tokens) + LENGTH_SLACK_TOKENS if content_tokens else None
+            self.rows.append({'reason': None, 'finished': False, 'generated': 0, 'trim': 0, 'budget': budget,
+                              'content_tokens': content_tokens, 'end_marker': end_marker, 'end_seen': None,
+                              'end_checked': 0})
+        return self.rows[row_index]
+
+    def __call__(self, input_ids, scores=None, **kwargs):
+        import torch
+
+        done = []
+        for row_index in range(input_ids.shape[0]):
+            state = self._state(row_index, input_ids.shape[0])
+            if state['reason'] is None and not state['finished']:
+                self.check(state, input_ids[row_index], input_ids.shape[1] - self.prompt_length)
+            done.append(state['reason'] is not None)
+        return torch.tensor(done, dtype=torch.bool, device=input_ids.device)
+
+    def check(self, state, row, generated):
+        # Rows that already emitted EOS are padded by generate; the padding
+        # must not look like a loop.
+        new_tokens = row[self.prompt_length + state['generated']:].tolist()
+        if self.stop_token_ids.intersection(new_tokens):
+            state['finished'] = True
+            return
+        state['generated'] = generated
+        tail = row[self.prompt_length:][-MAX_PERIOD * MIN_REPEATS:].tolist()
+
+        loop = self.findLoop(tail)
+        if loop is not None:
+            state['reason'] = 'repetition'
+            state['trim'] = self.loopTrim(row[self.prompt_length:].tolist(), loop[0])
+        elif state['budget'] is not None and state['budget'] < self.max_new_tokens and generated > state['budget']:
+            state['reason'] = 'length'
+            state['trim'] = generated - state['budget']
+        elif state['end_marker'] and generated - state['end_checked'] >= CHECK_END_EVERY:
+            state['end_checked'] = generated
+            if self.reachedEnd(state, row, generated):
+                state['reason'] = 'end_of_document'
+
+    def findLoop(self, tokens):
+        # (period, repeats) if the tokens end with one sequence repeated at
+        # least MIN_REPEATS times over at least MIN_LOOP_TOKENS tokens.
+        length = len(tokens)
+        for period in range(1, min(MAX_PERIOD, length // MIN_REPEATS) + 1):
+            if tokens[-1] != tokens[-1 - period]:
+                continue
+            repeats = max(MIN_REPEATS, -(-MIN_LOOP_TOKENS // period))
+            span = period * repeats
+            if span > length:
+                continue
+            if tokens[length - span:] == tokens[length - period:] * repeats:
+                return period, repeats
+        return None
+
+    @staticmethod
+    def loopTrim(tokens, period):
+        # Tokens after the first copy of the loop. The loop starts where the
+        # output stops being periodic, so every repeat is trimmed however
+        # many the last step added.
+        start = len(tokens) - period
+        while start > 0 and tokens[start - 1] == tokens[start - 1 + period]:
+            start -= 1
+        return len(tokens) - (start + period)
+
+    def prefixLength(self, tokens, found):
+        # Length of the shortest prefix of tokens whose text satisfies found.
+        for length in range(1, len(tokens) + 1):
+            if found(self.tokenizer.decode(tokens[:length], skip_special_tokens=True)):
+                return length
+        return len(tokens)
+
+    def reachedEnd(self, state, row, generated):
+        if state['end_seen'] is None:
+            # Boilerplate can repeat the last text earlier on, so the end is
+            # only looked for once most of the content could be out.
+            if generated < state['content_tokens'] // 2:
+                return False
+            window = row[self.prompt_length:][-END_WINDOW_TOKENS:].tolist()
+            found = lambda text: state['end_marker'] in _normalize(text)
+            if not found(self.tokenizer.decode(window, skip_special_tokens=True)):
+                return False
+            state['end_seen'] = row.shape[0] - len(window) + self.prefixLength(window, found)
+        after = row[state['end_seen']:].tolist()
+        if not BLANK_LINE.search(self.tokenizer.decode(after, skip_special_tokens=True)):
+            return False
+        found = lambda text: BLANK_LINE.search(text) is not None
+        state['trim'] = len(after) - self.prefixLength(after, found)
+        return True
+
+    def result(self, row_index):
+        # {'reason', 'generated_tokens', 'saved_tokens', 'trim'}; reason is
+        # None when the row ended on its own.
+        if row_index >= len(self.rows):
+            return {'reason': None, 'generated_tokens': 0, 'saved_tokens': 0, 'trim': 0}
+        state = self.rows[row_index]
+        saved = self.max_new_tokens - state['generated'] if state['reason'] else 0
+        return {'reason': state['reason'], 'generated_tokens': state['generated'], 'saved_tokens': max(0, saved),
+                'trim': state['trim']}
+
+
+def stop_token_ids(tokenizer, model):
+    ids = model.generation_config.eos_token_id
+    ids = set(ids if isinstance(ids, (list, tuple)) else [ids] if ids is not None else [])
+    if tokenizer.pad_token_id is not None:
+        ids.add(tokenizer.pad_token_id)
+    return ids
+
+
+class CancelCriterion:
+    # Ends every row once cancelled() returns True, so a cancellation takes
+    # effect within one decode step; the caller then raises Cancelled.
+
+    def __init__(self, cancelled):
+        self.cancelled = cancelled
+
+    def __call__(self, input_ids, scores=None, **kwargs):
+        import torch
+
+        return torch.full((input_ids.shape[0],), bool(self.cancelled()), dtype=torch.bool, device=input_ids.device)
+
+
+def check_cancelled(cancelled):
+    if cancelled is not None and cancelled():
+        raise Cancelled("The conversion was cancelled")
+
+
+def generate_kwargs(guard, cancelled=None):
+    criteria = [guard] if guard is not None else []
+    if cancelled is not None:
+        criteria.append(CancelCriterion(cancelled))
+    if not criteria:
+        return {}
+    from transformers import StoppingCriteriaList
+
+    return {'stopping_criteria': StoppingCriteriaList(criteria)}
+
+
+def is_degenerate(result):
+    return result is not None and result['reason'] in DEGENERATE_REASONS
+
+
+def merge_results(results):
+    # One result for a document generated in several parts (chunks or
+    # blocks), or None if no part stopped early. A degenerate part makes the
+    # whole document degenerate.
+    stopped = [result for result in results if result and result['reason']]
+    if not stopped:
+        return None
+    reasons = [result['reason'] for result in stopped]
+    return {
+        'reason': next((reason for reason in reasons if reason in DEGENERATE_REASONS), reasons[0]),
+        'generated_tokens': sum(result['generated_tokens'] for result in stopped),
+        'saved_tokens': sum(result['saved_tokens'] for result in stopped),
+        'trim': 0,
+    }
+
+
+def summarize(results):
+    # Totals over per-document results (None for documents that ended on
+    # their own) for batch reports.
+    stopped = [result for result in results if result and result['reason']]
+    return {
+        'stopped': len(stopped),
+        'degenerate': sum(1 for result in stopped if is_degenerate(result)),
+        'saved_tokens': sum(result['saved_tokens'] for result in stopped),
+    }
+
+
+def format_result(result):
+    return f"Stopped early: {REASONS[result['reason']]} ({result['saved_tokens']} tokens saved)"
+
+
+def format_summary(summary):
+    return (f"{summary['stopped']} stopped early ({summary['degenerate']} degenerate), "
+            f"{summary['saved_tokens']} tokens saved")
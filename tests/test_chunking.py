@@ -0,0 +1,47 @@
+from chunking import DocumentChunker, fix_heading_levels, fix_list_start
+
+FENCED = """## Install
+
+```sh
+# update the package index
+apt-get update
+```
+
+~~~
+# not a heading either
+~~~
+
+# Usage"""
+
+
+def test_heading_levels_skip_fenced_code():
+    fixed = fix_heading_levels(FENCED, [2, 3])
+    assert "# update the package index" in fixed
+    assert "# not a heading either" in fixed
+    assert fixed.startswith("## Install")
+    assert fixed.endswith("\n### Usage")
+
+
+def test_list_start_skips_fenced_code():
+    markdown_content = "```\n1. not an item\n```\n\n1. first\n2. second"
+    fixed = fix_list_start(markdown_content, 5)
+    assert "1. not an item" in fixed
+    assert fixed.endswith("5. first\n6. second")
+
+
+def test_list_start_stops_after_the_list():
+    fixed = fix_list_start("1. first\n2. second\n\nText\n\n1. other list", 3)
+    assert fixed == "3. first\n4. second\n\nText\n\n1. other list"
+
+
+def test_split_table_keeps_nested_rows_in_their_cell():
+    nested = "<table><tr><td>inner 1</td></tr><tr><td>inner 2</td></tr></table>"
+    rows = "".join(f"<tr><td>row {index}</td></tr>" for index in range(20))
+    html_content = (f"<table><thead><tr><th>head</th></tr></thead>"
+                    f"<tbody><tr><td>{nested}</td></tr>{rows}</tbody></table>")
+    chunks = DocumentChunker(len, token_budget=200).split(html_content)
+    joined = "".join(chunk.html for chunk in chunks)
+    assert len(chunks) > 1
+    assert joined.count("inner 1") == 1
+    assert all(chunk.html.count("<th>head</th>") == 1 for chunk in chunks)
+    assert all(f"row {index}<" in joined for index in range(20))
@@ -0,0 +1,42 @@
+from fast_path import markdown_from_html
+
+
+def test_escaped_markup_stays_text():
+    assert markdown_from_html("<p>&lt;script&gt;alert(1)&lt;/script&gt;</p>") == "\\<script>alert(1)\\</script>"
+
+
+def test_entity_like_text_stays_text():
+    assert markdown_from_html("<p>Write &amp;amp; for Q&amp;A</p>") == "Write \\&amp; for Q&A"
+
+
+def test_code_spans_are_not_escaped():
+    assert markdown_from_html("<p><code>a &lt; b &amp;&amp; c</code></p>") == "`a < b && c`"
+
+
+def test_ordered_list_marker_escape():
+    assert markdown_from_html("<p>1. Not a list</p>") == "1\\. Not a list"
+    assert markdown_from_html("<p>2) Not a list either</p>") == "2\\) Not a list either"
+
+
+def test_line_start_markers_after_a_break():
+    assert markdown_from_html("<p>text<br># not a heading<br>- not an item</p>") == (
+        "text  \n\\# not a heading  \n\\- not an item")
+
+
+def test_image_title():
+    assert markdown_from_html('<p><img src="a b.png" alt="A *b*" title="T"></p>') == '![A \\*b\\*](a%20b.png "T")'
+
+
+def test_quotes_in_titles_are_escaped():
+    assert markdown_from_html('<p><a href="/a" title=\'Say "hi"\'>a</a></p>') == '[a](/a "Say \\"hi\\"")'
+    assert markdown_from_html('<p><img src="a.png" alt="a" title=\'"x"\'></p>') == '![a](a.png "\\"x\\"")'
+
+
+def test_nested_table_rows_stay_in_their_cell():
+    markdown = markdown_from_html("<table><tr><th>name</th><th>parts</th></tr>"
+                                  "<tr><td>kit</td><td><table><tr><td>bolt</td></tr><tr><td>nut</td></tr></table>"
+                                  "</td></tr></table>")
+    lines = markdown.splitlines()
+    assert len(lines) == 3
+    assert lines[0] == "| name | parts |"
+    assert lines[2].startswith("| kit |")
@@ -0,0 +1,134 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from fetcher import Fetcher, HTTPCache
+
+pytest.importorskip('requests')
+
+SITEMAP = """<?xml version="1.0" encoding="UTF-8"?>
+<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
+  <url><loc>{base}/a.html</loc></url>
+  <url><loc>{base}/b.html</loc></url>
+</urlset>"""
+FEED = """<?xml version="1.0"?><rss version="2.0"><channel><title>News</title></channel></rss>"""
+
+
+class Handler(BaseHTTPRequestHandler):
+    # /page: ETag "v1", answers 304 to a matching If-None-Match
+    # /flaky: 503 for the first `failures` requests, then 200
+    # /slow/*: 200 after `delay` seconds, tracking concurrent requests
+    # /sitemap.xml, /feed.xml: a sitemap and an RSS feed
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def reply(self, status, body='', headers=None):
+        data = body.encode('utf-8')
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        state = self.server.state
+        with state['lock']:
+            state['requests'].append((self.path, dict(self.headers)))
+        if self.path == '/page':
+            if self.headers.get('If-None-Match') == '"v1"':
+                self.reply(304, headers={'ETag': '"v1"'})
+            else:
+                self.reply(200, "<p>page</p>", {'ETag': '"v1"', 'Content-Type': 'text/html'})
+        elif self.path == '/flaky':
+            with state['lock']:
+                state['failures'] -= 1
+                failing = state['failures'] >= 0
+            self.reply(503 if failing else 200, "busy" if failing else "<p>ok</p>")
+        elif self.path.startswith('/slow/'):
+            with state['lock']:
+                state['active'] += 1
+                state['max_active'] = max(state['max_active'], state['active'])
+            time.sleep(state['delay'])
+            with state['lock']:
+                state['active'] -= 1
+            self.reply(200, f"<p>{self.path}</p>")
+        elif self.path == '/sitemap.xml':
+            self.reply(200, SITEMAP.format(base=state['base']), {'Content-Type': 'application/xml'})
+        elif self.path == '/feed.xml':
+            self.reply(200, FEED, {'Content-Type': 'application/rss+xml'})
+        else:
+            self.reply(404, "not found")
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    httpd.daemon_threads = True
+    base = f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.state = {'lock': threading.Lock(), 'requests': [], 'failures': 0, 'active': 0, 'max_active': 0,
+                   'delay': 0.2, 'base': base}
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield base, httpd.state
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_unchanged_page_is_revalidated_with_304(server):
+    base, state = server
+    fetcher = Fetcher(HTTPCache(':memory:'))
+    first = fetcher.fetch(base + '/page')
+    second = fetcher.fetch(base + '/page')
+    assert (first.status, first.cached) == (200, False)
+    assert (second.status, second.cached) == (304, True)
+    assert second.text == first.text == "<p>page</p>"
+    assert state['requests'][1][1].get('If-None-Match') == '"v1"'
+
+
+def test_server_errors_are_retried(server):
+    base, state = server
+    state['failures'] = 2
+    result = Fetcher(retries=2).fetch(base + '/flaky')
+    assert result.status == 200
+    assert len(state['requests']) == 3
+
+
+def test_retries_give_up(server):
+    import requests
+
+    base, state = server
+    state['failures'] = 10
+    with pytest.raises(requests.RequestException):
+        Fetcher(retries=1).fetch(base + '/flaky')
+    assert len(state['requests']) == 2
+
+
+def test_requests_in_flight_are_bounded(server):
+    base, state = server
+    workers = 2
+    consumed = []
+
+    def urls():
+        for index in range(12):
+            consumed.append(index)
+            yield f"{base}/slow/{index}"
+
+    pages = Fetcher(workers=workers).fetchMany(urls())
+    next(pages)
+    # At most twice `workers` URLs are taken ahead of the consumer.
+    assert len(consumed) <= 2 * workers
+    results = [result.url for result in pages]
+    assert len(results) == 11
+    assert state['max_active'] <= workers
+
+
+def test_only_xml_with_a_sitemap_root_is_expanded(server):
+    base, _ = server
+    urls = Fetcher(HTTPCache(':memory:')).expandSources([base + '/sitemap.xml', base + '/feed.xml', base + '/page'])
+    assert urls == [base + '/a.html', base + '/b.html', base + '/feed.xml', base + '/page']
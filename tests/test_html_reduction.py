@@ -0,0 +1,54 @@
+from html_reduction import reduce_html
+
+
+def test_empty_table_cells_keep_their_columns():
+    html_content = "<table><tr><th>a</th><th></th><th>c</th></tr><tr><td></td><td>2</td><td>3</td></tr></table>"
+    reduced, _ = reduce_html(html_content)
+    assert reduced.count("<th>") == 3
+    assert reduced.count("<td>") == 3
+
+
+def test_empty_list_items_are_kept():
+    reduced, _ = reduce_html("<ol><li>one</li><li></li><li>three</li></ol><dl><dt>term</dt><dd></dd></dl>")
+    assert reduced.count("<li>") == 3
+    assert "<dd>" in reduced
+
+
+def test_other_empty_elements_are_removed():
+    reduced, _ = reduce_html("<div><p>text</p><span></span><div><p> </p></div></div>")
+    assert reduced == "<div><p>text</p></div>"
+
+
+def test_search_form_is_removed():
+    html_content = ("<body><form action='/search'><input name='q'><button>Search</button></form>"
+                    "<p>The article text.</p></body>")
+    reduced, _ = reduce_html(html_content)
+    assert "form" not in reduced
+    assert "The article text." in reduced
+
+
+def test_page_wrapping_form_is_kept():
+    # ASP.NET WebForms put the whole page inside one form.
+    paragraphs = "".join(f"<p>Paragraph {index} of the page content.</p>" for index in range(20))
+    html_content = ("<body><form id='aspnetForm' method='post'><input type='hidden' name='__VIEWSTATE' value='x'>"
+                    f"<input name='q'><div>{paragraphs}</div></form></body>")
+    reduced, _ = reduce_html(html_content)
+    assert reduced.count("<p>") == 20
+
+
+def test_page_header_is_kept():
+    html_content = ("<body><header role='banner'><h1>Release notes</h1></header><nav><a href='/'>Home</a></nav>"
+                    "<p>What changed.</p><footer>Copyright</footer></body>")
+    reduced, _ = reduce_html(html_content)
+    assert "<h1>Release notes</h1>" in reduced
+    assert "Home" not in reduced and "Copyright" not in reduced
+
+
+def test_only_tracker_images_are_removed():
+    html_content = ("<p><img src='/img/pixel-art.png' alt='art'><img src='/analytics-dashboard.png' alt='chart'>"
+                    "<img src='https://www.google-analytics.com/collect?v=1'>"
+                    "<img src='https://www.facebook.com/tr?id=1&amp;ev=PageView' alt='fb'>"
+                    "<img src='/spacer.gif' width='1' height='1' alt='spacer'></p>")
+    reduced, _ = reduce_html(html_content)
+    assert "pixel-art.png" in reduced and "analytics-dashboard.png" in reduced
+    assert "google-analytics" not in reduced and "facebook" not in reduced and "spacer" not in reduced
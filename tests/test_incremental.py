@@ -0,0 +1,8 @@
+from incremental import fingerprint
+
+
+def test_backend_changes_model_block_fingerprints():
+    params = {'do_sample': False}
+    assert fingerprint("<table></table>", 'model', 'm', params, 'fp32') != \
+        fingerprint("<table></table>", 'model', 'm', params, 'int8')
+    assert fingerprint("<p>x</p>", 'rules', 'm', params, 'fp32') == fingerprint("<p>x</p>", 'rules', 'm', params, 'int8')
@@ -0,0 +1,103 @@
+import logging
+import threading
+import time
+
+import pytest
+
+from jobs import BATCH, CANCELLED, DONE, FINISHED, INTERACTIVE, NORMAL, Job, JobQueue
+
+
+@pytest.fixture
+def job_queue():
+    job_queue = JobQueue()
+    yield job_queue
+    job_queue.shutdown(5)
+
+
+def wait_for(job_queue, jobs):
+    finished = threading.Event()
+    listener = job_queue.addListener(
+        lambda job: finished.set() if all(job.status in FINISHED for job in jobs) else None)
+    if all(job.status in FINISHED for job in jobs):
+        finished.set()
+    assert finished.wait(5)
+    job_queue.listeners.remove(listener)
+
+
+def blocker(job_queue):
+    # A running job that holds the worker until the returned event is set.
+    release, started = threading.Event(), threading.Event()
+
+    def work(job):
+        started.set()
+        release.wait(5)
+
+    job_queue.submit(Job('block', "blocker", work, INTERACTIVE))
+    assert started.wait(5)
+    return release
+
+
+def test_lower_priority_numbers_run_first(job_queue):
+    order = []
+    release = blocker(job_queue)
+    jobs = [job_queue.submit(Job('test', name, lambda job, name=name: order.append(name), priority))
+            for name, priority in (('batch', BATCH), ('normal', NORMAL), ('interactive', INTERACTIVE),
+                                   ('normal-2', NORMAL))]
+    release.set()
+    wait_for(job_queue, jobs)
+    assert order == ['interactive', 'normal', 'normal-2', 'batch']
+
+
+def test_cancelled_jobs_stop(job_queue):
+    ran = []
+    running = threading.Event()
+
+    def poll(job):
+        running.set()
+        while not job.checkpoint():
+            time.sleep(0.01)
+        return 'partial'
+
+    release = blocker(job_queue)
+    queued = job_queue.submit(Job('test', "queued", lambda job: ran.append(job.id)))
+    job_queue.cancel(queued)
+    assert queued.status == CANCELLED
+    release.set()
+    polling = job_queue.submit(Job('test', "polling", poll))
+    assert running.wait(5)
+    job_queue.cancel(polling)
+    wait_for(job_queue, [polling])
+    assert polling.status == CANCELLED
+    assert not ran
+
+
+def test_interactive_job_runs_at_a_batch_checkpoint(job_queue):
+    order = []
+    started, step = threading.Event(), threading.Event()
+
+    def batch(job):
+        order.append('batch start')
+        started.set()
+        step.wait(5)
+        job.checkpoint()
+        order.append('batch end')
+
+    batch_job = job_queue.submit(Job('batch', "batch", batch, BATCH))
+    assert started.wait(5)
+    interactive = job_queue.submit(Job('convert', "interactive", lambda job: order.append('interactive'), INTERACTIVE))
+    step.set()
+    wait_for(job_queue, [batch_job, interactive])
+    assert order == ['batch start', 'interactive', 'batch end']
+    assert batch_job.status == interactive.status == DONE
+
+
+def test_failing_listener_is_logged(job_queue, caplog):
+    def broken(job):
+        raise RuntimeError("listener bug")
+
+    job_queue.addListener(broken)
+    with caplog.at_level(logging.ERROR, logger='jobs'):
+        job = job_queue.submit(Job('test', "job", lambda job: 42))
+        wait_for(job_queue, [job])
+    assert job.result == 42 and job.status == DONE
+    assert any("listener" in record.getMessage() and record.exc_info for record in caplog.records)
@@ -0,0 +1,25 @@
+from converter import Converter
+from result_cache import ResultCache
+
+
+def test_chunk_workers_do_not_change_the_cache_key():
+    cache = ResultCache(':memory:')
+    params = {'do_sample': False}
+    Converter('model', 'cpu', params, chunking={'token_budget': 512, 'workers': 1}, cache=cache).store(
+        "<p>x</p>", "x")
+    assert Converter('model', 'cpu', params, chunking={'token_budget': 512, 'workers': 4},
+                     cache=cache).lookup("<p>x</p>") == "x"
+    assert Converter('model', 'cpu', params, chunking={'token_budget': 256, 'workers': 1},
+                     cache=cache).lookup("<p>x</p>") is None
+
+
+def test_backend_is_part_of_the_cache_key():
+    cache = ResultCache(':memory:')
+    params = {'do_sample': False}
+    Converter('model', 'cpu', params, cache=cache, backend='int8').store("<p>x</p>", "quantized")
+    assert Converter('model', 'cpu', params, cache=cache, backend='fp32').lookup("<p>x</p>") is None
+    assert Converter('model', 'cpu', params, cache=cache).lookup("<p>x</p>") is None
+    assert Converter('model', 'cpu', params, cache=cache, backend='int8').lookup("<p>x</p>") == "quantized"
+    keys = {ResultCache.makeKey("<p>x</p>", 'model', params, Converter('model', backend=backend).cacheOptions())
+            for backend in ('fp32', 'int8', 'bf16+compiled')}
+    assert len(keys) == 3
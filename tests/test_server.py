@@ -0,0 +1,139 @@
+import http.client
+import threading
+
+import pytest
+
+from server import BatchScheduler, ConversionServer, parse_params
+from stopping import Cancelled
+
+
+class FakeConverter:
+    # Records the (params, html) groups convertMany is called with. Setting
+    # `started` makes a conversion wait for `release`, raising Cancelled if
+    # the group is cancelled meanwhile.
+
+    def __init__(self, params=None, cancelled=None, shared=None):
+        self.params = params or {'max_new_tokens': 100}
+        self.cancelled = cancelled
+        self.shared = shared if shared is not None else {'groups': [], 'started': None,
+                                                         'release': threading.Event()}
+        self.model_path = 'fake'
+        self.device = 'cpu'
+
+    def withParams(self, params):
+        return FakeConverter(dict(self.params, **params), self.cancelled, self.shared)
+
+    def withCancellation(self, cancelled):
+        return FakeConverter(self.params, cancelled, self.shared)
+
+    def convertMany(self, items, on_result, on_error=None, batch_size=None, token_budget=None):
+        items = list(items)
+        self.shared['groups'].append((self.params, [html_content for _, html_content in items]))
+        if self.shared['started'] is not None:
+            self.shared['started'].set()
+            while not self.shared['release'].wait(0.01):
+                if self.cancelled():
+                    raise Cancelled()
+        for key, html_content in items:
+            on_result(key, html_content.upper(), False)
+        return {}
+
+
+def run_until_done(scheduler, requests):
+    scheduler.start()
+    try:
+        for request in requests:
+            assert request.done.wait(5)
+    finally:
+        scheduler.stop()
+
+
+def test_query_string_params_are_coerced():
+    params = parse_params({'max_new_tokens': '256', 'do_sample': 'off', 'temperature': '0.5'}, 4096)
+    assert params == {'max_new_tokens': 256, 'do_sample': False, 'temperature': 0.5}
+
+
+@pytest.mark.parametrize('values', [
+    {'beams': 2},
+    {'max_new_tokens': 0},
+    {'max_new_tokens': 8192},
+    {'max_new_tokens': 1.5},
+    {'top_p': 1.5},
+    {'temperature': 'nan'},
+    {'do_sample': 'maybe'},
+    {'do_sample': 1},
+    ['max_new_tokens'],
+])
+def test_invalid_params_are_rejected(values):
+    with pytest.raises(ValueError):
+        parse_params(values, 4096)
+
+
+def test_requests_are_grouped_by_params():
+    converter = FakeConverter()
+    scheduler = BatchScheduler(converter, max_batch_size=8, max_wait=0.2)
+    requests = [scheduler.submit("a", {}), scheduler.submit("b", {'top_p': 0.5}), scheduler.submit("c", {})]
+    run_until_done(scheduler, requests)
+    assert [request.markdown for request in requests] == ["A", "B", "C"]
+    assert sorted(group for _, group in converter.shared['groups']) == [["a", "c"], ["b"]]
+    assert scheduler.stats()['batches'] == 1
+
+
+def test_batches_stop_at_the_token_budget():
+    # Each request is estimated at 4 HTML bytes per token plus 100 new tokens.
+    scheduler = BatchScheduler(FakeConverter(), max_batch_size=8, token_budget=250, max_wait=0.2)
+    for _ in range(4):
+        scheduler.submit("x" * 40, {})
+    first = scheduler.queue.get_nowait()
+    assert len(scheduler.collect(first)) == 3
+    assert len(scheduler.collect(scheduler.queue.get_nowait())) == 1
+
+
+def test_abandoned_requests_are_not_converted():
+    converter = FakeConverter()
+    scheduler = BatchScheduler(converter, max_wait=0.2)
+    abandoned = scheduler.submit("a", {})
+    scheduler.abandon(abandoned)
+    kept = scheduler.submit("b", {})
+    run_until_done(scheduler, [kept])
+    assert converter.shared['groups'] == [({'max_new_tokens': 100}, ["b"])]
+    assert not abandoned.done.is_set()
+    assert scheduler.stats()['timed_out'] == 1
+
+
+def test_group_is_cancelled_once_every_request_is_abandoned():
+    converter = FakeConverter()
+    converter.shared['started'] = threading.Event()
+    scheduler = BatchScheduler(converter, max_wait=0)
+    request = scheduler.submit("a", {})
+    scheduler.start()
+    try:
+        assert converter.shared['started'].wait(5)
+        scheduler.abandon(request)
+        assert request.done.wait(5)
+    finally:
+        scheduler.stop()
+    assert isinstance(request.error, Cancelled)
+
+
+@pytest.fixture
+def server():
+    httpd = ConversionServer(('127.0.0.1', 0), BatchScheduler(FakeConverter()))
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd.server_address[1]
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.mark.parametrize('length, status', [(None, 411), ('abc', 400), ('-5', 400), (str(1 << 30), 413)])
+def test_content_length_is_validated(server, length, status):
+    connection = http.client.HTTPConnection('127.0.0.1', server, timeout=5)
+    connection.putrequest('POST', '/convert')
+    if length is not None:
+        connection.putheader('Content-Length', length)
+    connection.endheaders()
+    response = connection.getresponse()
+    assert response.status == status
+    assert response.getheader('Connection') == 'close'
+    connection.close()
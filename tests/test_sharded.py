@@ -0,0 +1,29 @@
+from converter import Converter
+from sharded import ShardedRunner
+
+
+def write(path, text):
+    path.write_text(text, encoding='utf-8')
+
+
+def run(root, output_dir, params=None):
+    # The rule-based engine converts without loading a model in the workers.
+    converter = Converter('unused-model', params=params, routing='rules')
+    return ShardedRunner(converter, str(root), str(output_dir), workers=1, threads=1).run()
+
+
+def test_rerun_converts_changed_files_and_new_settings(tmp_path):
+    root, output_dir = tmp_path / 'site', tmp_path / 'markdown'
+    root.mkdir()
+    write(root / 'changed.html', "<h1>Old</h1>")
+    write(root / 'unchanged.html', "<p>Same</p>")
+    first = run(root, output_dir)
+    assert (first.converted, first.skipped) == (2, 0)
+
+    write(root / 'changed.html', "<h1>New</h1>")
+    second = run(root, output_dir)
+    assert (second.converted, second.skipped, second.failed) == (1, 1, 0)
+    assert (output_dir / 'changed.md').read_text(encoding='utf-8').strip() == "# New"
+
+    third = run(root, output_dir, params={'max_new_tokens': 64})
+    assert (third.converted, third.skipped) == (2, 0)
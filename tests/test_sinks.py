@@ -0,0 +1,32 @@
+import sqlite3
+
+from sinks import Records, SQLiteSink
+
+
+def test_records_name_the_engine_and_early_stop():
+    records = Records('jinaai/reader-lm-0.5b')
+    list(records.track([('a.html', "<p>a</p>"), ('b.html', "<table></table>")]))
+    records.details['a.html'] = {'engine': 'rules', 'early_stop': None}
+    records.details['b.html'] = {'engine': 'model', 'early_stop': {'reason': 'repetition'}}
+    rules = records.record('a.html', "a", False)
+    model = records.record('b.html', "b", False)
+    assert (rules['engine'], rules['model'], rules['early_stop'], rules['degenerate']) == ('rules', None, None, False)
+    assert (model['engine'], model['model'], model['early_stop'], model['degenerate']) == (
+        'model', 'jinaai/reader-lm-0.5b', 'repetition', True)
+    assert not records.details
+
+
+def test_sqlite_sink_stores_every_record_field(tmp_path):
+    path = str(tmp_path / 'markdown.sqlite')
+    records = Records('model')
+    list(records.track([('a.html', "<p>a</p>")]))
+    records.details['a.html'] = {'engine': 'rules', 'early_stop': None}
+    record = records.record('a.html', "a", False)
+    assert record['convert_seconds'] == record['converted_at'] - record['read_at'] >= 0
+    sink = SQLiteSink(path)
+    sink.writeMany([record])
+    sink.close()
+    connection = sqlite3.connect(path)
+    connection.row_factory = sqlite3.Row
+    row = connection.execute("SELECT * FROM documents").fetchone()
+    assert dict(row) == dict(record, cached=0, degenerate=0)
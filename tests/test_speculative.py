@@ -0,0 +1,42 @@
+import glob
+import os
+import sys
+
+import pytest
+
+from converter import DEFAULT_PARAMS
+from generation import generate_markdown
+
+torch = pytest.importorskip('torch')
+pytest.importorskip('transformers')
+pytest.importorskip('tokenizers')
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+
+from tiny_model import FIXTURES_DIR, build_tiny_model  # noqa: E402
+
+GREEDY = dict(DEFAULT_PARAMS, max_new_tokens=256, do_sample=False, repetition_penalty=1.0)
+
+
+@pytest.fixture(scope='module')
+def tiny_model(tmp_path_factory):
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+
+    path = build_tiny_model(str(tmp_path_factory.mktemp('tiny')))
+    return AutoTokenizer.from_pretrained(path), AutoModelForCausalLM.from_pretrained(path).eval()
+
+
+@pytest.mark.parametrize('fixture', sorted(glob.glob(os.path.join(FIXTURES_DIR, '*.html'))),
+                         ids=os.path.basename)
+def test_prompt_lookup_matches_greedy_decoding(tiny_model, fixture):
+    # Prompt lookup adds several tokens per step; the early stops must still
+    # cut the output where plain greedy decoding does.
+    tokenizer, model = tiny_model
+    with open(fixture, 'r', encoding='utf-8') as file:
+        html_content = file.read()
+    plain_stats, speculative_stats = {}, {}
+    plain = generate_markdown(tokenizer, model, html_content, 'cpu', GREEDY, stats=plain_stats)
+    speculative = generate_markdown(tokenizer, model, html_content, 'cpu', dict(GREEDY, draft_tokens=10, ngram_size=3),
+                                    stats=speculative_stats)
+    assert 'speculative' in speculative_stats
+    assert speculative == plain
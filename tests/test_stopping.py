@@ -0,0 +1,95 @@
+import re
+
+import pytest
+
+from fast_path import markdown_from_html
+from stopping import DEGENERATE_REASONS, DegenerationGuard, document_profile
+
+torch = pytest.importorskip('torch')
+
+
+class WordTokenizer:
+    # Words, runs of whitespace and single punctuation marks as tokens: like
+    # a BPE tokenizer, Markdown syntax costs tokens the plain text does not.
+
+    TOKEN = re.compile(r'\w+|\s+|[^\w\s]')
+
+    def __init__(self):
+        self.ids = {}
+        self.tokens = []
+
+    def encode(self, text):
+        ids = []
+        for token in self.TOKEN.findall(text):
+            if token not in self.ids:
+                self.ids[token] = len(self.tokens)
+                self.tokens.append(token)
+            ids.append(self.ids[token])
+        return ids
+
+    def decode(self, ids, skip_special_tokens=False):
+        if hasattr(ids, 'tolist'):
+            ids = ids.tolist()
+        return "".join(self.tokens[index] for index in ids)
+
+
+def generate(html_content, markdown_content):
+    # Feeds markdown_content to a guard one token at a time, as generate
+    # would, and returns the guard's result.
+    tokenizer = WordTokenizer()
+    ids = tokenizer.encode(markdown_content)
+    guard = DegenerationGuard(tokenizer, 0, 10 * len(ids) + 1000, [html_content])
+    for length in range(1, len(ids) + 1):
+        if guard(torch.tensor([ids[:length]]))[0]:
+            break
+    return guard.result(0)
+
+
+def table_page(rows):
+    cells = "".join(f"<tr><td>{index}</td><td>item{index}</td><td>{index * 7 % 100}</td></tr>"
+                    for index in range(rows))
+    return f"<html><body><table><tr><th>id</th><th>name</th><th>stock</th></tr>{cells}</table></body></html>"
+
+
+def table_markdown(rows):
+    lines = ["| id  | name     | stock |", "| --- | -------- | ----- |"]
+    lines.extend(f"| {index:<3} | {'item%d' % index:<8} | {index * 7 % 100:<5} |" for index in range(rows))
+    return "\n".join(lines) + "\n"
+
+
+def image_page(images):
+    figures = "".join(
+        f'<figure><img src="/photos/{index}.jpg" alt="A photo of exhibit {index} in the north hall" '
+        f'title="Exhibit {index}"><figcaption>Exhibit {index}</figcaption></figure>'
+        for index in range(images))
+    return f"<html><body><h1>Gallery</h1>{figures}</body></html>"
+
+
+def image_markdown(images):
+    return "# Gallery\n\n" + "".join(
+        f'![A photo of exhibit {index} in the north hall](/photos/{index}.jpg "Exhibit {index}")\n\n'
+        f'Exhibit {index}\n\n'
+        for index in range(images))
+
+
+def test_table_heavy_output_is_not_stopped_for_length():
+    result = generate(table_page(200), table_markdown(200))
+    assert result['reason'] not in DEGENERATE_REASONS
+
+
+def test_image_heavy_output_is_not_stopped_for_length():
+    result = generate(image_page(50), image_markdown(50))
+    assert result['reason'] not in DEGENERATE_REASONS
+
+
+def test_profile_covers_the_rule_based_rendering():
+    tokenizer = WordTokenizer()
+    for html_content in (table_page(200), image_page(50)):
+        content_tokens, _ = document_profile(tokenizer, html_content)
+        assert content_tokens >= len(tokenizer.encode(markdown_from_html(html_content)))
+
+
+def test_runaway_output_is_stopped_for_length():
+    html_content = "<html><body><p>A short paragraph.</p></body></html>"
+    result = generate(html_content, "A short paragraph.\n\n" + " ".join(f"word{index}" for index in range(2000)))
+    assert result['reason'] == 'length'
@@ -0,0 +1,277 @@
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import sys
+import threading
+import time
+from collections import namedtuple
+
+# Watches a directory tree for new or changed HTML files. On Linux the
+# kernel reports changes through inotify (bound with ctypes, no extra
+# dependency) and an idle watcher sleeps in select(); elsewhere, or when
+# inotify is unavailable, the tree is rescanned every poll_interval seconds.
+# A file is reported once it has had no events and kept the same size and
+# mtime for `settle` seconds, so half-written files are not picked up.
+
+HTML_EXTENSIONS = ('.html', '.htm')
+DEFAULT_SETTLE_SECONDS = 1.0
+DEFAULT_POLL_INTERVAL = 2.0
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE_SELF
+EVENT_HEADER = struct.Struct('iIII')
+
+# path and the time.time() of the first event that was seen for it.
+Change = namedtuple('Change', ['path', 'detected'])
+
+
+def is_html(path):
+    name = os.path.basename(path)
+    return not name.startswith('.') and name.lower().endswith(HTML_EXTENSIONS)
+
+
+def signature(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def scan(directory, recursive=True):
+    # {path: signature} of the HTML files below directory.
+    found = {}
+    try:
+        entries = list(os.scandir(directory))
+    except OSError:
+        return found
+    for entry in entries:
+        if entry.is_dir(follow_symlinks=False):
+            if recursive and not entry.name.startswith('.'):
+                found.update(scan(entry.path, recursive))
+        elif is_html(entry.path):
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            found[entry.path] = (stat.st_mtime_ns, stat.st_size)
+    return found
+
+
+def _libc():
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+    except OSError:
+        return None
+    return libc if hasattr(libc, 'inotify_init1') else None
+
+
+class InotifyBackend:
+    # wait(timeout) returns the HTML paths that had events, or None when the
+    # kernel queue overflowed and the tree has to be rescanned.
+
+    def __init__(self, directory, recursive=True):
+        self.libc = _libc()
+        if self.libc is None:
+            raise OSError(errno.ENOSYS, "inotify is not available")
+        self.recursive = recursive
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.directories = {}
+        self._wake_read, self._wake_write = os.pipe()
+        try:
+            self.addTree(directory)
+        except OSError:
+            self.close()
+            raise
+
+    def addWatch(self, directory):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK | IN_ONLYDIR)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"Cannot watch {directory}")
+        self.directories[wd] = directory
+
+    def addTree(self, directory):
+        self.addWatch(directory)
+        if not self.recursive:
+            return
+        for root, subdirectories, _ in os.walk(directory):
+            subdirectories[:] = [name for name in subdirectories if not name.startswith('.')]
+            for name in subdirectories:
+                try:
+                    self.addWatch(os.path.join(root, name))
+                except OSError as e:
+                    print(f"Not watching {os.path.join(root, name)}: {e}", file=sys.stderr)
+
+    def wait(self, timeout):
+        readable, _, _ = select.select([self.fd, self._wake_read], [], [], timeout)
+        if self._wake_read in readable:
+            os.read(self._wake_read, 512)
+        if self.fd not in readable:
+            return []
+        changed = []
+        overflow = False
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+                offset += EVENT_HEADER.size
+                name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+                offset += length
+                if mask & IN_Q_OVERFLOW:
+                    overflow = True
+                    continue
+                if mask & (IN_IGNORED | IN_DELETE_SELF):
+                    self.directories.pop(wd, None)
+                    continue
+                directory = self.directories.get(wd)
+                if directory is None or not name:
+                    continue
+                path = os.path.join(directory, name)
+                if mask & IN_ISDIR:
+                    if self.recursive and mask & (IN_CREATE | IN_MOVED_TO) and not name.startswith('.'):
+                        # Files can land before the watch exists, so a new
+                        # directory's contents are reported as changed.
+                        try:
+                            self.addTree(path)
+                        except OSError:
+                            continue
+                        changed.extend(scan(path))
+                elif is_html(path):
+                    changed.append(path)
+        return None if overflow else changed
+
+    def wake(self):
+        os.write(self._wake_write, b'x')
+
+    def close(self):
+        for fd in (self.fd, self._wake_read, self._wake_write):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+
+class PollingBackend:
+    # Rescans the tree every interval seconds; the stop event ends a wait
+    # early.
+
+    def __init__(self, directory, recursive=True, interval=DEFAULT_POLL_INTERVAL):
+        self.directory = directory
+        self.recursive = recursive
+        self.interval = interval
+        self.known = scan(directory, recursive)
+        self._wake = threading.Event()
+
+    def wait(self, timeout):
+        self._wake.wait(self.interval if timeout is None else min(timeout, self.interval))
+        self._wake.clear()
+        current = scan(self.directory, self.recursive)
+        changed = [path for path, stat in current.items() if self.known.get(path) != stat]
+        self.known = current
+        return changed
+
+    def wake(self):
+        self._wake.set()
+
+    def close(self):
+        pass
+
+
+class DirectoryWatcher:
+    # Calls on_ready(changes), a list of Change, from the watcher thread
+    # whenever files have settled. Files already present when the watcher
+    # starts are not reported. mode is 'inotify' or 'polling'.
+
+    def __init__(self, directory, on_ready, settle=DEFAULT_SETTLE_SECONDS, recursive=True, polling=False,
+                 poll_interval=DEFAULT_POLL_INTERVAL):
+        self.directory = os.path.abspath(directory)
+        self.on_ready = on_ready
+        self.settle = settle
+        self.recursive = recursive
+        self.known = scan(self.directory, recursive)
+        self.pending = {}
+        self.backend = None
+        if not polling:
+            try:
+                self.backend = InotifyBackend(self.directory, recursive)
+            except OSError as e:
+                if sys.platform.startswith('linux'):
+                    print(f"inotify unavailable ({e}); polling {self.directory} instead", file=sys.stderr)
+        if self.backend is None:
+            self.backend = PollingBackend(self.directory, recursive, poll_interval)
+        self.mode = 'inotify' if isinstance(self.backend, InotifyBackend) else 'polling'
+        self._stopping = False
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, name='directory-watcher', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        self._stopping = True
+        self.backend.wake()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def run(self):
+        try:
+            while not self._stopping:
+                changed = self.backend.wait(self.nextTimeout())
+                if changed is None:
+                    changed = [path for path, stat in scan(self.directory, self.recursive).items()
+                               if self.known.get(path) != stat]
+                now = time.time()
+                for path in changed:
+                    self.touch(path, now)
+                ready = self.settled(now)
+                if ready and not self._stopping:
+                    self.on_ready(ready)
+        finally:
+            self.backend.close()
+
+    def touch(self, path, now):
+        detected = self.pending[path][2] if path in self.pending else now
+        self.pending[path] = (now + self.settle, signature(path), detected)
+
+    def nextTimeout(self):
+        # None (block until an event) when nothing is waiting to settle.
+        if not self.pending:
+            return None
+        return max(0.0, min(deadline for deadline, _, _ in self.pending.values()) - time.time())
+
+    def settled(self, now):
+        ready = []
+        for path, (deadline, stat, detected) in list(self.pending.items()):
+            if deadline > now:
+                continue
+            current = signature(path)
+            if current is None:
+                del self.pending[path]
+            elif current != stat:
+                self.pending[path] = (now + self.settle, current, detected)
+            else:
+                del self.pending[path]
+                if self.known.get(path) != current:
+                    self.known[path] = current
+                    ready.append(Change(path, detected))
+        return ready